@@ -0,0 +1,174 @@
+#!/usr/bin/env python2
+"""
+Non-blocking ROS service calls for mission states.
+
+Mission states are stepped from the commander thread, so a blocking service call (plus the sleep that usually
+follows it) stalls the whole commander. Instead a state submits the call to a small pool of worker threads and gets a
+Service_future back, which it checks on later ticks. Each call has its own timeout and retry policy - retries are
+scheduled on the deadline scheduler so that no worker sleeps between attempts.
+"""
+
+from __future__ import division
+
+from threading import Lock, Thread
+
+try:
+    from Queue import Queue
+except ImportError:  # python 3
+    from queue import Queue
+
+import rospy
+
+from deadline_scheduler import get_default_scheduler, monotonic
+
+
+class Service_future(object):
+    """
+    The pending result of an asynchronous service call
+    """
+
+    PENDING, SUCCEEDED, FAILED, CANCELLED = 'pending', 'succeeded', 'failed', 'cancelled'
+
+    def __init__(self, name, proxy, args, timeout, retries, retry_delay, check):
+        self.name = name
+        self.proxy = proxy
+        self.args = args
+        self.timeout = timeout
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.check = check
+
+        self.status = Service_future.PENDING
+        self.response = None
+        self.error = None
+        self.attempts = 0
+        self.submitted_at = monotonic()
+        self.done_at = None
+        self._lock = Lock()
+        self._failed_attempt = 0
+
+    @property
+    def done(self):
+        return self.status != Service_future.PENDING
+
+    @property
+    def succeeded(self):
+        return self.status == Service_future.SUCCEEDED
+
+    def age(self):
+        """ seconds since the call was submitted """
+        return monotonic() - self.submitted_at
+
+    def since_done(self):
+        """ seconds since the call finished (None if it is still pending) """
+        if self.done_at is None:
+            return None
+        return monotonic() - self.done_at
+
+    def cancel(self):
+        """ a cancelled call is not retried and its response (if any) is discarded """
+        return self._finish(Service_future.CANCELLED, error='cancelled')
+
+    def _finish(self, status, response=None, error=None, attempt=None):
+        with self._lock:
+            # ignore late responses from an attempt that has already timed out (or a cancelled call)
+            if self.done or (attempt is not None and attempt != self.attempts):
+                return False
+            self.status = status
+            self.response = response
+            self.error = error
+            self.done_at = monotonic()
+            return True
+
+    def __repr__(self):
+        return 'Service_future({}, {}, attempts={})'.format(self.name, self.status, self.attempts)
+
+
+class Async_service_caller(object):
+    """
+    A pool of worker threads that make service calls on behalf of the commander thread
+    """
+
+    def __init__(self, workers=2, scheduler=None, name='async_service'):
+        self.name = name
+        self.scheduler = scheduler if scheduler is not None else get_default_scheduler()
+        self._queue = Queue()
+        self._workers = []
+        for i in range(workers):
+            worker = Thread(target=self._worker, name='{}_{}'.format(name, i))
+            worker.daemon = True
+            worker.start()
+            self._workers.append(worker)
+
+    def submit(self, proxy, args=(), timeout=5.0, retries=0, retry_delay=0.5, check=None, name=None):
+        """
+        Calls proxy(*args) on a worker thread and returns a Service_future.
+
+        timeout: seconds each attempt may take before it is abandoned
+        retries: how many more attempts are made after a failure (an exception, a timeout or check(response) False)
+        check: optional function of the response that returns True if the call achieved what was asked of it
+        """
+        future = Service_future(name or getattr(proxy, 'resolved_name', repr(proxy)), proxy, tuple(args), timeout,
+                                retries, retry_delay, check)
+        self._start_attempt(future)
+        return future
+
+    def _start_attempt(self, future):
+        with future._lock:
+            if future.done:
+                return
+            future.attempts += 1
+            attempt = future.attempts
+        timeout_handle = None
+        if future.timeout is not None:
+            timeout_handle = self.scheduler.call_later(future.timeout, self._attempt_failed, future, attempt,
+                                                       'timed out after {}s'.format(future.timeout),
+                                                       name='service_timeout')
+        # each attempt carries its own timeout - a late response must not cancel a later attempt's timeout
+        self._queue.put((future, attempt, timeout_handle))
+
+    def _attempt_failed(self, future, attempt, error, response=None):
+        with future._lock:
+            # an attempt can fail twice - by timing out and then by its late response
+            if future.done or attempt != future.attempts or attempt == future._failed_attempt:
+                return
+            future._failed_attempt = attempt
+        if attempt <= future.retries:
+            rospy.logwarn('{} attempt {} failed ({}) - retrying'.format(future.name, attempt, error))
+            self.scheduler.call_later(future.retry_delay, self._start_attempt, future, name='service_retry')
+        else:
+            if future._finish(Service_future.FAILED, response=response, error=error, attempt=attempt):
+                rospy.logwarn('{} failed after {} attempts: {}'.format(future.name, attempt, error))
+
+    def _worker(self):
+        while True:
+            future, attempt, timeout_handle = self._queue.get()
+            if future.done or attempt != future.attempts:
+                continue
+            try:
+                response = future.proxy(*future.args)
+            except Exception as e:
+                self.scheduler.cancel(timeout_handle)
+                self._attempt_failed(future, attempt, e)
+                continue
+
+            self.scheduler.cancel(timeout_handle)
+            if future.check is not None and not future.check(response):
+                self._attempt_failed(future, attempt, 'rejected', response=response)
+            else:
+                future._finish(Service_future.SUCCEEDED, response=response, attempt=attempt)
+
+
+_default_service_caller = None
+_default_service_caller_lock = Lock()
+
+
+def get_default_service_caller():
+    """
+    Returns the process wide Async_service_caller shared by all mission states
+    """
+    global _default_service_caller
+    with _default_service_caller_lock:
+        if _default_service_caller is None:
+            _default_service_caller = Async_service_caller()
+        return _default_service_caller
@@ -0,0 +1,56 @@
+#!/usr/bin/env python2
+"""
+Microbenchmark comparing the previous waypoint acceptance check (numpy arrays, np.linalg.norm and round for the
+distance, np.pi / abs / min for the heading) with the scalar squared-distance check in waypoint_acceptance, and the
+batched check of many waypoints against one pose with a python loop over the scalar check.
+
+usage: python benchmarks/acceptance_benchmark.py
+"""
+from __future__ import division, print_function
+
+import os
+import sys
+import timeit
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from waypoint_acceptance import within_tolerance, Waypoint_acceptance_batch
+
+N_CHECKS = 100000
+N_WAYPOINTS = 1000
+TOL_DISTANCE = 0.2
+TOL_HEADING_RAD = np.deg2rad(5)
+
+
+def previous_waypoint_reached(x, y, z, yaw, tgt_x, tgt_y, tgt_z, tgt_yaw):
+    a = np.array((tgt_x, tgt_y, tgt_z))
+    b = np.array((x, y, z))
+    distance = np.linalg.norm(a - b).round(decimals=3)
+    heading_error = min((2 * np.pi) - abs(yaw - tgt_yaw), abs(yaw - tgt_yaw))
+    return distance < TOL_DISTANCE and heading_error < TOL_HEADING_RAD
+
+
+if __name__ == '__main__':
+
+    pose = (1.05, 2.0, 3.0, 0.01)
+    target = (1.0, 2.0, 3.0, 0.0)
+
+    before = timeit.timeit(lambda: previous_waypoint_reached(*(pose + target)), number=N_CHECKS)
+    after = timeit.timeit(lambda: within_tolerance(*(pose + target + (TOL_DISTANCE, TOL_HEADING_RAD))),
+                          number=N_CHECKS)
+    print('single waypoint:  before {:.2f}us  after {:.2f}us  ({:.1f}x)'.format(
+        before / N_CHECKS * 1e6, after / N_CHECKS * 1e6, before / after))
+
+    rng = np.random.RandomState(0)
+    targets = np.column_stack((rng.uniform(-50, 50, (N_WAYPOINTS, 3)), rng.uniform(-np.pi, np.pi, N_WAYPOINTS)))
+    target_list = [tuple(row) for row in targets]
+    batch = Waypoint_acceptance_batch(targets, TOL_DISTANCE, TOL_HEADING_RAD)
+
+    n_batches = N_CHECKS // N_WAYPOINTS
+    looped = timeit.timeit(lambda: [within_tolerance(*(pose + tgt + (TOL_DISTANCE, TOL_HEADING_RAD)))
+                                    for tgt in target_list], number=n_batches)
+    batched = timeit.timeit(lambda: batch.reached(*pose), number=n_batches)
+    print('{} waypoints:  loop {:.1f}us  batch {:.1f}us  ({:.1f}x)'.format(
+        N_WAYPOINTS, looped / n_batches * 1e6, batched / n_batches * 1e6, looped / batched))
@@ -0,0 +1,66 @@
+#!/usr/bin/env python2
+"""
+Measures the CPU and memory cost per vehicle of hosting several vehicles in one process with Pyx4_fleet.
+
+Each vehicle runs an Idle_state mission (so nothing is armed) while the interface, commander and the shared setpoint
+loop run as normal. Requires a simulation that provides mavros in the namespaces <prefix>0 .. <prefix>N-1, e.g. the
+PX4 multi_uav_mavros_sitl launch file, and ROBOT_TYPE to be set.
+
+usage: for n in 1 4 16; do python benchmarks/fleet_benchmark.py --vehicles $n --duration 30; done
+"""
+from __future__ import division, print_function
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import rospy
+
+from mission_states import Idle_state
+from pyx4_fleet import Pyx4_fleet
+
+
+def rss_mb():
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) / 1024.0
+    return float('nan')
+
+
+def cpu_s():
+    times = os.times()
+    return times[0] + times[1]
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description="Per vehicle CPU and memory for a fleet hosted in one process")
+    parser.add_argument('--vehicles', type=int, default=1,
+                        help="number of vehicles - run the script once per fleet size so that memory isn't shared")
+    parser.add_argument('--prefix', type=str, default='uav')
+    parser.add_argument('--duration', type=float, default=30.0)
+    args = parser.parse_args(rospy.myargv(argv=sys.argv)[1:])
+
+    rospy.init_node('pyx4_fleet_benchmark', anonymous=True)
+    rss_before = rss_mb()
+
+    missions = dict(('{}{}'.format(args.prefix, i), {0: Idle_state(timeout=args.duration * 10)})
+                    for i in range(args.vehicles))
+    fleet = Pyx4_fleet(vehicle_missions=missions)
+
+    time.sleep(2.0)   # let the subscriptions settle
+    cpu_start = cpu_s()
+    wall_start = time.time()
+    time.sleep(args.duration)
+    cpu_used = cpu_s() - cpu_start
+    wall = time.time() - wall_start
+    rss_after = rss_mb()
+
+    print('vehicles: {}  cpu: {:.1f}% total, {:.2f}% per vehicle  rss: {:.1f} MB total, {:.1f} MB per vehicle'.format(
+        args.vehicles, 100 * cpu_used / wall, 100 * cpu_used / wall / args.vehicles,
+        rss_after, (rss_after - rss_before) / args.vehicles))
+    rospy.signal_shutdown('benchmark finished')
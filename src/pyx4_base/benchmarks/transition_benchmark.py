@@ -0,0 +1,81 @@
+#!/usr/bin/env python2
+"""
+Measures the instruction transition gap of the commander - the time from an instruction exiting (finishing or timing
+out) to the next instruction's setpoint being live - with and without prefetching the next instruction.
+
+A mission of short timeout waypoints is run by a Commander against a stand in for the mavros interface, so neither a
+simulation nor a roscore is needed.
+
+usage: python benchmarks/transition_benchmark.py --waypoints 20
+"""
+from __future__ import division, print_function
+
+import argparse
+import os
+import sys
+import time
+from threading import Thread
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from commander import Commander
+from deadline_scheduler import get_default_scheduler
+from mission_states import Waypoint_state
+from pyx4.msg import pyx4_state as Pyx4_msg
+from vehicle_state import Vehicle_state_buffer
+
+
+class Bench_interface(object):
+    """ the parts of Mavros_interface that the commander uses - the vehicle never moves """
+    recorder = None
+    mavros_ns = ''
+
+    def __init__(self):
+        self.vehicle_state_buffer = Vehicle_state_buffer()
+        self.scheduler = get_default_scheduler()
+
+    def read_vehicle_state(self, out):
+        return self.vehicle_state_buffer.read(out)
+
+    def require_topics(self, keys):
+        pass
+
+
+class Bench_parent(object):
+    def __init__(self):
+        self.pyx4_state_msg = Pyx4_msg()
+
+    def publish_pyx4_state(self):
+        pass
+
+
+def waypoints(n, timeout):
+    for idx in range(n):
+        yield Waypoint_state(state_label='waypoint_' + str(idx), waypoint_type='pos', xy_type='pos',
+                             x_setpoint=idx, y_setpoint=0.0, z_type='pos', z_setpoint=2.0, yaw_type='pos',
+                             yaw_setpoint=0.0, coordinate_frame=1, timeout=timeout)
+
+
+def run_mission(n, timeout, prefetch, event_driven):
+    commander = Commander(waypoints(n, timeout), Bench_interface(), commander_parent_ref=Bench_parent(),
+                          prefetch=prefetch, event_driven=event_driven)
+    thread = Thread(target=commander.run)
+    thread.daemon = True
+    thread.start()
+    while commander.mission_idx < n - 1:
+        time.sleep(timeout)
+    return commander.transition_gaps
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--waypoints', type=int, default=20)
+    parser.add_argument('--timeout', type=float, default=0.2, help="duration (s) of each waypoint")
+    args = parser.parse_args()
+
+    for event_driven in (False, True):
+        for prefetch in (False, True):
+            gaps = run_mission(args.waypoints, args.timeout, prefetch, event_driven)
+            print('{:12s} prefetch {:5s}: {}'.format('event driven' if event_driven else 'polling',
+                                                     str(prefetch), gaps))
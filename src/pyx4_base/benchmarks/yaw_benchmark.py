@@ -0,0 +1,88 @@
+#!/usr/bin/env python2
+"""
+Microbenchmark comparing the previous per-access yaw_local property (tf euler_from_quaternion on every read) with the
+yaw that is now derived once per pose message in Mavros_interface.local_position_callback.
+
+A Waypoint_state step reads the yaw about four times (sp_error_yaw plus the throttled log lines) so both variants are
+timed for one pose update followed by four reads.
+
+usage: python benchmarks/yaw_benchmark.py
+"""
+from __future__ import division, print_function
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from geometry_msgs.msg import PoseStamped
+from tf.transformations import euler_from_quaternion
+
+from utils import quaternion_to_yaw
+
+READS_PER_STEP = 4
+N_STEPS = 100000
+
+
+class Old_interface(object):
+    def __init__(self):
+        self.local_position = PoseStamped()
+
+    def local_position_callback(self, data):
+        self.local_position = data
+
+    @property
+    def yaw_local(self):
+        orientation_q = self.local_position.pose.orientation
+        (_, _, yaw) = euler_from_quaternion([orientation_q.x, orientation_q.y, orientation_q.z, orientation_q.w])
+        return yaw
+
+
+class New_interface(object):
+    def __init__(self):
+        self.local_position = PoseStamped()
+        self._yaw_local = 0.0
+
+    def local_position_callback(self, data):
+        self.local_position = data
+        q = data.pose.orientation
+        self._yaw_local = quaternion_to_yaw(q.x, q.y, q.z, q.w)
+
+    @property
+    def yaw_local(self):
+        return self._yaw_local
+
+
+def make_pose():
+    pose = PoseStamped()
+    # 30 degrees of yaw with 5 degrees of roll and 4 degrees of pitch, rounded to |q|^2 = 0.99996 so that the
+    # agreement check below also covers a quaternion that isn't exactly unit
+    pose.pose.orientation.x = 0.0331
+    pose.pose.orientation.y = 0.0450
+    pose.pose.orientation.z = 0.2569
+    pose.pose.orientation.w = 0.9648
+    return pose
+
+
+def step(interface, pose):
+    interface.local_position_callback(pose)
+    for _ in range(READS_PER_STEP):
+        interface.yaw_local
+
+
+if __name__ == '__main__':
+
+    pose = make_pose()
+    old_interface = Old_interface()
+    new_interface = New_interface()
+
+    step(old_interface, pose)
+    step(new_interface, pose)
+    assert abs(old_interface.yaw_local - new_interface.yaw_local) < 1e-9, 'yaw implementations disagree'
+
+    t_old = min(timeit.repeat(lambda: step(old_interface, pose), number=N_STEPS, repeat=3)) / N_STEPS
+    t_new = min(timeit.repeat(lambda: step(new_interface, pose), number=N_STEPS, repeat=3)) / N_STEPS
+
+    print('per step ({} yaw reads): old {:.2f} us, new {:.2f} us, saving {:.2f} us ({:.1f}x)'
+          .format(READS_PER_STEP, t_old * 1e6, t_new * 1e6, (t_old - t_new) * 1e6, t_old / t_new))
@@ -1,9 +1,20 @@
 #!/usr/bin/env python2
 
-from copy import copy
+from __future__ import division
+
+from threading import Condition, Lock, RLock
+import time
 import rospy
 import sys
 
+from diagnostic_msgs.msg import DiagnosticArray
+
+from vehicle_state import Vehicle_state
+from deadline_scheduler import monotonic
+from step_profiler import Step_profiler, Latency_histogram
+from instruction_source import Instruction_source
+from mission_states import Generic_mission_state, Hold_pos_state
+
 class Commander(object):
     """
     A module to control the transition between different mission states.
@@ -16,15 +27,30 @@ class Commander(object):
      1) once the current flight instruction requests this
      2) once the current flight instruction's timeout duration has expired
 
+    By default the commander polls the active instruction at ros_rate. An event driven commander (event_driven=True)
+    instead sleeps until something relevant happens - a vehicle state update (for instructions with
+    wake_on_telemetry), the instruction finishing or timing out, or the instruction's own step_rate - and loads the
+    next instruction as soon as the current one finishes. ros_rate is then the maximum step rate.
+
+    With prefetch the next instruction is prepared (validated and its setpoint worked out, see
+    Generic_mission_state.prepare) at the end of the tick that loads the current one, so that its setpoint is live
+    from the moment it is loaded. The time from an instruction exiting to the next setpoint being live is kept in
+    transition_gaps.
 
     """
 
     def __init__(self,
-                 flight_instructions,             # an indexed dictionary containing all the flight instructions
+                 flight_instructions,             # an indexed dictionary, or any iterable, of flight instructions
                  mavros_interface_node,           # an instance of a mavros interface node - our link to the FCU
                  ros_rate=50,                     # Frequency of our run method
                  commander_parent_ref=None,       # A reference to the calling node
                  start_authorised=True,
+                 event_driven=False,              # sleep until woken rather than polling at ros_rate
+                 idle_period=0.5,                 # longest (s) an event driven commander sleeps without being woken
+                 profile=False,                   # time step / precondition_check / transitions, see Step_profiler
+                 profile_publish_period=1.0,      # how often (s) the profile is published as diagnostics
+                 lookahead=2,                     # instructions materialised ahead of the active one
+                 prefetch=True,                   # prepare the next instruction while the current one runs
                  ):
 
         self.mavros_interface_node = mavros_interface_node
@@ -34,17 +60,55 @@ class Commander(object):
 
         self._node_alive = True
         self.mission_fail_state = False
-        self._flight_instructions = flight_instructions
+        # instructions are taken from the source as they are needed and released once completed
+        self._flight_instructions = Instruction_source.wrap(flight_instructions, lookahead)
+
+        # event driven wake ups - see wake and _wait_for_wake
+        self.event_driven = event_driven
+        self.idle_period = idle_period
+        self.scheduler = mavros_interface_node.scheduler
+        self._wake_condition = Condition(Lock())
+        self._wake_pending = False
+        self._telemetry_pending = False
+        self._wake_deadline = None
+        self._last_tick_time = 0.0
+
+        # optional timing instrumentation - published on ~commander_diagnostics and logged at shutdown
+        self.profiler = None
+        self._profile_logged = False
+        if profile:
+            self.profiler = Step_profiler(budget_s=1.0 / ros_rate)
+            self.profile_publish_period = profile_publish_period
+            mavros_ns = mavros_interface_node.mavros_ns
+            self.profile_pub = rospy.Publisher(
+                '~' + (mavros_ns.strip('/') + '/' if mavros_ns else '') + 'commander_diagnostics',
+                DiagnosticArray, queue_size=1)
+            self.scheduler.call_later(profile_publish_period, self.publish_profile, name='commander_profile')
+
+        self.prefetch = prefetch
+        self._prefetch_idx = None   # the active instruction, until the instruction after it has been prepared
+        self.transition_gaps = Latency_histogram()
+        self._exit_time = None      # when the previous instruction exited, until the next setpoint is live
+
+        # one coherent copy of the vehicle state per tick, shared with the active flight instruction
+        self.vehicle_state = Vehicle_state()
+        self.mavros_interface_node.read_vehicle_state(self.vehicle_state)
 
         # self.validate_flight_instructions()
         self._mission_idx = 0
 
         self._flight_instruction = self._flight_instructions[self._mission_idx]
-        # initialise waypoint timer
-        self.wpt_timer = rospy.Timer(rospy.Duration(self._flight_instruction.timeout), self.waypoint_timeout_callback)
+        # instruction timeouts run on the deadline scheduler - the transition lock serialises them with mission
+        # increments so that a timeout can only ever apply to the instruction it was started for
+        self._transition_lock = RLock()
+        self.wpt_timer = None
         self.waypoint_timeout_flag = False
+        self._timeout_time = None
         self.load_flight_instruction(increment_mission=False)
 
+        if event_driven:
+            mavros_interface_node.vehicle_state_buffer.add_commit_listener(self._vehicle_state_committed)
+
 
     @property
     def sp_raw(self):
@@ -55,10 +119,22 @@ class Commander(object):
         return self._flight_instruction.sp_raw
 
 
+    @property
+    def setpoint_snapshot(self):
+        """ The last committed setpoint as an immutable tuple, see Generic_mission_state.commit_setpoint """
+        return self._flight_instruction.setpoint_snapshot
+
+
+    @property
+    def setpoint_streaming(self):
+        """ True while the active instruction streams a trajectory, see Generic_mission_state.trajectory """
+        return self._flight_instruction.setpoint_streaming
+
+
     @property
     def mission_count(self):
         """
-        How many instructions in out instruction list?
+        How many instructions in out instruction list? (for a streamed mission - how many have been seen so far)
         :return:
        """
         return len(self._flight_instructions)
@@ -70,7 +146,7 @@ class Commander(object):
         checks if we are in the last command in our flight_instructions list
         :return:
         '''
-        return (self.mission_idx >= (self.mission_count - 1))
+        return self._flight_instructions.is_last(self.mission_idx)
 
 
     @property
@@ -83,19 +159,114 @@ class Commander(object):
         self._mission_idx = idx
 
 
+    @staticmethod
+    def validate_instructions(instructions):
+        """
+        returns the instructions as a list, prepared (see Generic_mission_state.prepare) so that a malformed instruction
+        is rejected before the mission is changed - raises TypeError if any of them isn't a mission state and
+        ValueError if any of them can't be prepared
+        """
+        instructions = list(instructions)
+        for idx, instruction in enumerate(instructions):
+            if not isinstance(instruction, Generic_mission_state):
+                raise TypeError('{} is not a mission state'.format(instruction))
+            try:
+                instruction.prepare()
+            except Exception as e:
+                raise ValueError('instruction {} ({}) is invalid: {!r}'.format(
+                    idx, instruction.flight_instruction_type, e))
+        return instructions
+
+
+    def append_instructions(self, instructions):
+        """
+        Adds instructions to the end of a running mission
+        """
+        instructions = self.validate_instructions(instructions)
+        with self._transition_lock:
+            self._flight_instructions.append(instructions)
+        rospy.loginfo('appended {} instructions to the mission'.format(len(instructions)))
+
+
+    def insert_instructions(self, idx, instructions):
+        """
+        Inserts instructions before instruction idx - only instructions after the active one can be changed
+        """
+        instructions = self.validate_instructions(instructions)
+        with self._transition_lock:
+            if idx <= self.mission_idx:
+                raise ValueError("can't insert at {} - the mission is already at instruction {}".format(
+                    idx, self.mission_idx))
+            self._flight_instructions.insert(idx, instructions)
+        rospy.loginfo('inserted {} instructions at {}'.format(len(instructions), idx))
+
+
+    def replace_instructions(self, instructions, from_idx=None):
+        """
+        Replaces the rest of the mission from instruction from_idx (default: everything after the active instruction)
+        """
+        instructions = self.validate_instructions(instructions)
+        with self._transition_lock:
+            if from_idx is None:
+                from_idx = self.mission_idx + 1
+            elif from_idx <= self.mission_idx:
+                raise ValueError("can't replace from {} - the mission is already at instruction {}".format(
+                    from_idx, self.mission_idx))
+            self._flight_instructions.replace_from(from_idx, instructions)
+        rospy.loginfo('replaced the mission from instruction {} with {} instructions'.format(
+            from_idx, len(instructions)))
+
+
     def load_flight_instruction(self, increment_mission=True):
+        with self._transition_lock:
+            if self.profiler is None:
+                self._load_flight_instruction(increment_mission)
+            else:
+                t_start = monotonic()
+                self._load_flight_instruction(increment_mission)
+                self.profiler.record(self._flight_instruction.flight_instruction_type, 'load_flight_instruction',
+                                     monotonic() - t_start)
+
+
+    def _load_flight_instruction(self, increment_mission):
 
         rospy.loginfo(('Attempting to load flight instruction'))
         if not self.end_of_flight_instructions:
 
-            # todo - race condition with timeout being set while mission incremented, could this result in  a dble inc?
+            previous_instruction = self._flight_instruction
+            if increment_mission:
+                exit_time = previous_instruction.exit_time if not previous_instruction.stay_alive else None
+                self._exit_time = exit_time or self._timeout_time or monotonic()
+
             self.stop_waypoint_timeout()
+            previous_instruction.cancel_timers()
 
-            current_setpoint_raw = copy(self._flight_instruction.sp_raw)
-            if increment_mission:
-                self.mission_idx += 1
+            current_setpoint_raw = previous_instruction.setpoint_message()
+            next_idx = self.mission_idx + 1 if increment_mission else self.mission_idx
+            instruction = self._flight_instructions[next_idx]
+            if not instruction.prepared:
+                try:
+                    instruction.prepare()
+                except Exception as e:
+                    # hold position for as long as the instruction would have run rather than failing the mission
+                    rospy.logerr('invalid flight instruction {}: {!r} - holding position in its place'.format(
+                        next_idx, e))
+                    instruction = self._hold_in_place_of(instruction)
+
+            # start the new instruction before the setpoint publisher can see it - its prepared setpoint (or the
+            # previous setpoint) is then published from the moment it becomes active
+            instruction._wake_commander = self.wake
+            instruction.pre_run(parent_ref=self.commander_parent_ref,
+                                ros_message_node=self.mavros_interface_node,
+                                current_sp_raw=current_setpoint_raw,
+                                vehicle_state=self.vehicle_state)
+            self.mission_idx = next_idx
+            self._flight_instruction = instruction
+            if instruction._sp_template is not None:
+                self._setpoint_live()
 
-            self._flight_instruction = self._flight_instructions[self.mission_idx]
+            self.start_waypoint_timeout()
+            self.mavros_interface_node.require_topics(getattr(self._flight_instruction, 'required_topics', ()))
 
             # give status update
             rospy.loginfo(('Starting mission instruction {} with idx {} and timeout {} '.format(
@@ -103,29 +274,78 @@ class Commander(object):
             # rospy.loginfo(('Mission state sp: \n \n  {} '.format(self._flight_instruction.sp_raw)))
             rospy.loginfo(('State label: {}'.format(self._flight_instruction.state_label)))
 
-            # start new flight instruction
-            self._flight_instruction.pre_run(parent_ref=self.commander_parent_ref,
-                                             ros_message_node=self.mavros_interface_node,
-                                             current_sp_raw=current_setpoint_raw)
-
-            self.start_waypoint_timeout()
-
             # shutdown old instruction
             if increment_mission:
                 try:
-                    self._flight_instructions[self.mission_idx - 1].node_alive = False
+                    previous_instruction.node_alive = False
                 except AttributeError as e:
                     rospy.logwarn(e)
+                self._flight_instructions.release(self.mission_idx - 1)
+
+            recorder = self.mavros_interface_node.recorder
+            if recorder is not None:
+                recorder.add_channel(self.mavros_interface_node.recorder_channel_name('transitions'),
+                                     ('mission_idx', 'flight_instruction_type', 'state_label')).append(
+                    (rospy.get_time(), self.mission_idx,
+                     recorder.label_code(self._flight_instruction.flight_instruction_type),
+                     recorder.label_code(self._flight_instruction.state_label)))
 
             # publish mission in pyx4_state ROS msg
             self.commander_parent_ref.pyx4_state_msg.flight_state = self._flight_instruction.flight_instruction_type
             self.commander_parent_ref.pyx4_state_msg.state_label = self._flight_instruction.state_label
             self.commander_parent_ref.publish_pyx4_state()
 
+            if self.prefetch:
+                self._prefetch_idx = self.mission_idx
+
         else:
             rospy.logerr('cant increment mission, at final instruction')
 
 
+    def _hold_in_place_of(self, instruction):
+        """ a position hold that takes the place (and timeout) of an instruction that couldn't be prepared """
+        hold = Hold_pos_state(state_label='hold - {} is invalid'.format(instruction.state_label),
+                              yaw_setpoint=self.vehicle_state.yaw,
+                              timeout=instruction.timeout)
+        hold.prepare()
+        return hold
+
+
+    def _prefetch_next(self):
+        """
+        Prepares the instruction after the active one, once per instruction - runs on the commander thread between
+        ticks (the only thread that changes mission_idx) and without the transition lock, so that mission updates,
+        timeouts and the scheduler thread don't wait for it
+        """
+        mission_idx = self._prefetch_idx
+        self._prefetch_idx = None
+        if mission_idx != self.mission_idx or self._flight_instructions.is_last(mission_idx):
+            return
+        try:
+            instruction = self._flight_instructions[mission_idx + 1]
+        except IndexError:      # the rest of the mission was replaced by an empty update
+            return
+        if instruction.prepared:
+            return
+        try:
+            instruction.prepare()
+        except Exception as e:
+            # reported now rather than when the mission gets there - the mission can still be updated
+            rospy.logerr('flight instruction {} is invalid: {!r}'.format(mission_idx + 1, e))
+
+
+    def _setpoint_live(self):
+        """ records the gap between the previous instruction exiting and the active instruction's setpoint """
+        if self._exit_time is None:
+            return
+        gap = monotonic() - self._exit_time
+        self._exit_time = None
+        self.transition_gaps.add(gap)
+        if self.profiler is not None:
+            self.profiler.record(self._flight_instruction.flight_instruction_type, 'transition_gap', gap)
+        rospy.logdebug('transition to instruction {} took {:.3f}ms'.format(self.mission_idx, gap * 1e3))
+
+
     def run(self):
 
         rate = rospy.Rate(self._ros_rate)
@@ -139,90 +359,221 @@ class Commander(object):
 
             if not self.mission_fail_state:
 
-                if not self.end_of_flight_instructions:
-                    # if our mission index is incremented - handled here if wpt, hold or timeout, elsewhere if another mission type
-                    # usually this means the pyx4_base class has been inherited by another class
+                self.tick()
 
-                    # rospy.logwarn_throttle(1, ('commander heartbeat. In state {} which is mission idx {}'.format(self._flight_instruction.flight_instruction_type, self.mission_idx)))
-                    # if self.mission_idx > self.mission_idx_previous:
-                    if self._flight_instruction.stay_alive == False:
-                        self.load_flight_instruction(increment_mission=True)
+                if self.event_driven:
+                    # an instruction that has just finished or timed out is replaced straight away
+                    if not self.transition_due:
+                        self._wait_for_wake()
 
-                    # if time out then increment mission
-                    if self.waypoint_timeout_flag:
+                else:
+                    # prevent garbage in console output when thread is killed
+                    try:
+                        rate.sleep()
+                    except rospy.ROSInterruptException:
+                        pass
 
-                        # todo - requirement here is to shut nodes down if they didn't succeed - sometimes this could be
-                        #  due to timing out but sometimes timing out is OK
-                        if not self._flight_instruction.timeout_OK:
-                            rospy.logerr("couldn't initialise state {}".format(self._flight_instruction.flight_instruction_type))
-                            self.shut_node_down()
+            else:
+                rospy.logerr('mission fail state reported - exit offboard mode')
+                # todo - might be better to try and send zero setpoints in this state
+                self.shut_node_down()
 
-                        rospy.logwarn(('time out of state ' + str(self._flight_instruction.state_label) +
-                                       ', of type ' + str(self._flight_instruction.flight_instruction_type)))
+        self.shut_node_down()
 
-                        self.load_flight_instruction(increment_mission=True)
 
+    def tick(self):
+        """
+        One pass of the commander - handles instruction transitions then steps the active instruction
+        """
+        self._last_tick_time = monotonic()
+        self.mavros_interface_node.read_vehicle_state(self.vehicle_state)
+
+        with self._transition_lock:
+            self._handle_transitions()
+
+        # if the mission_state has finished its previous iteration, then start next iteration
+        if not self._flight_instruction.mission_state_busy:
+
+            if self._flight_instruction.preconditions_satisfied:
+                self._run_phase('step')
+                self._setpoint_live()
+                # switch to the next instruction on the tick that this one exits, rather than the next tick
+                if not self._flight_instruction.stay_alive:
+                    with self._transition_lock:
+                        self._handle_transitions()
+            else:
+                if self._flight_instruction._prerun_complete:
+                    rospy.loginfo('running precondition_check ')
+                    self._run_phase('precondition_check')
+                    # don't wait for another wake up before the first step of the instruction
+                    if self.event_driven and self._flight_instruction.preconditions_satisfied:
+                        self._run_phase('step')
+                        self._setpoint_live()
                 else:
-                    rospy.loginfo_throttle(5, '[CMD] Mission finished, sending final instruction until shutdown')
-                    if self._flight_instruction.stay_alive:
-                        rospy.logwarn_throttle(10, ('[CMD] Final state satisfied - waiting for shutdown'))
-                        # if self.mavros_interface_node.extended_state.landed_state == ExtendedState.LANDED_STATE_ON_GROUND:
-                        # if self.mavros_interface_node.state.armed != State.armed:
-                    else:
-                        self.shut_node_down()
-
-                # if the mission_state has finished its previous iteration, then start next iteration
-                if not self._flight_instruction.mission_state_busy:
-
-                    if self._flight_instruction.preconditions_satisfied:
-                        self._flight_instruction.step()
-                    else:
-                        if self._flight_instruction._prerun_complete:
-                            rospy.loginfo('running precondition_check ')
-                            self._flight_instruction.precondition_check()
-                        else:
-                            rospy.logerr('prerun not completeted for {}'.format(self._flight_instruction.flight_instruction_type))
+                    rospy.logerr('prerun not completeted for {}'.format(self._flight_instruction.flight_instruction_type))
 
-                else:
-                    rospy.logdebug('mission state is busy - not polling')
+        else:
+            rospy.logdebug('mission state is busy - not polling')
 
-                # prevent garbage in console output when thread is killed
-                try:
-                    rate.sleep()
-                except rospy.ROSInterruptException:
-                    pass
+        if self._prefetch_idx is not None:
+            self._prefetch_next()
+
+        if self.profiler is not None:
+            self.profiler.record_tick(self._flight_instruction.flight_instruction_type,
+                                      monotonic() - self._last_tick_time)
+
+
+    def _run_phase(self, phase):
+        """
+        runs the active instruction's step or precondition_check, timing it if profiling is enabled - the setpoint it
+        leaves behind is then committed for the setpoint publisher
+        """
+        instruction = self._flight_instruction
+        if self.profiler is None:
+            getattr(instruction, phase)()
+        else:
+            t_start = monotonic()
+            getattr(instruction, phase)()
+            self.profiler.record(instruction.flight_instruction_type, phase, monotonic() - t_start)
+        instruction.commit_setpoint()
+
+
+    def publish_profile(self):
+        diagnostics = DiagnosticArray()
+        diagnostics.header.stamp = rospy.Time.now()
+        diagnostics.status = self.profiler.to_diagnostic_statuses(
+            hardware_id=self.mavros_interface_node.mavros_ns)
+        self.profile_pub.publish(diagnostics)
+        if self._node_alive:
+            self.scheduler.call_later(self.profile_publish_period, self.publish_profile, name='commander_profile')
+
+
+    def _handle_transitions(self):
+        if not self.end_of_flight_instructions:
+            # if our mission index is incremented - handled here if wpt, hold or timeout, elsewhere if another mission type
+            # usually this means the pyx4_base class has been inherited by another class
+
+            # rospy.logwarn_throttle(1, ('commander heartbeat. In state {} which is mission idx {}'.format(self._flight_instruction.flight_instruction_type, self.mission_idx)))
+            # if self.mission_idx > self.mission_idx_previous:
+            if self._flight_instruction.stay_alive == False:
+                self.load_flight_instruction(increment_mission=True)
 
+            # if time out then increment mission
+            if self.waypoint_timeout_flag:
+
+                # todo - requirement here is to shut nodes down if they didn't succeed - sometimes this could be
+                #  due to timing out but sometimes timing out is OK
+                if not self._flight_instruction.timeout_OK:
+                    rospy.logerr("couldn't initialise state {}".format(self._flight_instruction.flight_instruction_type))
+                    self.shut_node_down()
+
+                rospy.logwarn(('time out of state ' + str(self._flight_instruction.state_label) +
+                               ', of type ' + str(self._flight_instruction.flight_instruction_type)))
+
+                self.load_flight_instruction(increment_mission=True)
+
+        else:
+            rospy.loginfo_throttle(5, '[CMD] Mission finished, sending final instruction until shutdown')
+            if self._flight_instruction.stay_alive:
+                rospy.logwarn_throttle(10, ('[CMD] Final state satisfied - waiting for shutdown'))
+                # if self.mavros_interface_node.extended_state.landed_state == ExtendedState.LANDED_STATE_ON_GROUND:
+                # if self.mavros_interface_node.state.armed != State.armed:
             else:
-                rospy.logerr('mission fail state reported - exit offboard mode')
-                # todo - might be better to try and send zero setpoints in this state
                 self.shut_node_down()
 
-        self.shut_node_down()
+
+    @property
+    def transition_due(self):
+        """ True if the active instruction has finished, timed out or failed """
+        return (not self._flight_instruction.stay_alive and not self.end_of_flight_instructions) or \
+            self.waypoint_timeout_flag or self.mission_fail_state
+
+
+    def wake(self):
+        """
+        Wakes an event driven commander, e.g. when an instruction finishes or times out
+        """
+        with self._wake_condition:
+            self._wake_pending = True
+            self._wake_condition.notify()
+
+
+    def _vehicle_state_committed(self, vehicle_state):
+        # called from the mavros callbacks - instructions that are still checking their preconditions always need
+        # telemetry
+        instruction = self._flight_instruction
+        if instruction.wake_on_telemetry or not instruction.preconditions_satisfied:
+            with self._wake_condition:
+                self._telemetry_pending = True
+                self._wake_condition.notify()
+
+
+    def _wait_for_wake(self):
+        """
+        Sleeps until the commander is woken, telemetry arrives (if the active instruction wants it) or the
+        instruction's step period (or idle_period) has passed
+        """
+        step_rate = self._flight_instruction.step_rate
+        period = 1.0 / step_rate if step_rate else self.idle_period
+        if self._wake_deadline is None:
+            self._wake_deadline = self.scheduler.call_later(period, self.wake, name='commander_wake')
+        else:
+            self.scheduler.rearm(self._wake_deadline, period)
+
+        with self._wake_condition:
+            while not (self._wake_pending or self._telemetry_pending) and self._node_alive:
+                # no timeout - a timed wait polls in python 2, the scheduler provides the periodic wake up instead
+                self._wake_condition.wait()
+            telemetry_only = not self._wake_pending
+            self._wake_pending = False
+            self._telemetry_pending = False
+
+        # telemetry arrives on several topics - don't step faster than ros_rate because of it
+        if telemetry_only:
+            remaining = self._last_tick_time + 1.0 / self._ros_rate - monotonic()
+            if remaining > 0:
+                time.sleep(remaining)
 
 
     def start_waypoint_timeout(self):
         try:
-            self.wpt_timer = rospy.Timer(rospy.Duration(self._flight_instruction.timeout), self.waypoint_timeout_callback)
+            self.wpt_timer = self.scheduler.call_later(self._flight_instruction.timeout,
+                                                       self.waypoint_timeout_callback, self.mission_idx,
+                                                       name='instruction_timeout')
         except AttributeError:
             rospy.logwarn('no timeout specified for this waypoint')
 
 
     def stop_waypoint_timeout(self):
-        self.wpt_timer.shutdown()  # shutdown previous timer to make sure this doesn't cause an early timeout
+        self.scheduler.cancel(self.wpt_timer)  # cancel the previous timeout to make sure this doesn't cause an early timeout
         self.waypoint_timeout_flag = False
+        self._timeout_time = None
 
 
-    def waypoint_timeout_callback(self, unused_but_required):
+    def waypoint_timeout_callback(self, mission_idx):
         '''
         we set this flag to true if a setpoint has not been reached after the specified duration (self.timeout_time)
         :return:
         '''
-        self.waypoint_timeout_flag = True
+        with self._transition_lock:
+            # the instruction may have finished while this callback was waiting for the lock
+            if mission_idx != self.mission_idx:
+                return
+            self.waypoint_timeout_flag = True
+            self._timeout_time = monotonic()
         rospy.loginfo('timer ending')
+        self.wake()
 
 
     def shut_node_down(self):
+        if not self._profile_logged:
+            self._profile_logged = True
+            if self.profiler is not None:
+                rospy.loginfo('Commander profile:\n' + self.profiler.summary())
+            if self.transition_gaps.count:
+                rospy.loginfo('Commander transition gaps: {}'.format(self.transition_gaps))
         self._node_alive = False
+        self.wake()
         rospy.logwarn('Commander - shutting down')
         # rospy.sleep(2.0)
         sys.exit()
@@ -11,9 +11,10 @@ import argparse
 import os, sys
 import rospy
 
-from generate_mission import Wpts_from_csv
+from generate_mission import Wpts_from_csv, Wpts_from_csv_stream
 from definitions_pyx4 import MISSION_SPECS
 from pyx4_base import Pyx4_base
+from flight_recorder import Flight_recorder
 
 
 if __name__ == '__main__':
@@ -23,6 +24,9 @@ if __name__ == '__main__':
     rospy.init_node(node_name, anonymous=True, log_level=rospy.DEBUG)
     parser = argparse.ArgumentParser(description="This node is a ROS side mavros based state machine.")
     parser.add_argument('--csv', type=str, default='big_square.csv')
+    parser.add_argument('--record_dir', type=str, default='', help="record the flight to this directory")
+    parser.add_argument('--stream', action='store_true', help="build the waypoints as they are reached")
+    parser.add_argument('--smooth', action='store_true', help="fly min jerk trajectories between the waypoints")
     args = parser.parse_args(rospy.myargv(argv=sys.argv)[1:])
 
     if os.path.isabs(args.csv):
@@ -35,7 +39,12 @@ if __name__ == '__main__':
     else:
         raise AttributeError('File {} not found'.format(mission_file))
 
-    flight_instructions = Wpts_from_csv(file_path=mission_file)
+    if args.stream:
+        flight_instructions = Wpts_from_csv_stream(file_path=mission_file, smooth=args.smooth)
+    else:
+        flight_instructions = Wpts_from_csv(file_path=mission_file, smooth=args.smooth)
+
+    recorder = Flight_recorder(args.record_dir) if args.record_dir else None
 
-    pyx4 = Pyx4_base(flight_instructions=flight_instructions)
+    pyx4 = Pyx4_base(flight_instructions=flight_instructions, recorder=recorder)
     pyx4.run()
@@ -0,0 +1,232 @@
+#!/usr/bin/env python2
+"""
+A single threaded deadline scheduler driven by a monotonic clock.
+
+Deadlines are kept in a heap and one background thread sleeps until the earliest of them is due, so any number of
+timeouts can be tracked without creating a thread (or rospy.Timer) for each one. Re-arming a deadline to a later time
+is O(1) - the heap entry is left in place and re-pushed with the new time when it comes due - which makes it cheap
+to push a deadline back every time a message arrives.
+"""
+
+from __future__ import division
+
+import ctypes
+import ctypes.util
+import heapq
+import itertools
+import os
+import sys
+import time
+from threading import Condition, Lock, Thread
+
+import rospy
+
+# from linux/time.h
+_CLOCK_MONOTONIC = 1
+
+
+class _Timespec(ctypes.Structure):
+    _fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+
+
+def _clock_gettime_monotonic():
+    """
+    Returns a monotonic() for python 2, where time.monotonic does not exist, that reads clock_gettime(CLOCK_MONOTONIC)
+    through ctypes - the clock that time.monotonic uses on Linux. Fails, and so stops the import, if the clock can't be
+    read
+    """
+    libc = ctypes.CDLL(ctypes.util.find_library('rt') or ctypes.util.find_library('c'), use_errno=True)
+    clock_gettime = libc.clock_gettime
+    clock_gettime.argtypes = (ctypes.c_int, ctypes.POINTER(_Timespec))
+    clock_gettime.restype = ctypes.c_int
+
+    def monotonic():
+        """ seconds on a clock that is not affected by changes to the system time """
+        # a timespec per call so that the clock can be read from any thread
+        ts = _Timespec()
+        if clock_gettime(_CLOCK_MONOTONIC, ctypes.byref(ts)) != 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+        return ts.tv_sec + ts.tv_nsec * 1e-9
+
+    monotonic()
+    return monotonic
+
+
+# deadlines, timeouts and loop periods must not move with the wall clock (NTP steps, a companion computer setting
+# its time once GPS is available), so wall time is never used as a fallback
+monotonic = getattr(time, 'monotonic', None) or _clock_gettime_monotonic()
+
+# Condition.wait(timeout) only times out on the monotonic clock from python 3.11 - python 2 polls against time.time and
+# earlier python 3 versions wait for a wall clock deadline, so a backward step of the system time stretches the wait
+_MONOTONIC_CONDITION_WAIT = sys.version_info >= (3, 11)
+_MAX_POLL_S = 0.05
+
+
+class Deadline(object):
+    """
+    Handle for a scheduled callback, returned by Deadline_scheduler.call_later / call_at
+    """
+
+    __slots__ = ('deadline', 'callback', 'args', 'name', 'cancelled', 'fired', '_heap_deadline')
+
+    def __init__(self, deadline, callback, args, name):
+        self.deadline = deadline
+        self.callback = callback
+        self.args = args
+        self.name = name
+        self.cancelled = False
+        self.fired = False
+        # deadline of this handle's entry in the heap - None when the handle is not in the heap
+        self._heap_deadline = None
+
+    @property
+    def active(self):
+        return not (self.cancelled or self.fired)
+
+    def remaining(self):
+        return self.deadline - monotonic()
+
+    def __repr__(self):
+        return 'Deadline({}, remaining={:.3f}, active={})'.format(self.name, self.remaining(), self.active)
+
+
+class Deadline_scheduler(object):
+    """
+    Runs callbacks at monotonic deadlines from a single background thread.
+
+    Callbacks are run one at a time on the scheduler thread and should be short - anything slow should be handed to
+    another thread.
+    """
+
+    def __init__(self, name='deadline_scheduler'):
+        self.name = name
+        self._heap = []
+        self._cond = Condition(Lock())
+        self._counter = itertools.count()
+        self._thread = None
+        self._alive = True
+        self._monotonic_wait = _MONOTONIC_CONDITION_WAIT
+        self._wakeups = 0
+
+    def _ensure_thread(self):
+        if self._thread is None:
+            self._thread = Thread(target=self._run, name=self.name)
+            self._thread.daemon = True
+            self._thread.start()
+
+    def _push(self, handle):
+        handle._heap_deadline = handle.deadline
+        heapq.heappush(self._heap, (handle.deadline, next(self._counter), handle))
+        # only wake the scheduler thread if the new deadline is now the earliest one
+        if self._heap[0][2] is handle:
+            self._wake()
+
+    def call_at(self, deadline, callback, *args, **kwargs):
+        handle = Deadline(deadline, callback, args, kwargs.get('name', getattr(callback, '__name__', 'deadline')))
+        with self._cond:
+            self._ensure_thread()
+            self._push(handle)
+        return handle
+
+    def call_later(self, delay, callback, *args, **kwargs):
+        return self.call_at(monotonic() + delay, callback, *args, **kwargs)
+
+    def rearm(self, handle, delay):
+        """
+        Moves a deadline to 'delay' seconds from now. Handles that have fired or been cancelled are scheduled again.
+        """
+        deadline = monotonic() + delay
+        with self._cond:
+            handle.deadline = deadline
+            handle.cancelled = False
+            handle.fired = False
+            # a later deadline is picked up when the existing heap entry comes due, an earlier one needs a new entry
+            if handle._heap_deadline is None or deadline < handle._heap_deadline:
+                self._push(handle)
+
+    def cancel(self, handle):
+        """ O(1) - the heap entry is discarded when it reaches the top of the heap """
+        if handle is not None:
+            handle.cancelled = True
+
+    def shutdown(self):
+        with self._cond:
+            self._alive = False
+            self._wake()
+
+    def __len__(self):
+        return len(self._heap)
+
+    def _wake(self):
+        self._wakeups += 1
+        self._cond.notify()
+
+    def _wait(self, timeout):
+        """
+        self._cond.wait(timeout) with the timeout measured on monotonic(). Where Condition.wait can't do that this polls
+        for a _wake() the way python 2's Condition.wait does, sleeping with time.sleep which doesn't follow the system
+        time. Called with self._cond held
+        """
+        if self._monotonic_wait:
+            self._cond.wait(timeout)
+            return
+        end = monotonic() + timeout
+        wakeups = self._wakeups
+        delay = 0.0005
+        while self._wakeups == wakeups:
+            remaining = end - monotonic()
+            if remaining <= 0:
+                return
+            delay = min(delay * 2, remaining, _MAX_POLL_S)
+            self._cond.release()
+            try:
+                time.sleep(delay)
+            finally:
+                self._cond.acquire()
+
+    def _run(self):
+        while self._alive and not rospy.is_shutdown():
+            with self._cond:
+                if not self._heap:
+                    self._wait(1.0)
+                    continue
+
+                heap_deadline, _, handle = self._heap[0]
+                now = monotonic()
+                if heap_deadline > now:
+                    self._wait(heap_deadline - now)
+                    continue
+
+                heapq.heappop(self._heap)
+                if handle._heap_deadline != heap_deadline:
+                    # superseded by an earlier entry for the same handle
+                    continue
+                handle._heap_deadline = None
+                if handle.cancelled:
+                    continue
+                if handle.deadline > now:
+                    # re-armed since this entry was pushed
+                    self._push(handle)
+                    continue
+                handle.fired = True
+
+            try:
+                handle.callback(*handle.args)
+            except Exception as e:
+                rospy.logerr('{}: callback {} raised {}'.format(self.name, handle.name, e))
+
+
+_default_scheduler = None
+_default_scheduler_lock = Lock()
+
+
+def get_default_scheduler():
+    """
+    Returns the process wide scheduler that is shared by all mavros interfaces and commanders
+    """
+    global _default_scheduler
+    with _default_scheduler_lock:
+        if _default_scheduler is None:
+            _default_scheduler = Deadline_scheduler()
+        return _default_scheduler
@@ -0,0 +1,187 @@
+#!/usr/bin/env python2
+"""
+Low overhead columnar flight recorder.
+
+Each channel (e.g. the vehicle state, the published setpoints, commander transitions) records rows of float64
+values into preallocated NumPy chunks. The hot paths only copy a row into the current chunk - full chunks are handed
+to a background thread which appends them to one binary file per channel and returns them to the pool, so memory
+stays bounded however long the flight is.
+
+The files are raw arrays described by a json sidecar and can be memory mapped with load_channel without reading the
+whole log into memory.
+"""
+
+from __future__ import division
+
+import json
+import os
+from collections import deque
+from threading import Lock, Thread
+
+try:
+    from Queue import Queue
+except ImportError:  # python 3
+    from queue import Queue
+
+import numpy as np
+import rospy
+
+
+class Recorder_channel(object):
+    """
+    A fixed pool of chunks for one channel - rows are dropped (and counted) if the writer thread falls behind
+    """
+
+    def __init__(self, recorder, name, fields, chunk_size, pool_size):
+        self.recorder = recorder
+        self.name = name
+        self.fields = ('t',) + tuple(fields)
+        self.dtype = np.dtype([(field, np.float64) for field in self.fields])
+        self.chunk_size = chunk_size
+
+        self._free = deque(np.zeros(chunk_size, dtype=self.dtype) for _ in range(pool_size))
+        self._chunk = self._free.popleft()
+        self._n = 0
+        self._lock = Lock()
+        self.rows = 0
+        self.dropped = 0
+
+    def append(self, row):
+        """
+        row is a tuple of (t, field values...) in the order of self.fields
+        """
+        with self._lock:
+            self._chunk[self._n] = row
+            self._n += 1
+            self.rows += 1
+            if self._n == self.chunk_size:
+                self._hand_off()
+
+    def _hand_off(self):
+        if self._free:
+            self.recorder._write_queue.put((self, self._chunk, self._n))
+            self._chunk = self._free.popleft()
+        else:
+            # writer is behind - overwrite the current chunk rather than growing
+            self.dropped += self._n
+        self._n = 0
+
+    def flush(self):
+        with self._lock:
+            if self._n:
+                self._hand_off()
+
+    def _release(self, chunk):
+        self._free.append(chunk)
+
+
+class Flight_recorder(object):
+    """
+    Records channels of timestamped rows into <log_dir>/<channel>.bin with a <channel>.json description
+    """
+
+    def __init__(self, log_dir, chunk_size=4096, pool_size=4):
+        self.log_dir = log_dir
+        self.chunk_size = chunk_size
+        self.pool_size = pool_size
+        if not os.path.isdir(log_dir):
+            os.makedirs(log_dir)
+
+        self.channels = {}
+        # string labels (e.g. state names) are recorded as integer codes
+        self.labels = {}
+        self._labels_lock = Lock()
+        self._labels_dirty = False
+
+        self._write_queue = Queue()
+        self._files = {}
+        self._alive = True
+        self._writer_thread = Thread(target=self._writer, name='flight_recorder')
+        self._writer_thread.daemon = True
+        self._writer_thread.start()
+
+    def add_channel(self, name, fields):
+        if name in self.channels:
+            return self.channels[name]
+        channel = Recorder_channel(self, name, fields, self.chunk_size, self.pool_size)
+        with open(os.path.join(self.log_dir, name + '.json'), 'w') as f:
+            json.dump({'fields': list(channel.fields), 'dtype': '<f8'}, f)
+        self.channels[name] = channel
+        return channel
+
+    def label_code(self, label):
+        """ returns a stable integer code for a string label """
+        code = self.labels.get(label)
+        if code is None:
+            with self._labels_lock:
+                code = self.labels.setdefault(label, len(self.labels))
+                self._labels_dirty = True
+        return code
+
+    def _write_labels(self):
+        with self._labels_lock:
+            labels = dict(self.labels)
+            self._labels_dirty = False
+        with open(os.path.join(self.log_dir, 'labels.json'), 'w') as f:
+            json.dump(dict((code, label) for label, code in labels.items()), f)
+
+    def _writer(self):
+        while True:
+            item = self._write_queue.get()
+            if item is None:
+                break
+            channel, chunk, n = item
+            try:
+                f = self._files.get(channel.name)
+                if f is None:
+                    f = self._files[channel.name] = open(os.path.join(self.log_dir, channel.name + '.bin'), 'ab')
+                chunk[:n].tofile(f)
+                f.flush()
+            except Exception as e:
+                rospy.logerr_throttle(5, 'flight recorder failed to write {}: {}'.format(channel.name, e))
+            finally:
+                channel._release(chunk)
+            if self._labels_dirty:
+                self._write_labels()
+
+    def flush(self):
+        for channel in list(self.channels.values()):
+            channel.flush()
+
+    def stop(self):
+        """ flushes all channels and waits for the writer thread to finish """
+        if not self._alive:
+            return
+        self._alive = False
+        self.flush()
+        self._write_queue.put(None)
+        self._writer_thread.join()
+        self._write_labels()
+        for f in self._files.values():
+            f.close()
+        dropped = dict((name, channel.dropped) for name, channel in self.channels.items() if channel.dropped)
+        rospy.loginfo('flight recorder stopped - {} rows written to {}{}'.format(
+            sum(channel.rows for channel in self.channels.values()), self.log_dir,
+            ', dropped {}'.format(dropped) if dropped else ''))
+
+
+def load_channel(log_dir, name):
+    """
+    Memory maps a recorded channel - returns a structured array with one named field per column
+    """
+    with open(os.path.join(log_dir, name + '.json')) as f:
+        fields = json.load(f)['fields']
+    dtype = np.dtype([(field, np.float64) for field in fields])
+    path = os.path.join(log_dir, name + '.bin')
+    if os.path.getsize(path) == 0:
+        return np.zeros(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode='r')
+
+
+def load_labels(log_dir):
+    """ returns {code: label} for the string labels used in the log """
+    path = os.path.join(log_dir, 'labels.json')
+    if not os.path.isfile(path):
+        return {}
+    with open(path) as f:
+        return dict((int(code), label) for code, label in json.load(f).items())
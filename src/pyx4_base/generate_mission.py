@@ -10,7 +10,7 @@ from mission_states import *
 from definitions_pyx4 import MISSION_SPECS
 
 
-def Wpts_from_csv(file_path):
+def Wpts_from_csv(file_path, smooth=False):
     '''
     Loads a csv file into our flight instruction data format
 
@@ -23,16 +23,24 @@ def Wpts_from_csv(file_path):
     NB. If a simple routine with parametised inputs is required than a programable mission is a better option
 
     :param file_path:
+    :param smooth: fly the position waypoints along min jerk trajectories (see Waypoint_state)
     :return:
     '''
+    return dict(enumerate(Wpts_from_csv_stream(file_path, smooth)))
+
+
+def Wpts_from_csv_stream(file_path, smooth=False):
+    '''
+    Generator version of Wpts_from_csv - each flight instruction is only built when the commander needs it, so long
+    csv missions can be streamed to the commander rather than built before take off
+    '''
 
-    instructions = {}
     instruction_cnt = 0
     first_row = True
     pos_tol = 0.2,  # tolerance for position waypoints todo - incorporate this properly
 
     # Automatically provide the arming state
-    instructions[instruction_cnt] = Arming_state(
+    yield Arming_state(
         timeout=90
     )
     instruction_cnt += 1
@@ -49,7 +57,7 @@ def Wpts_from_csv(file_path):
                 assert (row['xy_type'] == 'pos'), 'the first instruction xy axismust be of type pos'
                 assert (row['yaw_type'] == 'pos'), 'the first instruction yaw axis must be of type pos'
 
-                instructions[instruction_cnt] = Take_off_state(
+                yield Take_off_state(
                     to_altitude_tgt=np.float64(row['z_setpoint']),
                     yaw_type='pos',
                     heading_tgt_rad=np.float64(row['yaw_setpoint']),
@@ -57,22 +65,30 @@ def Wpts_from_csv(file_path):
                 instruction_cnt += 1
                 first_row = False
 
-            instructions[instruction_cnt] = Waypoint_state(
-                state_label='waypoint_' + str(instruction_cnt),  # waypoint state labels are mandatory
-                waypoint_type=row['instruction_type'],  # hold, pos, vel_xy, vel
-                xy_type=row['xy_type'],
-                x_setpoint=np.float64(row['x_setpoint']),
-                y_setpoint=np.float64(row['y_setpoint']),
-                z_type=row['z_type'],
-                z_setpoint=np.float64(row['z_setpoint']),
-                yaw_type=row['yaw_type'],
-                yaw_setpoint=np.float64(row['yaw_setpoint']),
-                coordinate_frame=row['coordinate_frame'],
-                timeout=int(row['timeout'])
-                )
+            yield waypoint_from_row(row, state_label='waypoint_' + str(instruction_cnt), smooth=smooth)
             instruction_cnt = instruction_cnt + 1
 
-    return instructions
+
+def waypoint_from_row(row, state_label, smooth=False):
+    '''
+    Builds a Waypoint_state from a mission csv row (a dictionary of the csv columns, values may be strings) - smooth
+    only applies to rows that are position control in all axis
+    '''
+    smooth = smooth and row['xy_type'] == 'pos' and row['z_type'] == 'pos' and row['yaw_type'] == 'pos'
+    return Waypoint_state(
+        state_label=state_label,  # waypoint state labels are mandatory
+        waypoint_type=row['instruction_type'],  # hold, pos, vel_xy, vel
+        xy_type=row['xy_type'],
+        x_setpoint=np.float64(row['x_setpoint']),
+        y_setpoint=np.float64(row['y_setpoint']),
+        z_type=row['z_type'],
+        z_setpoint=np.float64(row['z_setpoint']),
+        yaw_type=row['yaw_type'],
+        yaw_setpoint=np.float64(row['yaw_setpoint']),
+        coordinate_frame=row['coordinate_frame'],
+        timeout=int(row['timeout']),
+        smooth=smooth,
+        )
 
 
 if __name__ == '__main__':
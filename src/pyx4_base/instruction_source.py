@@ -0,0 +1,111 @@
+#!/usr/bin/env python2
+"""
+The commander's view of a mission's flight instructions.
+
+Missions can be given as the usual indexed dictionary or as any iterable of instructions - typically a generator that
+builds each mission state as it is needed. Only a small look-ahead window of instructions is materialised in front of
+the active one, and completed instructions are released, so dense missions with many thousands of waypoints don't
+have to be built (and held in memory) before take-off.
+
+Instructions that haven't been reached yet can be appended, inserted or replaced while the mission is running - see
+Commander.append_instructions etc.
+"""
+
+from itertools import chain
+from threading import RLock
+
+
+class Instruction_source(object):
+    """
+    Indexed access to flight instructions taken from a dictionary {idx: instruction} or an iterable
+
+    lookahead: how many instructions after the one being read are materialised in advance
+    """
+
+    def __init__(self, instructions, lookahead=2):
+        if hasattr(instructions, 'keys'):
+            # an indexed dictionary - iterated in index order
+            self._iterator = (instructions[idx] for idx in sorted(instructions.keys()))
+        else:
+            self._iterator = iter(instructions)
+        self.lookahead = lookahead
+
+        self._buffer = {}
+        self._next_idx = 0          # index that the next instruction taken from the iterator will get
+        self._exhausted = False
+        self._lock = RLock()
+
+    @staticmethod
+    def wrap(instructions, lookahead=2):
+        if isinstance(instructions, Instruction_source):
+            return instructions
+        return Instruction_source(instructions, lookahead)
+
+    def _fill(self, idx):
+        """ materialises instructions up to and including idx (if the source is that long) """
+        with self._lock:
+            while not self._exhausted and self._next_idx <= idx:
+                try:
+                    instruction = next(self._iterator)
+                except StopIteration:
+                    self._exhausted = True
+                    break
+                self._buffer[self._next_idx] = instruction
+                self._next_idx += 1
+
+    def __getitem__(self, idx):
+        self._fill(idx + self.lookahead)
+        try:
+            return self._buffer[idx]
+        except KeyError:
+            raise IndexError('no flight instruction {} (released or beyond the end of the mission)'.format(idx))
+
+    def __len__(self):
+        """ the number of instructions seen so far - the mission length once the source is exhausted """
+        return self._next_idx
+
+    @property
+    def exhausted(self):
+        return self._exhausted
+
+    def is_last(self, idx):
+        """ True if there is no instruction after idx """
+        self._fill(idx + 1)
+        return self._exhausted and idx + 1 >= self._next_idx
+
+    def append(self, instructions):
+        """ adds instructions after the last instruction of the source """
+        with self._lock:
+            self._iterator = chain(self._iterator, list(instructions))
+            self._exhausted = False
+
+    def insert(self, idx, instructions):
+        """ inserts instructions before instruction idx (or at the end of the source if it is shorter) """
+        self._splice(idx, instructions, replace=False)
+
+    def replace_from(self, idx, instructions):
+        """ replaces instruction idx and everything after it """
+        self._splice(idx, instructions, replace=True)
+
+    def _splice(self, idx, instructions, replace):
+        with self._lock:
+            self._fill(idx - 1)
+            idx = min(idx, self._next_idx)
+            # take the buffered instructions from idx on back out of the buffer
+            tail = [self._buffer.pop(i) for i in range(idx, self._next_idx)]
+            if replace:
+                self._iterator = iter(list(instructions))
+            else:
+                self._iterator = chain(list(instructions), tail, self._iterator)
+            self._next_idx = idx
+            self._exhausted = False
+
+    def release(self, idx):
+        """ drops a completed instruction so that it can be garbage collected """
+        with self._lock:
+            self._buffer.pop(idx, None)
+
+    def buffered(self):
+        """ the materialised instructions in index order """
+        with self._lock:
+            return [self._buffer[idx] for idx in sorted(self._buffer.keys())]
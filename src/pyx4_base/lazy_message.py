@@ -0,0 +1,71 @@
+#!/usr/bin/env python2
+"""
+Lazy deserialisation for large or rarely read topics.
+
+Topics subscribed with rospy.AnyMsg hand their callback the serialised message. Lazy_message keeps those bytes and
+only decodes them when a consumer reads the message, so busy topics that are seldom looked at cost little more than a
+reference assignment per message. Small fields at a fixed offset (such as the header stamp) can be peeked at without
+decoding anything.
+"""
+
+import struct
+
+_HEADER_PEEK = struct.Struct('<3I')     # std_msgs/Header: uint32 seq, uint32 stamp.secs, uint32 stamp.nsecs
+_UINT16_PEEK = struct.Struct('<H')
+
+
+def peek_header_stamp(buff):
+    """ returns the header stamp (in seconds) of a serialised message that starts with a std_msgs/Header """
+    _, secs, nsecs = _HEADER_PEEK.unpack_from(buff, 0)
+    return secs + nsecs * 1e-9
+
+
+def peek_uint16(buff, offset=0):
+    """ e.g. the current_seq of a serialised mavros_msgs/WaypointList """
+    return _UINT16_PEEK.unpack_from(buff, offset)[0]
+
+
+class Lazy_message(object):
+    """
+    Holds the latest message of a topic either as serialised bytes (update_raw) or as a decoded message (set)
+    """
+
+    __slots__ = ('data_class', '_cache')
+
+    def __init__(self, data_class):
+        self.data_class = data_class
+        # (serialised bytes or None, decoded message or None) - replaced as a whole so readers see a consistent pair
+        self._cache = (None, data_class())
+
+    def update_raw(self, buff):
+        self._cache = (buff, None)
+
+    def set(self, msg):
+        self._cache = (None, msg)
+
+    @property
+    def raw(self):
+        """ the serialised bytes of the latest message, None if it was received already decoded """
+        return self._cache[0]
+
+    @property
+    def decoded(self):
+        return self._cache[1] is not None
+
+    @property
+    def msg(self):
+        buff, msg = self._cache
+        if msg is None:
+            msg = self.data_class()
+            msg.deserialize(buff)
+            # don't overwrite a newer message that arrived while we were decoding
+            if self._cache[0] is buff:
+                self._cache = (buff, msg)
+        return msg
+
+    def stamp(self):
+        """ header stamp (s) of the latest message without decoding it (message types with a header only) """
+        buff, msg = self._cache
+        if msg is not None:
+            return msg.header.stamp.to_sec()
+        return peek_header_stamp(buff)
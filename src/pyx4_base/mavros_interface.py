@@ -9,8 +9,9 @@
 
 from __future__ import division
 
+import math
 import numpy as np
-from threading import Thread, Lock
+from threading import Thread
 import rospy
 import sys
 
@@ -20,24 +21,140 @@ from geometry_msgs.msg import PoseStamped, TwistStamped
 from nav_msgs.msg import Odometry
 from sensor_msgs.msg import NavSatFix, Range
 from std_msgs.msg import Float64, Float32
-from tf.transformations import euler_from_quaternion
+from diagnostic_msgs.msg import DiagnosticArray
 
 from definitions_pyx4 import *
 
 from definitions_pyx4 import MAV_VTOL_STATE, LANDED_STATE, MAV_STATE
+from vehicle_state import Vehicle_state, Vehicle_state_buffer
+from utils import quaternion_to_yaw, quaternion_to_roll_pitch, slerp
+from telemetry_history import Ring_buffer
+from topic_monitor import Topic_stats, stats_to_diagnostic_status, NS_PER_S
+from deadline_scheduler import get_default_scheduler, monotonic
+from readiness_barrier import Readiness_barrier
+from lazy_message import Lazy_message, peek_uint16
+from param_cache import Param_cache
+
+
+# fields stored for each topic when telemetry history is enabled for it
+HISTORY_FIELDS = {
+    'local_pose': ('x', 'y', 'z', 'qx', 'qy', 'qz', 'qw', 'yaw'),
+    'velocity_local': ('x_vel', 'y_vel', 'z_vel'),
+    'velocity_body': ('x_vel', 'y_vel', 'z_vel', 'yaw_rate'),
+    'ground_truth': ('x', 'y', 'z', 'x_vel', 'y_vel', 'z_vel'),
+}
+
+# history needed by state_at - e.g. Pyx4_base(telemetry_history=STATE_AT_HISTORY) keeps a few seconds at mavros rates
+STATE_AT_HISTORY = {
+    'local_pose': 256,
+    'velocity_local': 256,
+    'velocity_body': 256,
+}
+
+# every topic the interface knows how to handle - {key: (name, message class, callback method name)}
+TOPIC_SPECS = {
+    'altitude': ('mavros/altitude', Altitude, 'altitude_callback'),
+    'extended_state': ('mavros/extended_state', ExtendedState, 'extended_state_callback'),
+    'global_position': ('mavros/global_position/global', NavSatFix, 'global_position_callback'),
+    'gps_raw_fix': ('mavros/global_position/raw/fix', NavSatFix, 'gps_raw_fix_callback'),
+    'optic_flow_raw': ('mavros/px4flow/raw/optical_flow_raw', OpticalFlowRad, 'optic_flow_raw_callback'),
+    'optic_flow_range': ('mavros/px4flow/ground_distance', Range, 'optic_flow_range_callback'),
+    'home_position': ('mavros/home_position/home', HomePosition, 'home_position_callback'),
+    'local_pose': ('mavros/local_position/pose', PoseStamped, 'local_position_callback'),
+    'mission_wp': ('mavros/mission/waypoints', WaypointList, 'mission_wp_callback'),
+    'state': ('mavros/state', State, 'state_callback'),
+    'mocap_pose': ('mavros/vision_pose/pose', PoseStamped, 'mocap_pos_callback'),
+    # todo - add check for this signal to watchdog - or remap /mavros/local_position/velocity -> /mavros/local_position/velocity_local
+    'velocity_local': ('/mavros/local_position/velocity_local', TwistStamped, 'vel_callback'),
+    'velocity_body': ('/mavros/local_position/velocity_body', TwistStamped, 'vel_bod_callback'),
+    'compass': ('/mavros/global_position/compass_hdg', Float64, 'compass_hdg_callback'),
+    'ground_truth': ('/body_ground_truth', Odometry, 'gt_position_callback'),
+}
+
+# topics used by the interface itself and the generic mission states whatever the configuration
+BASE_TOPICS = ('state', 'extended_state', 'local_pose', 'altitude', 'velocity_local', 'velocity_body')
+
+# topics that are only needed for a given state estimation method
+SEM_TOPICS = {
+    State_estimation_method.UNKNOWN: (),
+    State_estimation_method.MOCAP: ('mocap_pose',),
+    State_estimation_method.GPS: ('global_position', 'home_position', 'compass'),
+    State_estimation_method.OPTIC_FLOW: ('optic_flow_raw', 'optic_flow_range'),
+}
+
+# large or rarely read topics that are kept serialised and only decoded when read (unless their history is enabled)
+LAZY_TOPICS = ('mission_wp', 'home_position', 'optic_flow_raw', 'ground_truth')
+
+# services that must be available before the interface is ready - {key: (name, service class)}
+REQUIRED_SERVICES = {
+    'param_get': ('mavros/param/get', ParamGet),
+    'param_set': ('mavros/param/set', ParamSet),
+    'arming': ('mavros/cmd/arming', CommandBool),
+    'mission_push': ('mavros/mission/push', WaypointPush),
+    'mission_clear': ('mavros/mission/clear', WaypointClear),
+    'set_mode': ('mavros/set_mode', SetMode),
+    'set_home': ('/mavros/cmd/set_home', CommandHome),
+    # 'fcu_url': ('mavros/fcu_url', ...),   # todo - check how this is used in px4
+}
+
+# topics that must be published before the interface is ready - {key: (name, message class)}
+REQUIRED_TOPICS = {
+    'local_pose': ('mavros/local_position/pose', PoseStamped),
+    'extended_state': ('mavros/extended_state', ExtendedState),
+}
+
+# seconds without a message before a topic is reported as stale - topics not listed here are monitored but never stale
+DEFAULT_STALE_AFTER = {
+    'state': 2.5,
+    'local_pose': 2.0,
+    'mocap_pose': 2.0,
+    'global_position': 2.0,
+    'optic_flow_raw': 2.0,
+}
+
+# topics that are checked by the watchdog in addition to 'state' and 'local_pose'
+SEM_WATCHED_TOPICS = {
+    State_estimation_method.UNKNOWN: (),
+    State_estimation_method.MOCAP: ('mocap_pose',),
+    State_estimation_method.GPS: ('global_position',),
+    State_estimation_method.OPTIC_FLOW: ('optic_flow_raw',),
+}
+
+
+def ns_join(mavros_ns, name):
+    """
+    Puts a mavros topic, service or parameter name in a vehicle namespace, e.g. ('uav1', '/mavros/state') ->
+    '/uav1/mavros/state'. Names are returned unchanged when no namespace is given.
+    """
+    if not mavros_ns:
+        return name
+    return '/' + mavros_ns.strip('/') + '/' + name.lstrip('/')
 
 
 class Mavros_interface(object):
 
-    # todo - add mavros ns to topics
     def __init__(self,
                  ros_rate=10,   # slow as nothing happens in the main loop
                  state_estimation_mode=State_estimation_method.GPS,
                  enforce_height_mode_flag=False,
                  height_mode_req=0,
+                 compute_roll_pitch=False,
+                 telemetry_history=None,   # optional dictionary of {topic key: number of samples} - see HISTORY_FIELDS
+                 stale_after=None,         # optional dictionary of {topic key: seconds} overriding DEFAULT_STALE_AFTER
+                 deadline_periods=10,      # a watched topic misses its deadline after this many expected periods
+                 min_deadline=0.2,         # lower bound (s) on a watched topic's deadline
+                 scheduler=None,
+                 startup_timeout=30,       # how long to wait for the mavros services and topics
+                 required_topics=(),       # extra topic keys (see TOPIC_SPECS), e.g. from the mission states
+                 subscribe_all=False,      # subscribe to every topic in TOPIC_SPECS whatever the configuration
+                 mavros_ns='',             # vehicle namespace, e.g. 'uav1' -> /uav1/mavros/...
+                 lazy_topics=LAZY_TOPICS,  # topics that are decoded on access rather than on every message
+                 recorder=None,            # an optional Flight_recorder that every vehicle state update is written to
                  ):
 
+        self.mavros_ns = mavros_ns
         self.sem = state_estimation_mode
+        self.compute_roll_pitch = compute_roll_pitch
         self._node_alive = True
         self.ros_rate = ros_rate
 
@@ -45,17 +162,36 @@ class Mavros_interface(object):
         self.wd_fault_detected = False
         self.fault_this_loop = False
 
+        # per topic arrival statistics, populated as topics are subscribed to
+        self.topic_stats = {}
+        self.stale_after = dict(DEFAULT_STALE_AFTER)
+        self.stale_after.update(stale_after or {})
+        self.watched_topics = ('state', 'local_pose') + SEM_WATCHED_TOPICS.get(self.sem, ())
+
+        # watched topics carry a deadline that is re-armed by every message - see _rearm_deadline
+        self.scheduler = scheduler if scheduler is not None else get_default_scheduler()
+        self.deadline_periods = deadline_periods
+        self.min_deadline = min_deadline
+        self.topic_deadlines = {}
+        self.missed_deadlines = {}
+        self._deadline_handlers = []
+
         # initialise data containers
         self.altitude = Altitude()
         self.altitude_bottom_clearance = Float32()
         self.extended_state = ExtendedState()
         self.global_position = NavSatFix()
-        self.optic_flow_raw = OpticalFlowRad()
         self.optic_flow_range = Range()
-        self.home_position = HomePosition()
         self.local_position = PoseStamped()
         # self.gt_position = PoseStamped()
-        self.mission_wp = WaypointList()
+        # topics that can be deserialised lazily - read through the properties of the same name
+        self._lazy_messages = {
+            'optic_flow_raw': Lazy_message(OpticalFlowRad),
+            'home_position': Lazy_message(HomePosition),
+            'mission_wp': Lazy_message(WaypointList),
+            'ground_truth': Lazy_message(Odometry),
+        }
+        self.mission_wp_current_seq = WaypointList().current_seq
         self.state = State()
         self.mocap_pose = PoseStamped()
         self.camera_pose = PoseStamped()
@@ -63,14 +199,14 @@ class Mavros_interface(object):
         self.local_x = Float64().data
         self.local_y = Float64().data
         self.local_z = Float64().data
-        self.gt_x = Float64().data
-        self.gt_y = Float64().data
-        self.gt_z = Float64().data
+        # attitude is derived once per pose message rather than on every access
+        self._yaw_local = 0.0
+        self.roll_local = 0.0
+        self.pitch_local = 0.0
+        self.gps_raw_fix = NavSatFix()
         # todo - we can probably live with just XX_vel_bod data?:
         self.x_vel = Float64().data
         self.y_vel = Float64().data
-        self.gt_x_vel = Float64().data
-        self.gt_y_vel = Float64().data
         self.vel_ts = Float64().data
         self.xy_vel = Float64().data
         self.x_vel_bod = Float64().data
@@ -80,117 +216,109 @@ class Mavros_interface(object):
 
         self.global_compass_hdg_deg = Float64().data
 
+        # coherent snapshot of the fields above that are used by the commander and mission states
+        self.vehicle_state_buffer = Vehicle_state_buffer()
+
+        # opt-in flight recording - the setpoint publisher and commander also record through this reference
+        self.recorder = None
+        if recorder is not None:
+            self.attach_recorder(recorder)
+
+        # opt-in per topic history
+        self.telemetry_history = {}
+        for topic_key, capacity in (telemetry_history or {}).items():
+            if topic_key not in HISTORY_FIELDS:
+                raise KeyError('no history available for {} - options are {}'.format(topic_key, HISTORY_FIELDS.keys()))
+            self.telemetry_history[topic_key] = Ring_buffer(capacity, HISTORY_FIELDS[topic_key])
+        self._local_pose_history = self.telemetry_history.get('local_pose')
+        self._velocity_local_history = self.telemetry_history.get('velocity_local')
+        self._velocity_body_history = self.telemetry_history.get('velocity_body')
+        self._ground_truth_history = self.telemetry_history.get('ground_truth')
+
+        # topics with history have to be decoded on every message anyway
+        self.lazy_topics = set(lazy_topics) - set(self.telemetry_history.keys())
+
         self.enforce_height_mode_flag = enforce_height_mode_flag
         self.height_mode_req = height_mode_req
 
-        # threading locks
-        self.setpoint_lock = Lock()  # used for setting lock in our setpoint publisher so that commands aren't mixed
+        # ROS subscribers - only the topics that this configuration needs are subscribed to, others can be added
+        # later with require_topics
+        self.subscribers = {}
+        if subscribe_all:
+            topic_profile = TOPIC_SPECS.keys()
+        else:
+            topic_profile = self.topic_profile(self.sem, required_topics)
+            topic_profile.update(self.telemetry_history.keys())
+        self.require_topics(topic_profile)
+        rospy.loginfo('subscribed to {} of {} mavros topics, not subscribed to: {}'.format(
+            len(self.subscribers), len(TOPIC_SPECS), sorted(set(TOPIC_SPECS) - set(self.subscribers))))
+        # self.camera_pose_sub = rospy.Subscriber(self.camera_pose_topic_name, PoseStamped, self.cam_pose_cb)
 
-        # ROS services
-        service_timeout = 10
-        rospy.loginfo("Searching for mavros services")
+        ## Ros publishers
+        self.local_pos_pub_raw = rospy.Publisher(self.ns_name('mavros/setpoint_raw/local'), PositionTarget, queue_size=1)
+        self.diagnostics_pub = rospy.Publisher(
+            '~' + (self.mavros_ns.strip('/') + '/' if self.mavros_ns else '') + 'topic_diagnostics',
+            DiagnosticArray, queue_size=1)
+
+        # wait for all of the mavros services and topics that we depend on at the same time
+        rospy.loginfo("Waiting for mavros services and topics")
+        barrier = Readiness_barrier(services=self._ns_specs(REQUIRED_SERVICES), topics=self._ns_specs(REQUIRED_TOPICS),
+                                    timeout=startup_timeout,
+                                    min_messages=2)   # check that essential messages are being published regularly
         try:
-            rospy.wait_for_service('mavros/param/get', service_timeout)
-            rospy.wait_for_service('mavros/param/set', service_timeout)
-            rospy.wait_for_service('mavros/cmd/arming', service_timeout)
-            rospy.wait_for_service('mavros/mission/push', service_timeout)
-            rospy.wait_for_service('mavros/mission/clear', service_timeout)
-            rospy.wait_for_service('mavros/set_mode', service_timeout)
-            rospy.wait_for_service('mavros/set_mode', service_timeout)
-            rospy.wait_for_service('/mavros/cmd/set_home')
-            # rospy.wait_for_service('mavros/fcu_url', service_timeout)   # todo - check how this is used in px4
-            self.get_param_srv = rospy.ServiceProxy('mavros/param/get', ParamGet)
-            self.set_param_srv = rospy.ServiceProxy('mavros/param/set', ParamSet)
-            self.set_arming_srv = rospy.ServiceProxy('mavros/cmd/arming', CommandBool)
-            self.set_mode_srv = rospy.ServiceProxy('mavros/set_mode', SetMode)
-            self.wp_clear_srv = rospy.ServiceProxy('mavros/mission/clear', WaypointClear)
-            self.wp_push_srv = rospy.ServiceProxy('mavros/mission/push', WaypointPush)
-            self.takeoff_srv = rospy.ServiceProxy('/mavros/cmd/takeoff', CommandTOL)
-            self.cmd_home_srv = rospy.ServiceProxy('/mavros/cmd/set_home', CommandHome)
-            rospy.loginfo("Required ROS services are up")
-        except rospy.ROSException:
-            self.shut_node_down(extended_msg="failed to connect to Mavros services - was the mavros node started?")
+            proxies = barrier.wait()
+            self.startup_ready_times = barrier.ready_times
+        except rospy.ROSException as e:
+            self.shut_node_down(extended_msg="failed to connect to Mavros services or topics - was the mavros node "
+                                             "started? {}".format(e))
+        self.get_param_srv = proxies['param_get']
+        self.set_param_srv = proxies['param_set']
+        self.set_arming_srv = proxies['arming']
+        self.set_mode_srv = proxies['set_mode']
+        self.wp_clear_srv = proxies['mission_clear']
+        self.wp_push_srv = proxies['mission_push']
+        self.cmd_home_srv = proxies['set_home']
+        # takeoff isn't required by the mission states so we don't wait for it
+        self.takeoff_srv = rospy.ServiceProxy(self.ns_name('/mavros/cmd/takeoff'), CommandTOL)
+        rospy.loginfo("Required ROS services and topics are up")
 
         # make sure we have information about our connection with FCU
         rospy.loginfo("Get our fcu string")
         try:
-            self.fcu_url = rospy.get_param('mavros/fcu_url')
+            self.fcu_url = rospy.get_param(self.ns_name('mavros/fcu_url'))
         except Exception as e:
             print (e)
             self.shut_node_down(extended_msg="cant find fcu url")
 
+        # FCU parameters are pulled in one go the first time one is read, after which reads are dictionary lookups
+        self.params = Param_cache(pull_srv_name=self.ns_name('mavros/param/pull'),
+                                  param_ns=self.ns_name('mavros/param'),
+                                  param_value_topic=self.ns_name('mavros/param/param_value'),
+                                  get_param_srv=self.get_param_srv,
+                                  set_param_srv=self.set_param_srv)
+
         # ensure that our height mode is as we expect it to be (if required)
         rospy.loginfo('check height_mode {}'.format(self.enforce_height_mode_flag))
         if self.enforce_height_mode_flag:
-            # todo - allow multiple attempts at this
-                # res = self.mavros_interface.get_param_srv(param)
-            param_read_attempts = 0
-            try:
-
-                while param_read_attempts < 5:
-                    res = self.get_param_srv('EKF2_HGT_MODE')
-                    if res.success:
-                        self.height_mode = res.value.integer
-                        if self.height_mode == self.height_mode_req:
-                            rospy.loginfo('height mode {} as expected'.format(self.height_mode))
-                            break
-                        else:
-                            raise Exception ("height mode is {} - (expected heightmode is {}) change parameter with QGround control and try again".format(self.height_mode, self.height_mode_req))
-                            break
-                    else:
-                        rospy.logerr( "Couldn't read EKF2_HGT_MODE param on attempt {} - trying again".format(param_read_attempts))
-                    param_read_attempts += 1
-                    rospy.sleep(2)
-
-            except Exception as e:
-                rospy.logerr(
-                    "Couldn't read EKF2_HGT_MODE - shutting down".format(param_read_attempts))
-                self.shut_node_down(extended_msg= "height_mode error - traceback is {}".format(e))
+            self.height_mode = self.params.get('EKF2_HGT_MODE')
+            if self.height_mode is None:
+                self.shut_node_down(extended_msg="Couldn't read EKF2_HGT_MODE - shutting down")
+            elif self.height_mode != self.height_mode_req:
+                self.shut_node_down(extended_msg="height mode is {} - (expected heightmode is {}) change parameter with "
+                                                 "QGround control and try again".format(self.height_mode,
+                                                                                        self.height_mode_req))
+            else:
+                rospy.loginfo('height mode {} as expected'.format(self.height_mode))
 
         # todo: ensure that our state estimation parameters are as available (this requires the state estimation
         #  topic name so can't test this until we do something with mocap again) Actually, we can incorporate this into
         #  the watchdog
         # if state_estimation_mode == State_estimation_method.MOCAP:
 
-        # ROS subscribers
-        self.alt_sub = rospy.Subscriber('mavros/altitude', Altitude, self.altitude_callback)
-        self.ext_state_sub = rospy.Subscriber('mavros/extended_state',ExtendedState,self.extended_state_callback)
-        self.global_pos_sub = rospy.Subscriber('mavros/global_position/global',NavSatFix, self.global_position_callback)
-        self.optic_flow_raw_sub = rospy.Subscriber('mavros/px4flow/raw/optical_flow_raw',OpticalFlowRad, self.optic_flow_raw_callback)
-        self.optic_flow_range_sub = rospy.Subscriber('mavros/px4flow/ground_distance',Range,self.optic_flow_range_callback)
-        self.home_pos_sub = rospy.Subscriber('mavros/home_position/home', HomePosition, self.home_position_callback)
-        self.local_pos_sub = rospy.Subscriber('mavros/local_position/pose', PoseStamped, self.local_position_callback)
-        self.mission_wp_sub = rospy.Subscriber('mavros/mission/waypoints', WaypointList, self.mission_wp_callback)
-        self.state_sub = rospy.Subscriber('mavros/state', State, self.state_callback)
-        self.mocap_pos_sub = rospy.Subscriber('mavros/vision_pose/pose', PoseStamped, self.mocap_pos_callback)
-        # self.camera_pose_sub = rospy.Subscriber(self.camera_pose_topic_name, PoseStamped, self.cam_pose_cb)
-
-        # todo - add check for this signal to watchdog - or remap /mavros/local_position/velocity -> /mavros/local_position/velocity_local
-        self.velocity_local_sub = rospy.Subscriber('/mavros/local_position/velocity_local', TwistStamped, self.vel_callback)
-        self.velocity_body_sub = rospy.Subscriber('/mavros/local_position/velocity_body', TwistStamped, self.vel_bod_callback)
-        self.compass_sub = rospy.Subscriber('/mavros/global_position/compass_hdg', Float64, self.compass_hdg_callback)
-        self.ground_truth_sub = rospy.Subscriber('/body_ground_truth', Odometry, self.gt_position_callback)
-
-        ## Ros publishers
-        self.local_pos_pub_raw = rospy.Publisher('mavros/setpoint_raw/local', PositionTarget, queue_size=1)
-
-        # ROS topics - this must come after our ROS subscribers
-        topics_timeout = 30
-        rospy.loginfo("waiting for ROS topics")
-        try:
-            # check that essential messages are being subscribed to regularly
-            for _ in np.arange(2):
-                rospy.wait_for_message('mavros/local_position/pose', PoseStamped, topics_timeout)
-                rospy.wait_for_message('mavros/extended_state', ExtendedState, topics_timeout)
-        except rospy.ROSException:
-            self.shut_node_down(extended_msg="Required ros topics not published")
-
-        rospy.loginfo("ROS topics are up")
-
-        # create a watchdog thread that checks topics are being received at the expected rates
-        self.watchdog_thread = Thread(target=self.watchdog, args=())
-        self.watchdog_thread.daemon = True
-        self.watchdog_thread.start()
+        # the watchdog checks topics are being received at the expected rates - it runs periodically on the (shared)
+        # scheduler rather than in a thread of its own
+        self.watchdog_period = 2.0
+        self.scheduler.call_later(self.watchdog_period, self._watchdog_tick, name='watchdog')
 
 
     def run(self):
@@ -208,14 +336,298 @@ class Mavros_interface(object):
         rospy.logerr('mavros interface node is shutting down ' + extended_msg)
         sys.exit()
 
+    def ns_name(self, name):
+        return ns_join(self.mavros_ns, name)
+
+    def _ns_specs(self, specs):
+        return dict((key, (self.ns_name(spec[0]),) + tuple(spec[1:])) for key, spec in specs.items())
+
+    @staticmethod
+    def topic_profile(state_estimation_mode, required_topics=()):
+        """
+        Returns the set of topic keys needed for a state estimation mode plus any additional requirements (e.g. the
+        required_topics declared by the mission states)
+        """
+        profile = set(BASE_TOPICS)
+        profile.update(SEM_TOPICS.get(state_estimation_mode, ()))
+        profile.update(SEM_WATCHED_TOPICS.get(state_estimation_mode, ()))
+        profile.update(required_topics)
+        unknown = profile - set(TOPIC_SPECS)
+        if unknown:
+            raise KeyError('unknown topics {} - options are {}'.format(sorted(unknown), sorted(TOPIC_SPECS)))
+        return profile
+
+    def require_topics(self, topic_keys):
+        """
+        Subscribes to any of the given topics (keys of TOPIC_SPECS) that aren't already subscribed to
+        """
+        for topic_key in topic_keys:
+            if topic_key not in self.subscribers:
+                topic_name, data_class, callback_name = TOPIC_SPECS[topic_key]
+                if topic_key in self.lazy_topics:
+                    data_class = rospy.AnyMsg
+                    callback = self._raw_callback(topic_key)
+                else:
+                    callback = getattr(self, callback_name)
+                self.subscribers[topic_key] = self._subscribe(topic_key, self.ns_name(topic_name), data_class,
+                                                              callback)
+
+    def _raw_callback(self, topic_key):
+        """
+        Returns a callback for a topic subscribed with rospy.AnyMsg that keeps the serialised message for decoding on
+        access
+        """
+        lazy_message = self._lazy_messages[topic_key]
+
+        if topic_key == 'mission_wp':
+            def callback(data):
+                lazy_message.update_raw(data._buff)
+                self._update_mission_seq(peek_uint16(data._buff))
+        else:
+            def callback(data):
+                lazy_message.update_raw(data._buff)
+        return callback
+
+    def _subscribe(self, topic_key, topic_name, data_class, callback):
+        """
+        Subscribes to a topic and records the arrival statistics and callback time of each message
+        """
+        stats = Topic_stats(topic_key, topic_name, stale_after=self.stale_after.get(topic_key))
+        self.topic_stats[topic_key] = stats
+
+        if topic_key in self.watched_topics:
+            def monitored_callback(data):
+                stats.update(rospy.get_rostime().to_nsec())
+                self._rearm_deadline(topic_key, stats)
+                t_start = monotonic()
+                callback(data)
+                stats.callback_time_s += monotonic() - t_start
+        else:
+            def monitored_callback(data):
+                stats.update(rospy.get_rostime().to_nsec())
+                t_start = monotonic()
+                callback(data)
+                stats.callback_time_s += monotonic() - t_start
+
+        return rospy.Subscriber(topic_name, data_class, monitored_callback)
+
+    def callback_load(self):
+        """
+        Returns {topic key: fraction of one core spent in the topic's callback since it was first received} - compare
+        with subscribe_all=True to see the CPU saved by the topic profile
+        """
+        now_ns = rospy.get_rostime().to_nsec()
+        load = {}
+        for topic_key, stats in list(self.topic_stats.items()):
+            if stats.count > 1 and now_ns > stats.first_seen_ns:
+                load[topic_key] = stats.callback_time_s * NS_PER_S / (now_ns - stats.first_seen_ns)
+        return load
+
+    def topic_deadline(self, stats):
+        """
+        The time (s) a watched topic may go without a message: deadline_periods expected periods once the rate is
+        known, never less than min_deadline and never more than the topic's staleness threshold
+        """
+        deadline = stats.stale_after
+        if stats.count > 2 and self.deadline_periods:
+            by_period = max(self.min_deadline, self.deadline_periods * stats.ewma_period_ns / NS_PER_S)
+            deadline = by_period if deadline is None else min(deadline, by_period)
+        return deadline
+
+    def _rearm_deadline(self, topic_key, stats):
+        deadline = self.topic_deadline(stats)
+        if deadline is None:
+            return
+        handle = self.topic_deadlines.get(topic_key)
+        if handle is None:
+            self.topic_deadlines[topic_key] = self.scheduler.call_later(
+                deadline, self._deadline_missed, topic_key, name='deadline_' + topic_key)
+        else:
+            self.scheduler.rearm(handle, deadline)
+
+    def _deadline_missed(self, topic_key):
+        """
+        Runs on the scheduler thread as soon as a watched topic misses its deadline
+        """
+        stats = self.topic_stats[topic_key]
+        self.missed_deadlines[topic_key] = self.missed_deadlines.get(topic_key, 0) + 1
+        rospy.logerr('{} missed its deadline of {:.3f} s (rate {:.1f} Hz)'.format(
+            stats.topic_name, self.topic_deadline(stats), stats.rate_hz))
+
+        if self.wd_initialised:
+            self.wd_fault_detected = True
+
+        for handler in self._deadline_handlers:
+            try:
+                handler(topic_key, stats)
+            except Exception as e:
+                rospy.logerr('deadline handler {} failed: {}'.format(handler, e))
+
+    def add_deadline_handler(self, handler):
+        """
+        Registers handler(topic_key, topic_stats) to be run whenever a watched topic misses its deadline, e.g. to
+        switch the commander to a hold or landing state
+        """
+        self._deadline_handlers.append(handler)
+
+    def remove_deadline_handler(self, handler):
+        self._deadline_handlers.remove(handler)
+
+    def get_topic_stats(self, topic_key):
+        return self.topic_stats.get(topic_key)
+
+    def stale_topics(self, topic_keys=None):
+        """
+        Returns the keys of the topics (by default the watched topics) that are currently stale
+        """
+        now_ns = rospy.get_rostime().to_nsec()
+        if topic_keys is None:
+            topic_keys = self.watched_topics
+        return [key for key in topic_keys if key in self.topic_stats and self.topic_stats[key].is_stale(now_ns)]
+
+    def publish_diagnostics(self):
+        now = rospy.get_rostime()
+        now_ns = now.to_nsec()
+        msg = DiagnosticArray()
+        msg.header.stamp = now
+        msg.status = [stats_to_diagnostic_status(stats, now_ns, hardware_id=self.fcu_url)
+                      for stats in list(self.topic_stats.values())]
+        self.diagnostics_pub.publish(msg)
+
     ###########################################
     # Frequently used properties
     ###########################################
+    @property
+    def vehicle_state(self):
+        """
+        The latest committed vehicle state - use read_vehicle_state if more than one field is needed
+        """
+        return self.vehicle_state_buffer.front
+
+    def read_vehicle_state(self, out):
+        """
+        Copies one coherent vehicle state snapshot into a preallocated Vehicle_state
+        """
+        return self.vehicle_state_buffer.read(out)
+
+    def attach_recorder(self, recorder):
+        """
+        Records every committed vehicle state to the 'vehicle_state' channel of a Flight_recorder
+        """
+        self.recorder = recorder
+        numeric_fields = tuple(field for field in Vehicle_state._data_fields if field != 'mode')
+        channel = recorder.add_channel(self.recorder_channel_name('vehicle_state'), numeric_fields + ('mode',))
+
+        def record_vehicle_state(vs):
+            channel.append((rospy.get_time(),) + tuple([getattr(vs, field) for field in numeric_fields]) +
+                           (recorder.label_code(vs.mode),))
+
+        self.vehicle_state_buffer.add_commit_listener(record_vehicle_state)
+
+    def recorder_channel_name(self, name):
+        """ recorder channels are prefixed with the vehicle namespace, e.g. uav1.setpoint """
+        return ns_join(self.mavros_ns, name).strip('/').replace('/', '.')
+
+    def get_history(self, topic_key):
+        """
+        Returns the Ring_buffer holding the recent history of a topic, or None if history isn't enabled for it
+        """
+        return self.telemetry_history.get(topic_key)
+
+    def state_at(self, t, out=None):
+        """
+        Time aligned estimate of the vehicle state at stamp t (s) from the telemetry history.
+
+        Position is linearly interpolated and attitude slerped between the pose samples either side of t, velocities
+        are interpolated from their own history when it is enabled (held at the nearest sample if t is beyond it).
+        Fields without history (mode, armed...) are taken from the latest snapshot. Returns None if t is outside the
+        pose history.
+        """
+        pose_history = self._local_pose_history
+        if pose_history is None:
+            raise RuntimeError('state_at needs the local_pose telemetry history - see STATE_AT_HISTORY')
+        bracket = pose_history.bracket(t)
+        if bracket is None:
+            return None
+
+        if out is None:
+            out = Vehicle_state()
+        self.read_vehicle_state(out)
+
+        p0, p1, fraction = bracket
+        out.pose_ts = t
+        out.x = p0[0] + fraction * (p1[0] - p0[0])
+        out.y = p0[1] + fraction * (p1[1] - p0[1])
+        out.z = p0[2] + fraction * (p1[2] - p0[2])
+        out.qx, out.qy, out.qz, out.qw = slerp(p0[3:7], p1[3:7], fraction)
+        out.yaw = quaternion_to_yaw(out.qx, out.qy, out.qz, out.qw)
+        out.heading_x = math.cos(out.yaw)
+        out.heading_y = math.sin(out.yaw)
+        if self.compute_roll_pitch:
+            out.roll, out.pitch = quaternion_to_roll_pitch(out.qx, out.qy, out.qz, out.qw)
+
+        if self._velocity_local_history is not None:
+            velocity = self._velocity_local_history.interpolate(t, clamp=True)
+            if velocity is not None:
+                out.vel_ts = t
+                out.x_vel, out.y_vel, out.z_vel = velocity
+                out.xy_vel = math.hypot(out.x_vel, out.y_vel)
+
+        if self._velocity_body_history is not None:
+            velocity = self._velocity_body_history.interpolate(t, clamp=True)
+            if velocity is not None:
+                out.x_vel_bod, out.y_vel_bod, _, out.body_yaw_rate = velocity
+                out.xy_vel_bod = math.hypot(out.x_vel_bod, out.y_vel_bod)
+
+        return out
+
+    def ground_truth_at(self, t):
+        """
+        Interpolated ground truth (see HISTORY_FIELDS) at stamp t, None if t is outside the ground truth history
+        """
+        if self._ground_truth_history is None:
+            raise RuntimeError('ground_truth_at needs the ground_truth telemetry history')
+        return self._ground_truth_history.interpolate(t)
+
     @property
     def yaw_local(self):
-        orientation_q = self.local_position.pose.orientation
-        (_, _, yaw) = euler_from_quaternion([orientation_q.x, orientation_q.y, orientation_q.z, orientation_q.w])
-        return yaw
+        return self._yaw_local
+
+    @property
+    def optic_flow_raw(self):
+        return self._lazy_messages['optic_flow_raw'].msg
+
+    @property
+    def home_position(self):
+        return self._lazy_messages['home_position'].msg
+
+    @property
+    def mission_wp(self):
+        return self._lazy_messages['mission_wp'].msg
+
+    @property
+    def ground_truth(self):
+        return self._lazy_messages['ground_truth'].msg
+
+    @property
+    def gt_x(self):
+        return self.ground_truth.pose.pose.position.x
+
+    @property
+    def gt_y(self):
+        return self.ground_truth.pose.pose.position.y
+
+    @property
+    def gt_z(self):
+        return self.ground_truth.pose.pose.position.z
+
+    @property
+    def gt_x_vel(self):
+        return self.ground_truth.twist.twist.linear.x
+
+    @property
+    def gt_y_vel(self):
+        return self.ground_truth.twist.twist.linear.y
 
 
     ###########################################
@@ -237,13 +649,24 @@ class Mavros_interface(object):
 
         self.extended_state = data
 
+        vs = self.vehicle_state_buffer.begin_write()
+        try:
+            vs.landed_state = data.landed_state
+            vs.vtol_state = data.vtol_state
+        finally:
+            self.vehicle_state_buffer.commit()
+
 
     def global_position_callback(self, data):
         self.global_position = data
 
 
+    def gps_raw_fix_callback(self, data):
+        self.gps_raw_fix = data
+
+
     def optic_flow_raw_callback(self, data):
-        self.optic_flow_raw = data
+        self._lazy_messages['optic_flow_raw'].set(data)
 
 
     def optic_flow_range_callback(self, data):
@@ -251,31 +674,68 @@ class Mavros_interface(object):
 
 
     def home_position_callback(self, data):
-        self.home_position = data
+        self._lazy_messages['home_position'].set(data)
 
 
     def local_position_callback(self, data):
         self.local_position = data
-        self.local_x = self.local_position.pose.position.x
-        self.local_y = self.local_position.pose.position.y
-        self.local_z = self.local_position.pose.position.z
+        position = data.pose.position
+        orientation = data.pose.orientation
+        self.local_x = position.x
+        self.local_y = position.y
+        self.local_z = position.z
         # self.local_pos = np.array((self.local_x, self.local_y, self.local_z))
 
+        yaw = quaternion_to_yaw(orientation.x, orientation.y, orientation.z, orientation.w)
+        self._yaw_local = yaw
+        if self.compute_roll_pitch:
+            self.roll_local, self.pitch_local = \
+                quaternion_to_roll_pitch(orientation.x, orientation.y, orientation.z, orientation.w)
+
+        pose_ts = data.header.stamp.to_sec()
+        if self._local_pose_history is not None:
+            self._local_pose_history.append(pose_ts, (position.x, position.y, position.z, orientation.x,
+                                                      orientation.y, orientation.z, orientation.w, yaw))
+
+        vs = self.vehicle_state_buffer.begin_write()
+        try:
+            vs.pose_ts = pose_ts
+            vs.x = position.x
+            vs.y = position.y
+            vs.z = position.z
+            vs.qx = orientation.x
+            vs.qy = orientation.y
+            vs.qz = orientation.z
+            vs.qw = orientation.w
+            vs.roll = self.roll_local
+            vs.pitch = self.pitch_local
+            vs.yaw = yaw
+            vs.heading_x = math.cos(yaw)
+            vs.heading_y = math.sin(yaw)
+        finally:
+            self.vehicle_state_buffer.commit()
+
 
     def gt_position_callback(self, odom):
-        self.gt_x = odom.pose.pose.position.x
-        self.gt_y = odom.pose.pose.position.y
-        self.gt_z = odom.pose.pose.position.z
+        self._lazy_messages['ground_truth'].set(odom)
 
-        self.gt_x_vel = odom.twist.twist.linear.x
-        self.gt_y_vel = odom.twist.twist.linear.y
+        if self._ground_truth_history is not None:
+            position = odom.pose.pose.position
+            velocity = odom.twist.twist.linear
+            self._ground_truth_history.append(odom.header.stamp.to_sec(),
+                                              (position.x, position.y, position.z, velocity.x, velocity.y, velocity.z))
 
 
     def mission_wp_callback(self, data):
-        if self.mission_wp.current_seq != data.current_seq:
+        self._lazy_messages['mission_wp'].set(data)
+        self._update_mission_seq(data.current_seq)
+
+
+    def _update_mission_seq(self, current_seq):
+        if self.mission_wp_current_seq != current_seq:
             rospy.loginfo("current mission waypoint sequence updated: {0}".
-                          format(data.current_seq))
-        self.mission_wp = data
+                          format(current_seq))
+        self.mission_wp_current_seq = current_seq
 
 
     def state_callback(self, data):
@@ -296,6 +756,14 @@ class Mavros_interface(object):
                 MAV_STATE(self.state.system_status).name, MAV_STATE(data.system_status).name))
         self.state = data
 
+        vs = self.vehicle_state_buffer.begin_write()
+        try:
+            vs.armed = data.armed
+            vs.connected = data.connected
+            vs.mode = data.mode
+        finally:
+            self.vehicle_state_buffer.commit()
+
 
     def mocap_pos_callback(self, data):
         self.mocap_pose = data
@@ -309,6 +777,19 @@ class Mavros_interface(object):
         self.y_vel = data.twist.linear.y
         self.xy_vel = np.linalg.norm((data.twist.linear.x, data.twist.linear.y))
 
+        if self._velocity_local_history is not None:
+            self._velocity_local_history.append(self.vel_ts, (self.x_vel, self.y_vel, data.twist.linear.z))
+
+        vs = self.vehicle_state_buffer.begin_write()
+        try:
+            vs.vel_ts = self.vel_ts
+            vs.x_vel = self.x_vel
+            vs.y_vel = self.y_vel
+            vs.z_vel = data.twist.linear.z
+            vs.xy_vel = self.xy_vel
+        finally:
+            self.vehicle_state_buffer.commit()
+
     def vel_bod_callback(self, data):
         ## Coordinate frame for local pos (note this is relative to a fixed frame of reference and is not in the body
         # frame) to the take off point,  appears to be: X: forward, Y: Left, Z: up
@@ -317,6 +798,19 @@ class Mavros_interface(object):
         self.xy_vel_bod = np.linalg.norm((data.twist.linear.x, data.twist.linear.y))
         self.body_yaw_rate = data.twist.angular.z
 
+        if self._velocity_body_history is not None:
+            self._velocity_body_history.append(data.header.stamp.to_sec(), (self.x_vel_bod, self.y_vel_bod,
+                                                                            data.twist.linear.z, self.body_yaw_rate))
+
+        vs = self.vehicle_state_buffer.begin_write()
+        try:
+            vs.x_vel_bod = self.x_vel_bod
+            vs.y_vel_bod = self.y_vel_bod
+            vs.xy_vel_bod = self.xy_vel_bod
+            vs.body_yaw_rate = self.body_yaw_rate
+        finally:
+            self.vehicle_state_buffer.commit()
+
 
     def compass_hdg_callback(self, data):
         self.global_compass_hdg_deg = data.data
@@ -326,78 +820,54 @@ class Mavros_interface(object):
     #     self.camera_yaw = self.pose2yaw(this_pose=self.camera_pose)
 
 
-    def watchdog(self):
+    def watchdog_step(self):
         """
         We ensure that data is A) present and B) once the watchdog is initialised, we ensure that data is coming in
         periodically.
+
+        Staleness is judged from the arrival statistics of each watched topic (see topic_monitor) rather than from the
+        message header stamps, and the statistics of all subscribed topics are published as diagnostics.
+
+        NB. once a topic has been received, faults are raised by its deadline (see _deadline_missed) as soon as it
+        stops arriving. This check initialises the watchdog and is a slow backstop for topics that never arrive.
         """
         # todo: consider monitoriing the following topics
         # gps_topics = ['global_pos', 'home_pos', 'mission_wp']
-        # vision_topics = ['vision_pose']
-        # main_topics = ['alt', 'ext_state', 'local_pos', 'state']
 
-        #
-        rate = rospy.Rate(0.5)
-        time_last_msg = rospy.get_time()
-        while not rospy.is_shutdown() and self._node_alive:
+        now_ns = rospy.get_rostime().to_nsec()
+        self.fault_this_loop = False
+        for topic_key in self.watched_topics:
+            stats = self.topic_stats[topic_key]
+            if stats.is_stale(now_ns):
+                rospy.logwarn('not receiving {} - last message {} s ago (rate {:.1f} Hz, max gap {:.3f} s)'.format(
+                    stats.topic_name, stats.age_s(now_ns), stats.rate_hz, stats.max_gap_s))
+                self.fault_this_loop = True
 
-            time_this_run = rospy.get_time()
-            time_delta = time_this_run - time_last_msg
-            time_last_msg = time_this_run
+        if self.wd_initialised and self.fault_this_loop:
+            self.wd_fault_detected = True
 
-            #
-            self.fault_this_loop = False
-            try:
-                if (self.state.header.stamp.secs + 2.5) < rospy.get_time():
-                    rospy.logwarn(('not receiving state message with time interval ', time_delta))
-                    self.fault_this_loop = True
-            except:
-                self.fault_this_loop = True
+        # watchdog is initised when all conditions are met
+        if not self.wd_initialised and not self.fault_this_loop:
+            rospy.loginfo('enabling watchdog')
+            self.wd_initialised = True
 
-            try:
-                if (self.local_position.header.stamp.secs + 2.0) < rospy.get_time():
-                    rospy.logwarn(('not receiving local position message with time interval ', time_delta))
-                    self.fault_this_loop = True
-            except:
-                self.fault_this_loop = True
+        self.publish_diagnostics()
 
-            ################################################### Check our state estimation status
-            if self.sem is State_estimation_method.UNKNOWN:
-                #
-                pass
+    def _watchdog_tick(self):
+        if rospy.is_shutdown() or not self._node_alive:
+            return
+        try:
+            self.watchdog_step()
+        finally:
+            self.scheduler.call_later(self.watchdog_period, self._watchdog_tick, name='watchdog')
 
-            if self.sem is State_estimation_method.MOCAP:
-                try:
-                    if (self.mocap_pose.header.stamp.secs + 2.0) < rospy.get_time():
-                        rospy.logwarn(('not receiving mocap message with time interval ', time_delta))
-                        self.fault_this_loop = True
-                except:
-                    self.fault_this_loop = True
-
-            if self.sem is State_estimation_method.GPS:
-                try:
-                    if (self.global_position.header.stamp.secs + 2.0) < rospy.get_time():
-                        rospy.logwarn(('not receiving global position message with time interval ', time_delta))
-                        self.fault_this_loop = True
-                except:
-                    self.fault_this_loop = True
-
-            if self.sem is State_estimation_method.OPTIC_FLOW:
-                try:
-                    if (self.optic_flow_raw.header.stamp.secs + 2.0) < rospy.get_time():
-                        rospy.logwarn((self.optic_flow_raw.header.stamp.secs + 2.0), rospy.get_time())
-                        rospy.logwarn(('not receiving optic flow message with time interval ', time_delta))
-                        self.fault_this_loop = True
-                except:
-                    self.fault_this_loop = True
-
-            if self.wd_initialised and self.fault_this_loop:
-                self.wd_fault_detected = True
-
-            # watchdog is initised when all conditions are met
-            if not self.wd_initialised and not self.fault_this_loop:
-                rospy.loginfo('enabling watchdog')
-                self.wd_initialised = True
+    def watchdog(self):
+        """
+        Runs the watchdog in the calling thread (the interface normally runs it on its scheduler)
+        """
+        rate = rospy.Rate(1.0 / self.watchdog_period)
+        while not rospy.is_shutdown() and self._node_alive:
+            self.watchdog_step()
 
             try:  # prevent garbage in console output when thread is killed
                 rate.sleep()
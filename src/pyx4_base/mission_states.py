@@ -9,17 +9,28 @@ All mission states should inherit from the 'Generic_mission_state'
 from __future__ import division
 
 from copy import copy
+import math
 import numpy as np
 import rospy
 import sys
+from threading import Lock
 
 from mavros_msgs.msg import PositionTarget
 from mavros_msgs.msg import ExtendedState
-from sensor_msgs.msg import NavSatFix
 
 from definitions_pyx4 import VALID_WAYPOINT_TYPES, TAKE_OFF_PHASE
-from setpoint_bitmasks import MASK_XY_POS__Z_POS_YAW_POS, MASK_XY_VEL__Z_VEL_YAW_POS, MASK_XY_VEL__Z_VEL_YAW_RATE
+from setpoint_bitmasks import MASK_XY_POS__Z_POS_YAW_POS, MASK_XY_VEL__Z_VEL_YAW_POS, MASK_XY_VEL__Z_VEL_YAW_RATE, \
+    MASK_XYZ_POS_XYZ_VEL_YAW_POS
 from utils import get_bitmask
+from async_service import get_default_service_caller
+from setpoint_message import Cached_position_target, as_cached_position_target, fill_position_target
+from deadline_scheduler import monotonic
+from trajectory import Min_jerk_trajectory
+import waypoint_acceptance
+
+# the attributes that mission states write the setpoint to - see Generic_mission_state.__setattr__
+SETPOINT_FIELDS = frozenset(('x', 'y', 'z', 'x_vel', 'y_vel', 'z_vel', 'yaw', 'yaw_rate', 'coordinate_frame',
+                             'type_mask', 'trajectory'))
 
 
 class Generic_mission_state(object):
@@ -27,8 +38,34 @@ class Generic_mission_state(object):
 
     Pyx4_base commander module handles timeout.
 
+    States write their setpoint to x, y, z, x_vel, y_vel, z_vel, yaw, yaw_rate, coordinate_frame and type_mask. The
+    commander commits these fields as one immutable snapshot after each step (see commit_setpoint) and the setpoint
+    publisher only ever reads the latest snapshot, so it never sees a half written setpoint and neither side locks.
+    States that change their setpoint from other threads (e.g. subscriber callbacks) mustn't write these fields - they
+    commit a new snapshot with update_setpoint instead.
+
+    States that read mavros topics beyond the interface's base profile should list their keys (see
+    mavros_interface.TOPIC_SPECS) in required_topics so that the interface subscribes to them.
+
     """
 
+    required_topics = ()
+
+    # how an event driven commander schedules step(): on every vehicle state update (wake_on_telemetry) and/or
+    # periodically at step_rate (Hz) - states that only wait for a timer or timeout can switch telemetry wakes off
+    wake_on_telemetry = True
+    step_rate = None
+
+    # set by the commander - wakes it when the state finishes from outside of step()
+    _wake_commander = None
+
+    # the setpoint worked out by prepare() - applied by pre_run so that it is live as soon as the state starts
+    _sp_template = None
+    prepared = False
+    exit_time = None    # monotonic time at which the state asked to be exited
+    _sp_dirty = True    # a setpoint field has changed since the last commit_setpoint
+    trajectory = None   # a trajectory (see trajectory.py) that the publisher samples for position and velocity
+
     def __init__(self,
                  flight_instruction_type='generic_mission_state',
                  timeout=10,
@@ -44,7 +81,10 @@ class Generic_mission_state(object):
 
         self.flight_instruction_type = flight_instruction_type
         self._timeout = timeout
-        self._setpoint_raw = PositionTarget()
+        self._setpoint_raw = Cached_position_target()
+        self._commit_lock = Lock()      # serialises writers - the publisher reads the snapshot without locking
+        self._sp_committed = (None, None)   # (setpoint snapshot, trajectory) - swapped as one reference
+        self._sp_raw_snapshot = None        # the snapshot that _setpoint_raw currently holds
 
         self.state_label = state_label
         self.timeout_OK = timeout_OK
@@ -52,16 +92,19 @@ class Generic_mission_state(object):
 
         # Initialise mission state setpoint with the previous states setpoint
         self.update_sp_locals()
+        self.commit_setpoint()
 
         # initialise local properties
         self._ros_message_node = mavros_message_node
         self._parent_ref = parent_ref
+        self._vehicle_state = None
         self.stay_alive = True
         self.preconditions_satisfied = False
         self._prerun_complete = False
         self.tol_distance = tol_distance
         self.tol_heading_deg = tol_heading_deg
         self.tol_heading_rad = np.deg2rad(tol_heading_deg)
+        self._timers = []
 
 
     def update_sp_locals(self):
@@ -80,7 +123,7 @@ class Generic_mission_state(object):
         self.type_mask = self._setpoint_raw.type_mask
 
 
-    def pre_run(self, parent_ref, ros_message_node=None, current_sp_raw=PositionTarget()):
+    def pre_run(self, parent_ref, ros_message_node=None, current_sp_raw=PositionTarget(), vehicle_state=None):
         """
         Do not overload this function!! (use precondition_check if customized initialisation functionality is required)
 
@@ -89,12 +132,52 @@ class Generic_mission_state(object):
         """
         self._ros_message_node = ros_message_node
         self._parent_ref = parent_ref
-        self._setpoint_raw = current_sp_raw
+        self._vehicle_state = vehicle_state
+        self._setpoint_raw = as_cached_position_target(current_sp_raw)
+        self._sp_raw_snapshot = None
+        self._sp_dirty = True
         self.update_sp_locals()
+        if self._sp_template is not None:
+            self.apply_setpoint_template(self._sp_template)
+        self.start_trajectory()
+        self.commit_setpoint()
         self._prerun_complete = True
         rospy.loginfo('prerun complete')
 
 
+    def prepare(self):
+        """
+        Work needed to start this state that doesn't depend on the state before it - run by the commander in the
+        background while the previous instruction is still active. Raises if the instruction is invalid.
+        """
+        self._sp_template = self.setpoint_template()
+        self.prepared = True
+
+
+    def start_trajectory(self):
+        """
+        Run by pre_run once the previous setpoint (self._setpoint_raw) is known - states that stream a trajectory from
+        the previous setpoint set self.trajectory here
+        """
+        pass
+
+
+    def setpoint_template(self):
+        """
+        The setpoint (x, y, z, x_vel, y_vel, z_vel, yaw, yaw_rate, coordinate_frame, type_mask) this state flies to if it
+        is known before the state starts, None if it depends on the vehicle state. A coordinate_frame of None keeps the
+        previous setpoint's frame
+        """
+        return None
+
+
+    def apply_setpoint_template(self, template):
+        (self.x, self.y, self.z, self.x_vel, self.y_vel, self.z_vel, self.yaw, self.yaw_rate,
+         coordinate_frame, self.type_mask) = template
+        if coordinate_frame is not None:
+            self.coordinate_frame = coordinate_frame
+
+
     # this is deprecated as of 20.05.2020
     # def pre_run_inherited(self):
     #     ''' placeholder for inherited staes to add a prerun function  '''
@@ -118,6 +201,44 @@ class Generic_mission_state(object):
         return self._timeout
 
 
+    @property
+    def stay_alive(self):
+        return self._stay_alive
+
+
+    @stay_alive.setter
+    def stay_alive(self, stay_alive):
+        self._stay_alive = stay_alive
+        if not stay_alive:
+            self.exit_time = monotonic()
+            if self._wake_commander is not None:
+                self._wake_commander()
+
+
+    def start_timer(self, delay, callback, *args):
+        """
+        One shot timer on the interface's deadline scheduler (rather than a rospy.Timer thread each) - timers that
+        haven't fired are cancelled by the commander when the state exits
+        """
+        handle = self._ros_message_node.scheduler.call_later(delay, callback, *args, name=self.flight_instruction_type)
+        self._timers = [timer for timer in self._timers if timer.active] + [handle]
+        return handle
+
+
+    def call_service_async(self, proxy, *args, **kwargs):
+        """
+        Makes a service call without blocking the commander - returns a Service_future that can be checked on later
+        ticks. kwargs (timeout, retries, retry_delay, check, name) are passed to Async_service_caller.submit
+        """
+        return get_default_service_caller().submit(proxy, args, **kwargs)
+
+
+    def cancel_timers(self):
+        for timer in self._timers:
+            self._ros_message_node.scheduler.cancel(timer)
+        self._timers = []
+
+
     @property
     def ros_message_node(self):
         return self._ros_message_node
@@ -128,50 +249,116 @@ class Generic_mission_state(object):
         self._ros_message_node = new_ros_msg_node
 
 
+    @property
+    def vehicle_state(self):
+        """
+        The vehicle state snapshot taken by the commander for this tick (falls back to the latest interface state if
+        the state is not being run by a commander)
+        """
+        if self._vehicle_state is not None:
+            return self._vehicle_state
+        return self._ros_message_node.vehicle_state
+
+
+    def __setattr__(self, name, value):
+        # flag setpoint changes so that only changed setpoints are committed (and re-serialised)
+        if name in SETPOINT_FIELDS and getattr(self, name, None) != value:
+            object.__setattr__(self, '_sp_dirty', True)
+        object.__setattr__(self, name, value)
+
+
+    def commit_setpoint(self):
+        """
+        Publishes the setpoint fields as a new snapshot - the reference swap is atomic so readers get either the old or
+        the new setpoint, never a mix
+        """
+        with self._commit_lock:
+            if self._sp_dirty:
+                self._sp_dirty = False
+                self._sp_committed = (self.setpoint_fields, self.trajectory)
+
+
+    def update_setpoint(self, update):
+        """
+        Commits update(snapshot) - a new setpoint tuple worked out from the last committed one - for states that change
+        their setpoint from other threads. The setpoint fields written by the commander thread aren't touched, and the
+        commit lock keeps the commander's commits from landing between reading and replacing the snapshot (a later
+        commit of changed setpoint fields by the commander does replace it)
+        """
+        with self._commit_lock:
+            snapshot, trajectory = self._sp_committed
+            self._sp_committed = (tuple(update(snapshot)), trajectory)
+
+
+    @property
+    def setpoint_snapshot(self):
+        """ the last committed setpoint, an immutable tuple in setpoint_fields order """
+        return self._sp_committed[0]
+
+
+    @property
+    def setpoint_streaming(self):
+        """ True while a committed trajectory is moving the setpoint """
+        trajectory = self._sp_committed[1]
+        return trajectory is not None and monotonic() < trajectory.end_time
+
+
+    def setpoint_message(self):
+        """ a new PositionTarget holding the last committed setpoint (sampled now if it is a trajectory) """
+        snapshot, trajectory = self._sp_committed
+        msg = fill_position_target(Cached_position_target(), snapshot)
+        if trajectory is not None:
+            trajectory.fill(msg, monotonic())
+        return msg
+
+
     @property
     def sp_raw(self):
-        self._setpoint_raw.position.x = self.x
-        self._setpoint_raw.position.y = self.y
-        self._setpoint_raw.position.z = self.z
-        self._setpoint_raw.velocity.x = self.x_vel
-        self._setpoint_raw.velocity.y = self.y_vel
-        self._setpoint_raw.velocity.z = self.z_vel
-        self._setpoint_raw.yaw = self.yaw
-        self._setpoint_raw.yaw_rate = self.yaw_rate
-        self._setpoint_raw.coordinate_frame = self.coordinate_frame
-        self._setpoint_raw.type_mask = self.type_mask  # 1027
+        """
+        The last committed setpoint as a PositionTarget - this message is reused by the setpoint publisher thread,
+        use setpoint_message() for a copy
+        """
+        snapshot, trajectory = self._sp_committed
+        if trajectory is not None and monotonic() < trajectory.end_time:
+            # streamed - the position and velocity change on every publish
+            trajectory.fill(fill_position_target(self._setpoint_raw, snapshot), monotonic()).mark_dirty()
+            self._sp_raw_snapshot = None
+        elif snapshot is not self._sp_raw_snapshot:
+            fill_position_target(self._setpoint_raw, snapshot).mark_dirty()
+            self._sp_raw_snapshot = snapshot
 
         self._setpoint_raw.header.stamp = rospy.Time.now()
 
         return self._setpoint_raw
 
 
+    @property
+    def setpoint_fields(self):
+        """ the setpoint as a tuple in setpoint_template order - cheap to compare, no message is built """
+        return (self.x, self.y, self.z, self.x_vel, self.y_vel, self.z_vel, self.yaw, self.yaw_rate,
+                self.coordinate_frame, self.type_mask)
+
+
     @staticmethod
     def heading_error_rad(x, y):
-        # todo - is there already a tf function for this?
         '''
         returns the heading error of the UAV in radians
         :param x:
         :param y:
         :return:
         '''
-        return min((2 * np.pi) - abs(x - y), abs(x - y))
+        return waypoint_acceptance.heading_error_rad(x, y)
 
 
     @property
     def sp_error_yaw(self):
-        # todo - is there already a tf function for this?
-        return self.heading_error_rad(self._ros_message_node.yaw_local, self.yaw)
+        return waypoint_acceptance.heading_error_rad(self.vehicle_state.yaw, self.yaw)
 
 
     @property
     def sp_error_xyz(self):
-        # todo - is there already a tf function for this?
-        a = np.array((self.x, self.y, self.z))
-
-        b = np.array((self._ros_message_node.local_x, self._ros_message_node.local_y, self._ros_message_node.local_z))
-        distance = np.linalg.norm(a - b).round(decimals=3)
-        return distance
+        vs = self.vehicle_state
+        return math.sqrt(waypoint_acceptance.distance_sq(self.x, self.y, self.z, vs.x, vs.y, vs.z))
 
 
     @property
@@ -183,7 +370,9 @@ class Generic_mission_state(object):
         # todo 1, parse the tolorences from mission and add ability to set a generic default for all waypoints of a mission
         # todo 2, add a timer so that the time that a waypoint has been held for can be measured
 
-        return ((self.sp_error_xyz) < self.tol_distance and (self.sp_error_yaw < self.tol_heading_rad))
+        vs = self.vehicle_state
+        return waypoint_acceptance.within_tolerance(vs.x, vs.y, vs.z, vs.yaw, self.x, self.y, self.z, self.yaw,
+                                                    self.tol_distance, self.tol_heading_rad)
 
 
     def step(self):
@@ -223,6 +412,10 @@ class Waypoint_state(Generic_mission_state):
     # timeout is exceeded
     # external mission increment
 
+    With smooth=True (position waypoints only) the setpoint isn't moved straight to the waypoint - a min jerk
+    trajectory from the previous setpoint, limited by max_vel, max_acc and max_jerk, is streamed as position and
+    velocity setpoints instead (see trajectory.py).
+
     """
 
     def __init__(self,
@@ -247,11 +440,17 @@ class Waypoint_state(Generic_mission_state):
                  to_altitude_tgt=2.0,
                  heading_tgt_rad=None,
                  parent_ref=None,
+                 smooth=False,                    # stream a min jerk trajectory to the waypoint
+                 max_vel=5.0,                     # trajectory limits (m/s, m/s^2, m/s^3) - the px4 defaults for
+                 max_acc=3.0,                     # MPC_XY_CRUISE, MPC_ACC_HOR and MPC_JERK_AUTO
+                 max_jerk=4.0,
                  **kwargs
                  ):
 
         assert (waypoint_type in VALID_WAYPOINT_TYPES), \
             'unrecognised waypoint type {} valid instructions are {}'.format(waypoint_type, VALID_WAYPOINT_TYPES)
+        assert not smooth or (xy_type == 'pos' and z_type == 'pos' and yaw_type == 'pos'), \
+            'smooth waypoints must be position control in all axis'
         self.waypoint_type = waypoint_type
         self.xy_type = xy_type
         self.x_setpoint = x_setpoint
@@ -264,11 +463,18 @@ class Waypoint_state(Generic_mission_state):
         self.yaw_setpoint = yaw_setpoint
         # self.pos_tol = pos_tol
         # self.tol_heading_deg = tol_heading_deg
-        self.coordinate_frame = coordinate_frame
+        # not published - waypoints keep the coordinate frame of the setpoint before them (see setpoint_template)
+        self.wpt_coordinate_frame = coordinate_frame
         self.wpt_typemask = get_bitmask(self.xy_type, self.z_type, self.yaw_type)
         print ('generate bitmask {} for waypoint type {} with xy_typ: {} z_type {} and yaw type: {}'
                .format(self.wpt_typemask, waypoint_type, xy_type, z_type, yaw_type))
         self.update_status_rate = update_status_rate
+        self.smooth = smooth
+        self.max_vel = max_vel
+        self.max_acc = max_acc
+        self.max_jerk = max_jerk
+        if smooth:
+            self.wpt_typemask = np.uint16(MASK_XYZ_POS_XYZ_VEL_YAW_POS)
 
         super(Waypoint_state, self).__init__(
                                         flight_instruction_type=flight_instruction_type,
@@ -308,48 +514,61 @@ class Waypoint_state(Generic_mission_state):
                          .format(self.x_setpoint, self.y_setpoint, self.z_setpoint, self.yaw_setpoint)) )
 
 
-    def step(self):
+    def setpoint_template(self):
 
         # when both z_vel and z_pos targets the type mask is influenced by the other field. Thus we set the either vel
         # or pos setpoints to zero depending on which is unused.  X/Y/yaw don't seem to be affected in the same way but
         # we take the same approach here for commonality / in case it is just more difficult to spot
         # should handle the axis control
         if self.xy_type == 'pos':
-            self.x = self.x_setpoint
-            self.y = self.y_setpoint
-            self.x_vel = 0.0
-            self.y_vel = 0.0
+            x, y, x_vel, y_vel = self.x_setpoint, self.y_setpoint, 0.0, 0.0
         elif self.xy_type == 'pos_with_vel':
-            self.x = self.x_setpoint
-            self.y = self.y_setpoint
-            rospy.logwarn_throttle(2, 'the velocity capping in this state doesnae work')
-            rospy.logwarn_throttle(2, 'setting x_vel {} & y_vel {} type mask is {}'
-                                   .format(self.x_vel, self.y_vel, self.wpt_typemask))
-            self.x_vel = self.x_vel_setpoint
-            self.y_vel = self.y_vel_setpoint
-
+            x, y, x_vel, y_vel = self.x_setpoint, self.y_setpoint, self.x_vel_setpoint, self.y_vel_setpoint
         else:
-            self.x = 0.0
-            self.y = 0.0
-            self.x_vel = self.x_setpoint
-            self.y_vel = self.y_setpoint
+            x, y, x_vel, y_vel = 0.0, 0.0, self.x_setpoint, self.y_setpoint
 
         if self.z_type == 'pos':
-            self.z = self.z_setpoint
-            self.z_vel = 0.0
+            z, z_vel = self.z_setpoint, 0.0
         else:
-            self.z = 0.0
-            self.z_vel = self.z_setpoint
+            z, z_vel = 0.0, self.z_setpoint
 
         if self.yaw_type == 'pos':
-            self.yaw = self.yaw_setpoint
-            self.yaw_rate = 0.0
+            yaw, yaw_rate = self.yaw_setpoint, 0.0
+        else:
+            yaw, yaw_rate = 0.0, self.yaw_setpoint
+
+        # resolved here so that a malformed instruction (e.g. a csv setpoint that isn't a number) is found in advance
+        return (float(x), float(y), float(z), float(x_vel), float(y_vel), float(z_vel), float(yaw), float(yaw_rate),
+                None, self.wpt_typemask)
+
+
+    def start_trajectory(self):
+        if not self.smooth:
+            return
+        previous = self._setpoint_raw
+        if previous.type_mask & (PositionTarget.IGNORE_PX | PositionTarget.IGNORE_PY | PositionTarget.IGNORE_PZ):
+            # the previous setpoint wasn't a position - start from where the vehicle is
+            vs = self.vehicle_state
+            start = (vs.x, vs.y, vs.z)
         else:
-            self.yaw = 0.0
-            self.yaw_rate = self.yaw_setpoint
+            start = (previous.position.x, previous.position.y, previous.position.z)
+        self.trajectory = Min_jerk_trajectory.between(start, (self.x_setpoint, self.y_setpoint, self.z_setpoint),
+                                                      monotonic(), self.max_vel, self.max_acc, self.max_jerk)
+        if self.trajectory is not None and self.trajectory.duration > self.timeout:
+            rospy.logwarn('trajectory to {} takes {:.1f}s - longer than its timeout of {}s'.format(
+                self.state_label, self.trajectory.duration, self.timeout))
 
-        self.coordinate_frame = self.coordinate_frame
-        self.type_mask = self.wpt_typemask
+
+    def step(self):
+
+        if self._sp_template is None:
+            self._sp_template = self.setpoint_template()
+        self.apply_setpoint_template(self._sp_template)
+
+        if self.xy_type == 'pos_with_vel':
+            rospy.logwarn_throttle(2, 'the velocity capping in this state doesnae work')
+            rospy.logwarn_throttle(2, 'setting x_vel {} & y_vel {} type mask is {}'
+                                   .format(self.x_vel, self.y_vel, self.wpt_typemask))
 
         rospy.loginfo_throttle(self.update_status_rate, ('waypoint_type {}  xy_type {} z_type {} yaw type {} mask {}'
                                .format(self.waypoint_type, self.xy_type, self.z_type, self.yaw_type, self.type_mask)))
@@ -359,16 +578,17 @@ class Waypoint_state(Generic_mission_state):
                                                          self.y_setpoint,
                                                          self.z_setpoint,
                                                          self.yaw_setpoint)))
+        vs = self.vehicle_state
         rospy.loginfo_throttle(self.update_status_rate, (
-            'cuurent x: {}  y: {} z: {} yaw: {}'.format(self._ros_message_node.local_x,
-                                                        self._ros_message_node.local_y,
-                                                        self._ros_message_node.local_z,
-                                                        self._ros_message_node.yaw_local)))
+            'cuurent x: {}  y: {} z: {} yaw: {}'.format(vs.x,
+                                                        vs.y,
+                                                        vs.z,
+                                                        vs.yaw)))
         rospy.loginfo_throttle(self.update_status_rate, (
-            'delta x: {}  y: {} z: {} yaw: {}'.format(self._ros_message_node.local_x - self.x_setpoint,
-                                                        self._ros_message_node.local_y - self.y_setpoint,
-                                                        self._ros_message_node.local_z - self.z_setpoint,
-                                                        self._ros_message_node.yaw_local - self.yaw_setpoint)))
+            'delta x: {}  y: {} z: {} yaw: {}'.format(vs.x - self.x_setpoint,
+                                                        vs.y - self.y_setpoint,
+                                                        vs.z - self.z_setpoint,
+                                                        vs.yaw - self.yaw_setpoint)))
         if self.waypoint_type == 'pos' or self.waypoint_type == 'pos_with_vel':
             if self.waypoint_reached:
                 self.stay_alive = False
@@ -386,6 +606,10 @@ class Hold_pos_state(Generic_mission_state):
 
     """
 
+    # the setpoint is fixed once the preconditions are met - the state just waits for its timeout
+    wake_on_telemetry = False
+    step_rate = 1
+
     def __init__(self,
                  flight_instruction_type='Hold_position',
                  state_label='generic pos hold',                 # waypoint state labels are mandatory
@@ -426,9 +650,10 @@ class Hold_pos_state(Generic_mission_state):
         until self.preconditions_satisfied == True
         '''
         # start test with True then run a series of tests
-        self.x_setpoint = self._ros_message_node.local_x
-        self.y_setpoint = self._ros_message_node.local_y
-        self.z_setpoint = self._ros_message_node.local_z
+        vs = self.vehicle_state
+        self.x_setpoint = vs.x
+        self.y_setpoint = vs.y
+        self.z_setpoint = vs.z
 
         # set velocities to 0
         self.x_vel = 0.0
@@ -441,7 +666,7 @@ class Hold_pos_state(Generic_mission_state):
             self.yaw_setpoint = self.yaw_setpoint_rqd
         else:
             rospy.loginfo('No yaw setpoint provided - using current heading')
-            self.yaw_setpoint = np.deg2rad(self._ros_message_node.yaw_local)
+            self.yaw_setpoint = np.deg2rad(self.vehicle_state.yaw)
 
         rospy.loginfo(self.return_hpt_str())
         self.preconditions_satisfied = True
@@ -516,11 +741,12 @@ class Take_off_state(Generic_mission_state):
         if self._prerun_complete:
             try:
                 # rospy.sleep(1.0)
-                self.start_x = copy(self._ros_message_node.local_x)
-                self.start_y = copy(self._ros_message_node.local_y)
-                self.start_z = copy(self._ros_message_node.local_z)
+                vs = self.vehicle_state
+                self.start_x = vs.x
+                self.start_y = vs.y
+                self.start_z = vs.z
                 if self.heading_tgt_rad is None:
-                    self.heading_tgt_rad = copy(self._ros_message_node.yaw_local)
+                    self.heading_tgt_rad = vs.yaw
                 self.preconditions_satisfied = True
                 rospy.loginfo('takeoff target: {} start z: {}'.format(self.to_altitude_tgt, self.start_z))
 
@@ -532,7 +758,7 @@ class Take_off_state(Generic_mission_state):
             # get current location
 
 
-    def in_range_timer_cb(self, timer_event):
+    def in_range_timer_cb(self, timer_event=None):
         self.settled_at_setpoint = True
 
 
@@ -558,47 +784,43 @@ class Take_off_state(Generic_mission_state):
         # phase 1 - get off the ground
         if self.take_off_phase == TAKE_OFF_PHASE.CLEAR_THE_GROUND:
 
-            self._ros_message_node.setpoint_lock.acquire()
             self.type_mask = MASK_XY_VEL__Z_VEL_YAW_RATE
             self.x_vel = 0.0
             self.y_vel = 0.0
             self.z_vel = self.take_off_vel #self.vel_ramp_tgt     #self.tgt_hgt
             self.z = self.tgt_hgt
             self.yaw_rate = 0.0  # self.heading_tgt_rad
-            self._ros_message_node.setpoint_lock.release()
 
             # once we're off the ground then go to waypoint
-            if self._ros_message_node.local_z > (0.8 * self.tgt_hgt):
-                rospy.loginfo('Ground cleared, height is {}'.format(self._ros_message_node.local_z))
+            if self.vehicle_state.z > (0.8 * self.tgt_hgt):
+                rospy.loginfo('Ground cleared, height is {}'.format(self.vehicle_state.z))
                 self.take_off_phase = TAKE_OFF_PHASE.GO_TO_WPT
 
         else:
             # phase 2 - go to waypoint
-            self._ros_message_node.setpoint_lock.acquire()
             self.x = self.start_x
             self.y = self.start_y
             self.z = self.tgt_hgt
             self.z_vel = 0   # if we don't set z_vel to 0 then this seems
             self.yaw = self.heading_tgt_rad  # self.heading_tgt_rad
             self.type_mask = MASK_XY_POS__Z_POS_YAW_POS
-            self._ros_message_node.setpoint_lock.release()
 
             if self.waypoint_reached:
                 if not self.timer_active:
                     self.timer_active = True
                     # should the state be held for 2s, or perhaps just wait 2s after take off?
-                    self.in_range_timer = rospy.Timer(period=rospy.Duration(2), callback=self.in_range_timer_cb, oneshot=True)
+                    self.in_range_timer = self.start_timer(2, self.in_range_timer_cb)
 
             else:
                 if self.timer_active:
-                    self.in_range_timer.shutdown()
+                    self._ros_message_node.scheduler.cancel(self.in_range_timer)
                     self.timer_active = False
 
             if self.settled_at_setpoint:
                 rospy.loginfo(('takeoff conditions met, local position is {} {} {} yaw {}'.format(self.x, self.y, self.z, self.yaw)))
                 self.stay_alive = False
 
-        if not self._ros_message_node.state.armed:
+        if not self.vehicle_state.armed:
             rospy.logerr("can't takeoff if not armed")
             # todo - implement quit mission flag
             self.stay_alive = False
@@ -611,14 +833,22 @@ class Take_off_state(Generic_mission_state):
 class Arming_state(Generic_mission_state):
     """
     A mission state that handles the task of taking off from the ground in offboard mode
+
+    Mode and arming requests are made asynchronously so the commander keeps running while the FCU responds - the
+    state finishes as soon as the FCU reports that it is armed.
     """
 
+    # the gps fix is checked before arming
+    required_topics = ('gps_raw_fix',)
+
     def __init__(self,
                  flight_instruction_type='Arming',
                  state_label='arming - generic',
                  timeout=60,
                  timeout_OK=False,
                  mavros_message_node=None,
+                 request_period=1.0,      # how often (s) a mode / arming request is repeated until the FCU complies
+                 service_timeout=5.0,     # how long (s) each service call may take
                  **kwargs
                  ):
 
@@ -637,41 +867,30 @@ class Arming_state(Generic_mission_state):
         self.type_mask = MASK_XY_VEL__Z_VEL_YAW_RATE   # to match takeoff state
         self.coordinate_frame = PositionTarget.FRAME_LOCAL_NED
 
+        self.request_period = request_period
+        self.service_timeout = service_timeout
+        self.set_mode_future = None
+        self.arming_future = None
+
 
     def precondition_check(self):
 
         # check we are landed
         # todo - if we are already airborne/armed then passthrough this state
 
-        self.mission_state_busy = True
-        self.checking_pre_conditions = True
-
         if self._prerun_complete:
 
             ready_to_arm = True
 
-            if self._ros_message_node.extended_state.landed_state != ExtendedState.LANDED_STATE_ON_GROUND:
-                rospy.logwarn('landed_state is currently {}'.format(self._ros_message_node.extended_state.landed_state))
+            if self.vehicle_state.landed_state != ExtendedState.LANDED_STATE_ON_GROUND:
+                rospy.logwarn_throttle(1, 'landed_state is currently {}'.format(self.vehicle_state.landed_state))
                 ready_to_arm = False
 
-            # todo - this is depricated, remove once tested 13.8.19
-            # try:
-            #     rospy.wait_for_service('mavros/set_mode', 10)
-            #     # self.set_mode_srv = rospy.ServiceProxy('mavros/set_mode', SetMode)
-            # except:
-            #     ready_to_arm = False
-            #
-            # try:
-            #     rospy.wait_for_service('mavros/cmd/arming', 10)
-            #     # self.set_arming_srv = rospy.ServiceProxy('mavros/cmd/arming', CommandBool)
-            # except:
-            #     ready_to_arm = False
-
-            try:
-                rospy.wait_for_message('mavros/global_position/raw/fix', NavSatFix ,30)
-                # self.set_arming_srv = rospy.ServiceProxy('mavros/cmd/arming', CommandBool)
-            except:
-                rospy.logwarn('sat nav signal not present')
+            # the gps fix topic is subscribed to by the interface (see required_topics) - if it hasn't been received
+            # yet we check again next tick rather than blocking, the state's timeout bounds how long we wait
+            gps_stats = self._ros_message_node.get_topic_stats('gps_raw_fix')
+            if gps_stats is None or gps_stats.count == 0:
+                rospy.logwarn_throttle(1, 'sat nav signal not present')
                 ready_to_arm = False
 
             self.preconditions_satisfied = ready_to_arm
@@ -681,68 +900,48 @@ class Arming_state(Generic_mission_state):
         else:
             rospy.logwarn_throttle(1, 'prerun not complete for arming state')
 
-        self.mission_state_busy = False
+
+    def _request_due(self, future):
+        """ True if there is no request in flight and the last one finished at least request_period ago """
+        return future is None or (future.done and future.since_done() >= self.request_period)
 
 
     def step(self, required_mode='OFFBOARD'):
         """ """
 
-        self.mission_state_busy = True
+        vs = self.vehicle_state
 
         if self._parent_ref.robot_type == 'SITL':
-            if self._ros_message_node.state.armed:
+            if vs.armed:
                 rospy.loginfo('Armed')
                 self.stay_alive = False
             else:
-                if self._ros_message_node.state.mode != required_mode:
-                    try:
-                        # self.setting_flight_mode = True
+                if vs.mode != required_mode:
+                    if self._request_due(self.set_mode_future):
                         rospy.loginfo('attempting to go into offboard mode')
-                        rospy.loginfo('mission_state busy 1 {}'.format(self.mission_state_busy))
-                        res = self._ros_message_node.set_mode_srv(0, required_mode)  # 0 is custom mode
-                        rospy.sleep(1)  # we wait a while for the state to be updated in the FCU
-                        # rospy.loginfo('mission_state got response {} - still busy? {}'.format(res.mode_sent, self.mission_state_busy))
-                        if not res.mode_sent:
-                            rospy.logwarn("failed to send mode command")
-                            # self.setting_flight_mode = False
-                    except Exception as e:
-                        rospy.logerr('failed to set mode to offboard because '.format(e))
-                        # self.setting_flight_mode = False
-                        self.mission_state_busy = False
+                        self.set_mode_future = self.call_service_async(
+                            self._ros_message_node.set_mode_srv, 0, required_mode,   # 0 is custom mode
+                            timeout=self.service_timeout, check=lambda res: res.mode_sent, name='set_mode')
 
                 # then attempt to arm
-                if self._ros_message_node.state.mode == required_mode:
-                    pass
-                    if not self._ros_message_node.state.armed:
-                        try:
-                            rospy.loginfo('attempting to arm')
-                            res = self._ros_message_node.set_arming_srv(True)
-                            rospy.sleep(1) # we wait a while for the state to be updated in the FCU
-                            if not res.success:
-                                rospy.logerr("failed to send arm command")
-                                rospy.loginfo(res)
-                            else:
-                                rospy.loginfo("Arm command sent")
-
-                        except Exception as e:
-                            rospy.logerr('failed to arm vehicle because '.format(e))
-                            self.arming_in_progress = False
-                            self.mission_state_busy = False
+                elif self._request_due(self.arming_future):
+                    rospy.loginfo('attempting to arm')
+                    self.arming_future = self.call_service_async(
+                        self._ros_message_node.set_arming_srv, True,
+                        timeout=self.service_timeout, check=lambda res: res.success, name='arming')
 
         elif self._parent_ref.robot_type == 'REAL':
 
-            if self._ros_message_node.state.mode == required_mode and self._ros_message_node.state.armed:
+            if vs.mode == required_mode and vs.armed:
                 rospy.loginfo("Real flight controller is offboard and armed - here we go!")
                 self.stay_alive = False
 
             else:
                 rospy.loginfo_throttle(5, "Real flight controller is in mode {} and armed status is {}"
-                                       .format(self._ros_message_node.state.mode, self._ros_message_node.state.armed))
+                                       .format(vs.mode, vs.armed))
         else:
             rospy.logerr('unknown robot type {}'.format(self._parent_ref.robot_type))
 
-        self.mission_state_busy = False
-
 
 class Landing_state(Generic_mission_state):
     """
@@ -771,11 +970,12 @@ class Landing_state(Generic_mission_state):
 
         if self._prerun_complete:
             try:
-                self.start_x = copy(self._ros_message_node.local_x)
-                self.start_y = copy(self._ros_message_node.local_y)
-                self.start_z = copy(self._ros_message_node.local_z)
+                vs = self.vehicle_state
+                self.start_x = vs.x
+                self.start_y = vs.y
+                self.start_z = vs.z
                 if self.heading_tgt_rad is None:
-                    self.heading_tgt_rad = copy(self._ros_message_node.yaw_local)
+                    self.heading_tgt_rad = vs.yaw
                 self.preconditions_satisfied = True
             except Exception as e:
 
@@ -792,13 +992,16 @@ class Landing_state(Generic_mission_state):
         self.coordinate_frame = PositionTarget.FRAME_LOCAL_NED
         self.type_mask = MASK_XY_VEL__Z_VEL_YAW_POS         # since MASK_XY_POS__Z_VEL_YAW_POS doesn't seem to work
 
-        if self._ros_message_node.extended_state.landed_state == ExtendedState.LANDED_STATE_ON_GROUND:
+        if self.vehicle_state.landed_state == ExtendedState.LANDED_STATE_ON_GROUND:
             rospy.logwarn('Landed state satisfied')
             self.stay_alive = False
 
 
 class Idle_state(Generic_mission_state):
 
+    wake_on_telemetry = False
+    step_rate = 1
+
     def __init__(self,
                  flight_instruction_type='Idle',
                  state_label='Idle_state',
@@ -829,6 +1032,9 @@ class Post_run_state(Generic_mission_state):
     todo: this state is not working reliably
     """
 
+    wake_on_telemetry = False
+    step_rate = 2
+
     def __init__(self,
                  flight_instruction_type='Post run',
                  state_label='post run - generic',
@@ -859,11 +1065,11 @@ class Post_run_state(Generic_mission_state):
                     ( self._ros_message_node.extended_state.landed_state == ExtendedState.LANDED_STATE_ON_GROUND):
                 rospy.logwarn('on ground and disarmed - shutting ros down now')
 
-                self.ros_shutdown_timer = rospy.Timer(rospy.Duration(5), self.ros_shutdown_timer_cb, oneshot=True)
+                self.ros_shutdown_timer = self.start_timer(5, self.ros_shutdown_timer_cb)
                 self.preconditions_satisfied = True
 
 
-    def ros_shutdown_timer_cb(self, timer_event):
+    def ros_shutdown_timer_cb(self, timer_event=None):
         self.ready_to_shutdown = True
 
 
@@ -0,0 +1,104 @@
+#!/usr/bin/env python2
+"""
+Changes a running mission over ROS.
+
+Updates are published as json on the ~mission_updates topic (std_msgs/String), e.g.
+
+    {"op": "append", "instructions": [{"type": "waypoint", "instruction_type": "pos", "xy_type": "pos",
+                                       "x_setpoint": 5, "y_setpoint": 0, "z_type": "pos", "z_setpoint": 3,
+                                       "yaw_type": "pos", "yaw_setpoint": 0, "coordinate_frame": 1, "timeout": 30}]}
+
+op is one of append, insert (before "index") or replace (from "index", default: everything after the active
+instruction). Waypoints use the same fields as a mission csv row, plus an optional "smooth". Every instruction of an update is built and
+validated before the mission is changed, so an update is applied completely or not at all. The outcome of each
+update is published as json on ~mission_update_result.
+"""
+
+import json
+
+import rospy
+from std_msgs.msg import String
+
+from mission_states import Hold_pos_state, Landing_state
+from generate_mission import waypoint_from_row
+
+MISSION_UPDATE_OPS = ('append', 'insert', 'replace')
+
+
+def _waypoint(spec):
+    return waypoint_from_row(spec, state_label=spec.get('state_label', 'waypoint_update'),
+                             smooth=bool(spec.get('smooth', False)))
+
+
+# {instruction "type": function building the mission state from the instruction's json dictionary}
+INSTRUCTION_BUILDERS = {
+    'waypoint': _waypoint,
+    'hold': lambda spec: Hold_pos_state(**spec),
+    'landing': lambda spec: Landing_state(**spec),
+}
+
+
+def instructions_from_specs(specs):
+    instructions = []
+    for spec in specs:
+        spec = dict(spec)
+        instruction_type = spec.pop('type', 'waypoint')
+        if instruction_type not in INSTRUCTION_BUILDERS:
+            raise ValueError('unknown instruction type {} - options are {}'.format(
+                instruction_type, sorted(INSTRUCTION_BUILDERS.keys())))
+        instructions.append(INSTRUCTION_BUILDERS[instruction_type](spec))
+    return instructions
+
+
+def parse_mission_update(data):
+    """
+    Returns (op, index, instructions) from a json mission update - raises ValueError if it isn't valid
+    """
+    update = json.loads(data)
+    if not isinstance(update, dict):
+        raise ValueError('a mission update must be a json object')
+    op = update.get('op')
+    if op not in MISSION_UPDATE_OPS:
+        raise ValueError('unknown op {} - options are {}'.format(op, MISSION_UPDATE_OPS))
+    index = update.get('index')
+    if op == 'insert' and index is None:
+        raise ValueError('insert needs an index')
+    try:
+        instructions = instructions_from_specs(update.get('instructions', []))
+    except (KeyError, TypeError, AssertionError) as e:
+        raise ValueError('invalid instruction: {!r}'.format(e))
+    return op, index, instructions
+
+
+def apply_mission_update(commander, op, index, instructions):
+    if op == 'append':
+        commander.append_instructions(instructions)
+    elif op == 'insert':
+        commander.insert_instructions(index, instructions)
+    else:
+        commander.replace_instructions(instructions, from_idx=index)
+
+
+class Mission_update_listener(object):
+    """
+    Applies the mission updates received on <topic_prefix>mission_updates to a commander
+    """
+
+    def __init__(self, commander, topic_prefix='~'):
+        self.commander = commander
+        self.updates_applied = 0
+        self.result_pub = rospy.Publisher(topic_prefix + 'mission_update_result', String, queue_size=5)
+        self.update_sub = rospy.Subscriber(topic_prefix + 'mission_updates', String, self.mission_update_callback)
+
+    def mission_update_callback(self, msg):
+        result = {'ok': True, 'error': ''}
+        try:
+            op, index, instructions = parse_mission_update(msg.data)
+            apply_mission_update(self.commander, op, index, instructions)
+            self.updates_applied += 1
+            result.update(op=op, count=len(instructions))
+        except (ValueError, TypeError) as e:
+            rospy.logerr('rejected mission update: {}'.format(e))
+            result.update(ok=False, error=str(e))
+        result['mission_idx'] = self.commander.mission_idx
+        self.result_pub.publish(String(json.dumps(result)))
@@ -0,0 +1,152 @@
+#!/usr/bin/env python2
+"""
+An indexed cache of the FCU parameters.
+
+Reading parameters one at a time through mavros/param/get costs a round trip to the FCU each (plus the retries and
+sleeps around it). Instead the whole parameter set is pulled once with mavros/param/pull - mavros then mirrors every
+parameter on the ROS parameter server under mavros/param - after which reads are dictionary lookups. Parameters that
+change on the FCU are updated from mavros/param/param_value, and single parameters that are missing from the pull
+fall back to mavros/param/get. A pull that fails isn't retried by every read - reads go straight to mavros/param/get
+until pull_retry_period has passed.
+"""
+
+from __future__ import division
+
+from threading import Lock
+
+import rospy
+from mavros_msgs.srv import ParamPull
+
+from deadline_scheduler import monotonic
+
+try:
+    from mavros_msgs.msg import Param
+except ImportError:  # older mavros versions don't publish parameter updates
+    Param = None
+
+
+def param_value_to_python(value):
+    """ mavros_msgs/ParamValue -> int or float (mavros sets whichever of integer / real isn't used to 0) """
+    if value.integer != 0 or value.real == 0.0:
+        return value.integer
+    return value.real
+
+
+class Param_cache(object):
+    """
+    Cached FCU parameters - names are the PX4 parameter names e.g. 'EKF2_HGT_MODE'
+
+    pull_srv_name: the mavros/param/pull service
+    param_ns: the ROS parameter namespace mavros mirrors the parameters to (mavros/param)
+    param_value_topic: the mavros/param/param_value topic used to invalidate changed parameters
+    get_param_srv, set_param_srv: mavros/param/get and mavros/param/set service proxies
+    pull_retry_period: how long (s) after a failed pull get() waits before pulling again
+    """
+
+    def __init__(self, pull_srv_name, param_ns, param_value_topic=None, get_param_srv=None, set_param_srv=None,
+                 pull_attempts=3, pull_timeout=30, pull_retry_period=60.0):
+        self.pull_srv_name = pull_srv_name
+        self.param_ns = param_ns
+        self.get_param_srv = get_param_srv
+        self.set_param_srv = set_param_srv
+        self.pull_attempts = pull_attempts
+        self.pull_timeout = pull_timeout
+        self.pull_retry_period = pull_retry_period
+
+        self._params = {}
+        self._lock = Lock()
+        self.fetched = False
+        self.fetch_count = 0
+        self._pull_failed_time = None   # monotonic time of the last failed pull
+
+        self._param_value_sub = None
+        if param_value_topic is not None and Param is not None:
+            self._param_value_sub = rospy.Subscriber(param_value_topic, Param, self._param_value_callback)
+
+    def __len__(self):
+        return len(self._params)
+
+    def __contains__(self, name):
+        return name in self._params
+
+    def fetch(self, force=False):
+        """
+        Pulls the full parameter set from the FCU - returns True if the cache was (re)populated. Without force nothing
+        is pulled within pull_retry_period of a failed pull
+        """
+        with self._lock:
+            if self.fetched and not force:
+                return True
+            if not (force or self.pull_due):
+                return False
+
+            for attempt in range(self.pull_attempts):
+                try:
+                    rospy.wait_for_service(self.pull_srv_name, timeout=self.pull_timeout)
+                    res = rospy.ServiceProxy(self.pull_srv_name, ParamPull)(force_pull=force)
+                    if res.success:
+                        params = rospy.get_param(self.param_ns, {})
+                        self._params.update(params)
+                        self.fetched = True
+                        self.fetch_count += 1
+                        self._pull_failed_time = None
+                        rospy.loginfo('fetched {} parameters from the FCU'.format(len(params)))
+                        return True
+                    rospy.logwarn('parameter pull failed on attempt {}'.format(attempt))
+                except (rospy.ROSException, rospy.ServiceException) as e:
+                    rospy.logwarn('parameter pull failed on attempt {}: {}'.format(attempt, e))
+            self._pull_failed_time = monotonic()
+            return False
+
+    @property
+    def pull_due(self):
+        """ True if get() should try pulling the parameter set - not yet fetched, and no recent failed pull """
+        if self.fetched:
+            return False
+        failed_time = self._pull_failed_time
+        return failed_time is None or monotonic() - failed_time >= self.pull_retry_period
+
+    def get(self, name, default=None):
+        """
+        Returns the cached value of a parameter - the parameter set is pulled on first use and parameters that
+        weren't part of the pull (or all of them, while pulls are failing) are read individually
+        """
+        value = self._params.get(name)
+        if value is not None:
+            return value
+
+        if self.pull_due:
+            self.fetch()
+            value = self._params.get(name)
+            if value is not None:
+                return value
+
+        if self.get_param_srv is not None:
+            try:
+                res = self.get_param_srv(name)
+                if res.success:
+                    value = self._params[name] = param_value_to_python(res.value)
+                    return value
+            except rospy.ServiceException as e:
+                rospy.logwarn("couldn't read param {}: {}".format(name, e))
+        return default
+
+    def set(self, name, value):
+        """
+        Sets a parameter (a mavros_msgs/ParamValue) on the FCU and updates the cache with the value it reports back
+        """
+        res = self.set_param_srv(name, value)
+        if res.success:
+            self._params[name] = param_value_to_python(res.value)
+        return res
+
+    def invalidate(self, name=None):
+        """ drops one parameter (or all of them) so that the next read goes back to the FCU """
+        if name is None:
+            self._params.clear()
+            self.fetched = False
+        else:
+            self._params.pop(name, None)
+
+    def _param_value_callback(self, msg):
+        self._params[msg.param_id] = param_value_to_python(msg.value)
@@ -8,6 +8,7 @@ from definitions_pyx4 import *
 from mission_states import *
 from threading import Thread
 from commander import *
+from mission_updates import Mission_update_listener
 
 from pyx4.msg import pyx4_state as Pyx4_msg
 
@@ -21,7 +22,7 @@ class Pyx4_base(object):
 
     """
     def __init__(self,
-                 flight_instructions,
+                 flight_instructions,              # an indexed dictionary or an iterable (e.g. generator) of instructions
                  node_name='pyx4_node',
                  rospy_rate=2,
                  mavros_ns='',
@@ -30,6 +31,14 @@ class Pyx4_base(object):
                  height_mode_req=0,
                  enforce_sem_mode_flag=False,
                  start_authorised=True,
+                 telemetry_history=None,
+                 subscribe_all=False,
+                 shared_setpoint_publisher=None,   # a Setpoint_publisher shared with other vehicles in this process
+                 setpoint_keep_alive_rate=None,    # publish setpoints on change, else at this rate - see Setpoint_publisher
+                 recorder=None,                    # an optional Flight_recorder (see flight_recorder.py)
+                 event_driven_commander=False,     # see Commander
+                 profile_commander=False,          # see Commander / step_profiler.py
+                 accept_mission_updates=False,     # change the mission at run time over ROS, see mission_updates.py
                  ):
 
         self.node_alive = True
@@ -42,7 +51,8 @@ class Pyx4_base(object):
         self.start_authorised = start_authorised
 
         # create pyx4_base state publisher
-        self.pyx4_state_msg_pub = rospy.Publisher(node_name + '/pyx4_state', Pyx4_msg, queue_size=5)
+        state_topic = node_name + ('/' + mavros_ns.strip('/') if mavros_ns else '') + '/pyx4_state'
+        self.pyx4_state_msg_pub = rospy.Publisher(state_topic, Pyx4_msg, queue_size=5)
         self.pyx4_state_msg = Pyx4_msg()
         self.pyx4_state_msg.flight_state = 'Not_set'
         self.pyx4_state_msg.state_label = 'Not_set'
@@ -55,11 +65,23 @@ class Pyx4_base(object):
             rospy.logerr("couldn't find mandatory environmenatal variable: 'ROBOT_TYPE' - has this been set?")
             self.shut_node_down()
 
+        # only subscribe to the topics that our estimation mode and flight instructions need - the topics of streamed
+        # instructions are added by the commander as each instruction is loaded
+        required_topics = set()
+        if hasattr(flight_instructions, 'values'):
+            for flight_instruction in flight_instructions.values():
+                required_topics.update(getattr(flight_instruction, 'required_topics', ()))
+
         # start mavros interface thread
         self.mavros_interface = Mavros_interface(
                                                 state_estimation_mode=self.state_estimation_mode,
                                                 enforce_height_mode_flag=self.enforce_height_mode_flag,
-                                                height_mode_req=self.height_mode_req
+                                                height_mode_req=self.height_mode_req,
+                                                telemetry_history=telemetry_history,
+                                                required_topics=required_topics,
+                                                subscribe_all=subscribe_all,
+                                                mavros_ns=self.mavros_ns,
+                                                recorder=recorder,
                                                 )
         self.mavros_interface_thread = Thread(target=self.mavros_interface.run, args=())
         self.mavros_interface_thread.daemon = True
@@ -81,19 +103,35 @@ class Pyx4_base(object):
                                     mavros_interface_node=self.mavros_interface,
                                     commander_parent_ref=self,
                                     start_authorised=start_authorised,
+                                    event_driven=event_driven_commander,
+                                    profile=profile_commander,
                                    )
+        self.mission_update_listener = None
+        if accept_mission_updates:
+            self.mission_update_listener = Mission_update_listener(
+                self.commander, topic_prefix='~' + (mavros_ns.strip('/') + '/' if mavros_ns else ''))
         self.commander_thread = Thread(target=self.commander.run, args=())
         self.commander_thread.daemon = True
         if start_authorised:
             self.commander_thread.start()
             rospy.loginfo('commander initialised')
 
-        # start setpoint publisher thread
-        self.sp_pub_thread = Thread(target=setpoint_publisher, args=(self.mavros_interface, self.commander))
-        self.sp_pub_thread.daemon = True
-        if start_authorised:
-            self.sp_pub_thread.start()
-            rospy.loginfo('sp pub initialised')
+        # start setpoint publisher thread (unless our setpoints are published by a loop shared with other vehicles)
+        self.shared_setpoint_publisher = shared_setpoint_publisher
+        if shared_setpoint_publisher is None:
+            self.setpoint_publisher = Setpoint_publisher(keep_alive_rate=setpoint_keep_alive_rate)
+            self.setpoint_publisher.add_vehicle(self.mavros_interface, self.commander)
+            self.sp_pub_thread = Thread(target=self.setpoint_publisher.run, args=())
+            self.sp_pub_thread.daemon = True
+            if start_authorised:
+                self.sp_pub_thread.start()
+                rospy.loginfo('sp pub initialised')
+        else:
+            self.setpoint_publisher = shared_setpoint_publisher
+            self.sp_pub_thread = None
+            if start_authorised:
+                shared_setpoint_publisher.add_vehicle(self.mavros_interface, self.commander)
+                rospy.loginfo('sp pub initialised')
 
     def publish_pyx4_state(self):
 
@@ -108,7 +146,10 @@ class Pyx4_base(object):
         """
         self.commander_thread.start()
         rospy.loginfo('commander initialised')
-        self.sp_pub_thread.start()
+        if self.sp_pub_thread is not None:
+            self.sp_pub_thread.start()
+        else:
+            self.shared_setpoint_publisher.add_vehicle(self.mavros_interface, self.commander)
         rospy.loginfo('sp pub initialised')
 
     def run(self):
@@ -121,12 +162,22 @@ class Pyx4_base(object):
             except:
                 self.shut_node_down()
 
+        self.stop_recorder()
+
         # todo - return true if mission succesful and false if not - how to check this if the commander shuts down?
 
 
+    def stop_recorder(self):
+        """ flushes the flight recorder - a recorder shared by a fleet is stopped by Pyx4_fleet instead """
+        mavros_interface = getattr(self, 'mavros_interface', None)
+        if mavros_interface is not None and mavros_interface.recorder is not None \
+                and self.shared_setpoint_publisher is None:
+            mavros_interface.recorder.stop()
+
     def shut_node_down(self, shutdown_message='shutting down'):
 
         self.node_alive = False
+        self.stop_recorder()
         rospy.signal_shutdown(shutdown_message)
         sys.exit(1)
 
@@ -0,0 +1,111 @@
+#!/usr/bin/env python2
+"""
+Runs the missions of several vehicles from one process.
+
+Each vehicle gets its own namespaced Pyx4_base (mavros interface + commander) while the setpoint publishing loop and
+the deadline scheduler (topic deadlines, watchdogs) are shared, so the cost of an extra vehicle is a commander thread
+and its ROS subscriptions rather than a whole process.
+"""
+
+from __future__ import division
+
+import argparse
+import os
+import sys
+from threading import Thread
+
+import rospy
+
+from pyx4_base import Pyx4_base
+from setpoint_publisher import Setpoint_publisher
+from definitions_pyx4 import MISSION_SPECS
+from generate_mission import Wpts_from_csv
+
+
+class Pyx4_fleet(object):
+    """
+    Hosts one Pyx4_base per vehicle namespace.
+
+    vehicle_missions: dictionary of {mavros namespace: flight instructions}
+    """
+
+    def __init__(self,
+                 vehicle_missions,
+                 node_name='pyx4_node',
+                 rospy_rate=2,
+                 setpoint_rate=100,
+                 setpoint_keep_alive_rate=None,
+                 recorder=None,
+                 **pyx4_kwargs
+                 ):
+
+        self._run_rate = rospy_rate
+        self.recorder = recorder
+        self.setpoint_publisher = Setpoint_publisher(ros_rate=setpoint_rate, keep_alive_rate=setpoint_keep_alive_rate)
+        self.vehicles = {}
+
+        # bring the vehicles up concurrently - most of the start up time is spent waiting for mavros
+        errors = {}
+
+        def start_vehicle(mavros_ns, flight_instructions):
+            try:
+                self.vehicles[mavros_ns] = Pyx4_base(flight_instructions=flight_instructions,
+                                                     node_name=node_name,
+                                                     mavros_ns=mavros_ns,
+                                                     shared_setpoint_publisher=self.setpoint_publisher,
+                                                     recorder=recorder,
+                                                     **pyx4_kwargs)
+            except BaseException as e:   # Pyx4_base exits with sys.exit when mavros isn't available
+                errors[mavros_ns] = e
+
+        threads = [Thread(target=start_vehicle, args=(mavros_ns, flight_instructions))
+                   for mavros_ns, flight_instructions in vehicle_missions.items()]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        if errors:
+            raise RuntimeError('failed to start vehicles: {}'.format(errors))
+        rospy.loginfo('fleet of {} vehicles initialised'.format(len(self.vehicles)))
+
+        self.sp_pub_thread = Thread(target=self.setpoint_publisher.run, args=())
+        self.sp_pub_thread.daemon = True
+        self.sp_pub_thread.start()
+
+    @property
+    def vehicles_alive(self):
+        return [mavros_ns for mavros_ns, vehicle in self.vehicles.items()
+                if vehicle.commander._node_alive and vehicle.mavros_interface._node_alive]
+
+    def run(self):
+        """ Keep nodes alive until every vehicle has finished its mission """
+
+        rate = rospy.Rate(self._run_rate)
+        while not rospy.is_shutdown() and self.vehicles_alive:
+            try:
+                rate.sleep()
+            except rospy.ROSInterruptException:
+                pass
+
+        if self.recorder is not None:
+            self.recorder.stop()
+
+
+if __name__ == '__main__':
+
+    rospy.init_node('pyx4_fleet_node', anonymous=True, log_level=rospy.DEBUG)
+
+    parser = argparse.ArgumentParser(description="Runs the same csv mission on several namespaced vehicles.")
+    parser.add_argument('--csv', type=str, default='big_square.csv')
+    parser.add_argument('--namespaces', type=str, nargs='+', default=['uav0', 'uav1'])
+    args = parser.parse_args(rospy.myargv(argv=sys.argv)[1:])
+
+    if os.path.isabs(args.csv):
+        mission_file = args.csv
+    else:
+        mission_file = os.path.join(MISSION_SPECS, args.csv)
+
+    fleet = Pyx4_fleet(vehicle_missions=dict((ns, Wpts_from_csv(file_path=mission_file)) for ns in args.namespaces))
+    fleet.run()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python2
+"""
+A readiness barrier that waits for ROS services and topics concurrently.
+
+Bring up time is dominated by waiting for mavros, so rather than waiting on each dependency in turn every service and
+topic is waited on from its own thread. The barrier records when each dependency became available so that the slowest
+one can be reported, and hands back service proxies that are ready to use.
+"""
+
+from __future__ import division
+
+from threading import Thread, Lock
+
+import rospy
+
+from deadline_scheduler import monotonic
+
+
+class Readiness_barrier(object):
+    """
+    Waits for a set of services and topics at the same time.
+
+    services: dictionary of {key: (service name, service class)}
+    topics: dictionary of {key: (topic name, message class)}
+    """
+
+    def __init__(self, services=None, topics=None, timeout=30, min_messages=1):
+        self.services = services or {}
+        self.topics = topics or {}
+        self.timeout = timeout
+        self.min_messages = min_messages
+
+        self.proxies = {}
+        self.ready_times = {}
+        self.failed = {}
+        self._lock = Lock()
+        self._t_start = None
+
+    def _wait_for_service(self, key, name, service_class, deadline):
+        try:
+            rospy.wait_for_service(name, max(0.0, deadline - monotonic()))
+            proxy = rospy.ServiceProxy(name, service_class)
+            with self._lock:
+                self.proxies[key] = proxy
+                self.ready_times[key] = monotonic() - self._t_start
+        except Exception as e:
+            with self._lock:
+                self.failed[key] = e
+
+    def _wait_for_topic(self, key, name, message_class, deadline):
+        try:
+            for _ in range(self.min_messages):
+                rospy.wait_for_message(name, message_class, max(0.0, deadline - monotonic()))
+            with self._lock:
+                self.ready_times[key] = monotonic() - self._t_start
+        except Exception as e:
+            with self._lock:
+                self.failed[key] = e
+
+    def wait(self):
+        """
+        Blocks until every dependency is available or the timeout has expired.
+
+        Returns a dictionary of {key: service proxy}. Raises rospy.ROSException listing the dependencies that
+        weren't available in time.
+        """
+        self._t_start = monotonic()
+        deadline = self._t_start + self.timeout
+
+        threads = []
+        for key, (name, service_class) in self.services.items():
+            threads.append(Thread(target=self._wait_for_service, args=(key, name, service_class, deadline)))
+        for key, (name, message_class) in self.topics.items():
+            threads.append(Thread(target=self._wait_for_topic, args=(key, name, message_class, deadline)))
+
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        for thread in threads:
+            thread.join(max(0.0, deadline - monotonic()) + 1.0)
+
+        with self._lock:
+            missing = [key for key in list(self.services) + list(self.topics) if key not in self.ready_times]
+            if missing:
+                raise rospy.ROSException('dependencies not available after {} s: {}'.format(
+                    self.timeout, ', '.join('{} ({})'.format(key, self.failed.get(key, 'timed out'))
+                                            for key in missing)))
+
+        slowest = self.slowest()
+        if slowest is not None:
+            rospy.loginfo('all {} dependencies ready after {:.2f} s - slowest was {}'.format(
+                len(self.ready_times), monotonic() - self._t_start, slowest))
+        return self.proxies
+
+    def slowest(self):
+        """ returns the key of the dependency that took longest to become available """
+        if not self.ready_times:
+            return None
+        return max(self.ready_times, key=self.ready_times.get)
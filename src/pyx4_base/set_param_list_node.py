@@ -66,31 +66,22 @@ class Px4_param_setter(object):
 
             # first check which items need to be changed
             self.incorrect_params_dict = {}
+            unread_params = []
             for param, val in self.params_dict.iteritems():
-                # rospy.loginfo((param, val))
-
-                param_read_attempts = 0
-                while param_read_attempts < 5:
-                    res = self.mavros_interface.get_param_srv(param)
-                    print res
-                    if res.success:
-                        # todo - if res == false then: try again? or just add to list
-                        eeprom_val = res.value.integer
-                        if val != eeprom_val:
-                            self.incorrect_params_dict[param] = ParamValue(val, val)
-                            rospy.loginfo(
-                                'param {} is currently set to {} not {} - adding to dictionary'.format(param, eeprom_val, val))
-                        else:
-                            rospy.loginfo('param {} is already set to {} not adding to dictionary'.format(param, val))
-                        break
-                    else:
-                        rospy.logwarn("Couldn't read param {} on attempt {} - trying again".format(param, param_read_attempts))
-                        rospy.sleep(1)
-
-                    param_read_attempts += 1
+                eeprom_val = self.mavros_interface.params.get(param)
+                if eeprom_val is None:
+                    rospy.logwarn("Couldn't read param {} - will try again".format(param))
+                    unread_params.append(param)
+                    continue
+                if val != eeprom_val:
+                    self.incorrect_params_dict[param] = ParamValue(val, val)
+                    rospy.loginfo(
+                        'param {} is currently set to {} not {} - adding to dictionary'.format(param, eeprom_val, val))
+                else:
+                    rospy.loginfo('param {} is already set to {} not adding to dictionary'.format(param, val))
 
             # if no items need to be changed then exit loop
-            if len(self.incorrect_params_dict) == 0:
+            if len(self.incorrect_params_dict) == 0 and not unread_params:
                 rospy.loginfo('All params correct - finishing up')
                 break
             else:
@@ -99,7 +90,7 @@ class Px4_param_setter(object):
 
                     param_write_attempts = 0
                     while param_write_attempts < 5:
-                        res = self.mavros_interface.set_param_srv(param, val)
+                        res = self.mavros_interface.params.set(param, val)
                         if res.success:
                             rospy.loginfo('result for {} is: {}'.format(param, res.success))
                             break
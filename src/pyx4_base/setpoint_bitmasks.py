@@ -29,4 +29,5 @@ MASK_XY_VEL__Z_POS__YAW_POS  = ignore_all_bitmask - pos_sp_bitmasks['vx'] - pos_
 MASK_XY_VEL__Z_POS__YAW_RATE = ignore_all_bitmask - pos_sp_bitmasks['vx'] - pos_sp_bitmasks['vy'] - pos_sp_bitmasks['pz'] - pos_sp_bitmasks['vz'] - pos_sp_bitmasks['yaw_rate']
 MASK_XY_VEL__Z_VEL_YAW_POS   = ignore_all_bitmask - pos_sp_bitmasks['vx'] - pos_sp_bitmasks['vy'] - pos_sp_bitmasks['vz'] - pos_sp_bitmasks['yaw']
 MASK_XY_VEL__Z_VEL_YAW_RATE  = ignore_all_bitmask - pos_sp_bitmasks['vx'] - pos_sp_bitmasks['vy'] - pos_sp_bitmasks['vz'] - pos_sp_bitmasks['yaw_rate']
-MASK_XY_POS_XY_VEL_Z_POS_YAW_POS   = ignore_all_bitmask - pos_sp_bitmasks['px'] - pos_sp_bitmasks['py'] - pos_sp_bitmasks['vx'] - pos_sp_bitmasks['vy'] - pos_sp_bitmasks['pz'] - pos_sp_bitmasks['yaw']
\ No newline at end of file
+MASK_XY_POS_XY_VEL_Z_POS_YAW_POS   = ignore_all_bitmask - pos_sp_bitmasks['px'] - pos_sp_bitmasks['py'] - pos_sp_bitmasks['vx'] - pos_sp_bitmasks['vy'] - pos_sp_bitmasks['pz'] - pos_sp_bitmasks['yaw']
+MASK_XYZ_POS_XYZ_VEL_YAW_POS   = ignore_all_bitmask - pos_sp_bitmasks['px'] - pos_sp_bitmasks['py'] - pos_sp_bitmasks['pz'] - pos_sp_bitmasks['vx'] - pos_sp_bitmasks['vy'] - pos_sp_bitmasks['vz'] - pos_sp_bitmasks['yaw']
\ No newline at end of file
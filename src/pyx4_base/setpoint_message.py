@@ -0,0 +1,59 @@
+#!/usr/bin/env python2
+"""
+A PositionTarget that keeps its serialised form between publishes.
+
+The setpoint publisher sends the same setpoint many times a second, usually with only the header changed. rospy sets
+header.seq and the mission state sets header.stamp before each publish; everything else is only re-encoded after
+mark_dirty() has been called (which Generic_mission_state.sp_raw does whenever a new setpoint is committed). The
+first 12 bytes of a serialised message are the header's seq, stamp.secs and stamp.nsecs - the cached remainder
+(header.frame_id and the setpoint) is written out unchanged.
+"""
+
+from __future__ import division
+
+from copy import deepcopy
+from io import BytesIO
+import struct
+
+from mavros_msgs.msg import PositionTarget
+
+_HEADER_PREFIX = struct.Struct('<3I')     # header.seq, header.stamp.secs, header.stamp.nsecs
+
+
+class Cached_position_target(PositionTarget):
+    """
+    PositionTarget whose serialize() reuses the previous encoding until mark_dirty() is called - changes to anything
+    other than header.seq and header.stamp must be followed by mark_dirty()
+    """
+
+    # no __slots__ so that the genpy slot pickling/copying of PositionTarget still applies - copies start out dirty
+    _cached_tail = None
+
+    def mark_dirty(self):
+        self._cached_tail = None
+
+    def serialize(self, buff):
+        header = self.header
+        if self._cached_tail is None:
+            encoded = BytesIO()
+            PositionTarget.serialize(self, encoded)
+            self._cached_tail = encoded.getvalue()[_HEADER_PREFIX.size:]
+        buff.write(_HEADER_PREFIX.pack(header.seq, header.stamp.secs, header.stamp.nsecs))
+        buff.write(self._cached_tail)
+
+
+def as_cached_position_target(msg):
+    """ returns msg if it is already a Cached_position_target, else a Cached_position_target copy of it """
+    if isinstance(msg, Cached_position_target):
+        return msg
+    cached = Cached_position_target()
+    for slot in PositionTarget.__slots__:
+        setattr(cached, slot, deepcopy(getattr(msg, slot)))
+    return cached
+
+
+def fill_position_target(msg, snapshot):
+    """ writes a setpoint tuple (see Generic_mission_state.setpoint_fields) into a PositionTarget """
+    (msg.position.x, msg.position.y, msg.position.z, msg.velocity.x, msg.velocity.y, msg.velocity.z, msg.yaw,
+     msg.yaw_rate, msg.coordinate_frame, msg.type_mask) = snapshot
+    return msg
@@ -2,30 +2,279 @@
 """
 This module continuously provides mavros with a setpoint at the required rate so that onboard computer doesn't loose
 sync with the flight control unit
+
+By default every setpoint is published at the loop rate. With a keep-alive rate the loop still checks the setpoints at
+its rate but only publishes a setpoint when it has changed, re-sending an unchanged setpoint at the keep-alive rate -
+which must stay well above the 2 Hz that PX4 needs to stay in offboard mode. Trajectories are always streamed at the
+loop rate.
+
+The loop runs against deadlines on deadline_scheduler.monotonic (each deadline is one period after the last, so time
+spent publishing doesn't make the loop drift) and sleeps for relative intervals, so a step of the system time neither
+stalls publishing nor makes it burst. The loop periods, how late each iteration woke up, missed deadlines and the
+gaps between the setpoints of each vehicle are recorded, published on ~setpoint_diagnostics and logged at exit, and a
+warning is logged as soon as a gap gets close to the offboard timeout.
 """
 from __future__ import division
 
+from threading import Lock
+import time
+
 import rospy
+from diagnostic_msgs.msg import DiagnosticArray, DiagnosticStatus, KeyValue
+
+from deadline_scheduler import monotonic
+from step_profiler import Latency_histogram
+
+OFFBOARD_MIN_SETPOINT_RATE = 2.0    # Hz - PX4 leaves offboard mode if setpoints arrive slower than this
+OFFBOARD_TIMEOUT_S = 1.0 / OFFBOARD_MIN_SETPOINT_RATE
+MIN_KEEP_ALIVE_RATE = 2 * OFFBOARD_MIN_SETPOINT_RATE
+GAP_WARNING_S = 0.6 * OFFBOARD_TIMEOUT_S    # setpoint gaps longer than this are logged as warnings
+
+SETPOINT_RECORD_FIELDS = ('x', 'y', 'z', 'x_vel', 'y_vel', 'z_vel', 'yaw', 'yaw_rate', 'type_mask',
+                          'coordinate_frame')
+
+
+def record_setpoint(mavros_interface_node, sp_raw):
+    channel = mavros_interface_node.recorder.channels[mavros_interface_node.recorder_channel_name('setpoint')]
+    channel.append((sp_raw.header.stamp.to_sec(), sp_raw.position.x, sp_raw.position.y, sp_raw.position.z,
+                    sp_raw.velocity.x, sp_raw.velocity.y, sp_raw.velocity.z, sp_raw.yaw, sp_raw.yaw_rate,
+                    sp_raw.type_mask, sp_raw.coordinate_frame))
+
+
+class Publish_stats(object):
+    """
+    Counts of the setpoints published for one vehicle and the gaps between them
+    """
+
+    __slots__ = ('polls', 'published', 'on_change', 'publish_s', 'gaps', 'last_publish_time', 'last_fields')
+
+    def __init__(self):
+        self.polls = 0              # loop iterations
+        self.published = 0
+        self.on_change = 0          # publishes caused by a setpoint change (the rest are keep-alives)
+        self.publish_s = 0.0        # time spent building and publishing setpoint messages
+        self.gaps = Latency_histogram()
+        self.last_publish_time = None
+        self.last_fields = None
+
+    def record_publish(self, t_start, t_end, changed):
+        if self.last_publish_time is not None:
+            self.gaps.add(t_start - self.last_publish_time)
+        self.last_publish_time = t_start
+        self.published += 1
+        if changed:
+            self.on_change += 1
+        self.publish_s += t_end - t_start
+
+    def __repr__(self):
+        return 'polls={} published={} on_change={} publish_time={:.3f}s gaps: {}'.format(
+            self.polls, self.published, self.on_change, self.publish_s, self.gaps)
+
+
+class Loop_stats(object):
+    """
+    Timing of the publishing loop itself
+    """
+
+    __slots__ = ('periods', 'lateness', 'missed_deadlines', 'last_start')
+
+    def __init__(self):
+        self.periods = Latency_histogram()      # time between the starts of consecutive iterations
+        self.lateness = Latency_histogram()     # how long after its deadline each iteration started
+        self.missed_deadlines = 0               # deadlines skipped because the loop was more than a period late
+        self.last_start = None
+
+    @property
+    def max_gap_s(self):
+        return self.periods.worst_s
 
-def setpoint_publisher(mavros_interface_node, commander_class_instance, ros_rate=100):
+    def __repr__(self):
+        return 'periods: {} lateness: {} missed deadlines: {}'.format(
+            self.periods, self.lateness, self.missed_deadlines)
+
+
+def _gap_level(gap_s):
+    if gap_s >= OFFBOARD_TIMEOUT_S:
+        return DiagnosticStatus.ERROR
+    if gap_s >= GAP_WARNING_S:
+        return DiagnosticStatus.WARN
+    return DiagnosticStatus.OK
+
+
+class Setpoint_publisher(object):
     """
-    This method continuously publishes the setpoint state - must run at a deterministic rate to prevent offboard mode
-    from exiting (offboard mode exits if a new instruction is not received at a minimum of 2 hz)
+    Publishes the setpoint of one or more vehicles from a single loop - each vehicle is a (mavros interface, commander)
+    pair, so one process can host several vehicles without a publishing thread each.
 
+    keep_alive_rate: None publishes every setpoint at ros_rate, otherwise setpoints are published when they change and
+        re-sent at keep_alive_rate (Hz) while they don't
+    diagnostics_period: how often (s) the loop and publish statistics are published on ~setpoint_diagnostics
     """
-    rate = rospy.Rate(ros_rate)
-    while not rospy.is_shutdown():
-        try:
 
-            # todo - add this thread lock to mission_states
-            mavros_interface_node.setpoint_lock.acquire()
-            mavros_interface_node.local_pos_pub_raw.publish(commander_class_instance.sp_raw)
-            mavros_interface_node.setpoint_lock.release()
+    def __init__(self, ros_rate=100, keep_alive_rate=None, diagnostics_period=1.0):
+        self.ros_rate = ros_rate
+        self.period = 1.0 / ros_rate
+        self.diagnostics_period = diagnostics_period
+        self.diagnostics_pub = None
+        self.loop_stats = Loop_stats()
+        self.keep_alive_rate = keep_alive_rate
+        self.keep_alive_period = None
+        if keep_alive_rate is not None:
+            if keep_alive_rate < MIN_KEEP_ALIVE_RATE:
+                raise ValueError('a keep alive rate of {} Hz is too close to the {} Hz offboard minimum - use at least '
+                                 '{} Hz'.format(keep_alive_rate, OFFBOARD_MIN_SETPOINT_RATE, MIN_KEEP_ALIVE_RATE))
+            self.keep_alive_period = 1.0 / keep_alive_rate
+        self._vehicles = ()
+        self._vehicles_lock = Lock()
+
+    def add_vehicle(self, mavros_interface_node, commander_class_instance):
+        with self._vehicles_lock:
+            # the loop iterates over an immutable tuple so vehicles can be added while it is running
+            self._vehicles = self._vehicles + ((mavros_interface_node, commander_class_instance, Publish_stats()),)
+
+        recorder = getattr(mavros_interface_node, 'recorder', None)
+        if recorder is not None:
+            recorder.add_channel(mavros_interface_node.recorder_channel_name('setpoint'), SETPOINT_RECORD_FIELDS)
+
+    @property
+    def vehicle_count(self):
+        return len(self._vehicles)
+
+    @property
+    def publish_stats(self):
+        """ {mavros namespace: Publish_stats} """
+        return dict((mavros_interface_node.mavros_ns, stats) for mavros_interface_node, _, stats in self._vehicles)
+
+    def summary(self):
+        lines = ['setpoint loop at {} Hz: {}'.format(self.ros_rate, self.loop_stats)]
+        lines.extend('setpoints {}: {}'.format(mavros_ns or '/', stats)
+                     for mavros_ns, stats in sorted(self.publish_stats.items()))
+        return '\n'.join(lines)
+
+    def to_diagnostic_statuses(self, name='setpoint_publisher'):
+        """
+        One DiagnosticStatus for the loop plus one per vehicle
+        """
+        loop_stats = self.loop_stats
+        loop = DiagnosticStatus()
+        loop.name = name + '/loop'
+        loop.level = _gap_level(loop_stats.max_gap_s)
+        loop.message = '{} missed deadlines'.format(loop_stats.missed_deadlines)
+        loop.values = [
+            KeyValue('rate_hz', str(self.ros_rate)),
+            KeyValue('iterations', str(loop_stats.periods.count)),
+            KeyValue('missed_deadlines', str(loop_stats.missed_deadlines)),
+            KeyValue('mean_period_s', '{:.6f}'.format(loop_stats.periods.mean_s)),
+            KeyValue('p99_period_s', '{:.6f}'.format(loop_stats.periods.percentile_s(99))),
+            KeyValue('max_gap_s', '{:.6f}'.format(loop_stats.max_gap_s)),
+            KeyValue('p99_lateness_s', '{:.6f}'.format(loop_stats.lateness.percentile_s(99))),
+            KeyValue('worst_lateness_s', '{:.6f}'.format(loop_stats.lateness.worst_s)),
+            KeyValue('period_histogram_log2_us', ' '.join(str(n) for n in loop_stats.periods.buckets)),
+        ]
+        statuses = [loop]
+
+        for mavros_ns, stats in sorted(self.publish_stats.items()):
+            status = DiagnosticStatus()
+            status.name = '{}/{}'.format(name, mavros_ns.strip('/') or 'vehicle')
+            status.hardware_id = mavros_ns
+            status.level = _gap_level(stats.gaps.worst_s)
+            status.message = 'max gap {:.3f}s'.format(stats.gaps.worst_s)
+            status.values = [
+                KeyValue('published', str(stats.published)),
+                KeyValue('on_change', str(stats.on_change)),
+                KeyValue('publish_time_s', '{:.6f}'.format(stats.publish_s)),
+                KeyValue('p99_gap_s', '{:.6f}'.format(stats.gaps.percentile_s(99))),
+                KeyValue('max_gap_s', '{:.6f}'.format(stats.gaps.worst_s)),
+            ]
+            statuses.append(status)
+        return statuses
+
+    def publish_diagnostics(self):
+        if self.diagnostics_pub is None:
+            self.diagnostics_pub = rospy.Publisher('~setpoint_diagnostics', DiagnosticArray, queue_size=1)
+        diagnostics = DiagnosticArray()
+        diagnostics.header.stamp = rospy.Time.now()
+        diagnostics.status = self.to_diagnostic_statuses()
+        self.diagnostics_pub.publish(diagnostics)
 
-        except Exception as e:
-            rospy.logerr_throttle(1, ('couldnt publish the setpoint message because: ', e))
+    def publish_once(self):
+        for mavros_interface_node, commander_class_instance, stats in self._vehicles:
+            try:
+                stats.polls += 1
+                t_start = monotonic()
+                changed = False
+                fields = None
+                if self.keep_alive_period is not None:
+                    fields = commander_class_instance.setpoint_snapshot
+                    changed = fields != stats.last_fields or commander_class_instance.setpoint_streaming
+                    # nothing published yet (or the last publishes failed) - always due
+                    if not changed and stats.last_publish_time is not None and \
+                            t_start - stats.last_publish_time < self.keep_alive_period:
+                        continue
 
-        try:  # prevent garbage in console output when thread is killed
-            rate.sleep()
-        except rospy.ROSInterruptException:
-            pass
\ No newline at end of file
+                # the mission states hand over immutable setpoint snapshots, so no lock is needed here
+                sp_raw = commander_class_instance.sp_raw
+                mavros_interface_node.local_pos_pub_raw.publish(sp_raw)
+                # only once it has been sent - a setpoint that failed to publish is retried on the next poll
+                stats.last_fields = fields
+                if stats.last_publish_time is not None and t_start - stats.last_publish_time > GAP_WARNING_S:
+                    rospy.logwarn_throttle(1, '{:.3f}s since the last setpoint for {} - offboard mode is lost after '
+                                              '{}s'.format(t_start - stats.last_publish_time,
+                                                           mavros_interface_node.mavros_ns or '/', OFFBOARD_TIMEOUT_S))
+                stats.record_publish(t_start, monotonic(), changed)
+
+                if mavros_interface_node.recorder is not None:
+                    record_setpoint(mavros_interface_node, sp_raw)
+
+            except Exception as e:
+                rospy.logerr_throttle(1, ('couldnt publish the setpoint message because: ', e))
+
+    def run(self):
+        """
+        This method continuously publishes the setpoint state - must run at a deterministic rate to prevent offboard
+        mode from exiting (offboard mode exits if a new instruction is not received at a minimum of 2 hz)
+        """
+        loop_stats = self.loop_stats
+        deadline = monotonic()
+        next_diagnostics = deadline + self.diagnostics_period
+        while not rospy.is_shutdown():
+            t_start = monotonic()
+            loop_stats.lateness.add(max(0.0, t_start - deadline))
+            if loop_stats.last_start is not None:
+                gap = t_start - loop_stats.last_start
+                loop_stats.periods.add(gap)
+                if gap > GAP_WARNING_S:
+                    rospy.logwarn_throttle(1, 'setpoint loop stalled for {:.3f}s - offboard mode is lost after '
+                                              '{}s'.format(gap, OFFBOARD_TIMEOUT_S))
+            loop_stats.last_start = t_start
+
+            self.publish_once()
+
+            if t_start >= next_diagnostics:
+                next_diagnostics = t_start + self.diagnostics_period
+                try:
+                    self.publish_diagnostics()
+                except Exception as e:
+                    rospy.logerr_throttle(10, 'couldnt publish the setpoint diagnostics because: {}'.format(e))
+
+            # the next deadline is a period after the last one (not after now) so the loop doesn't drift - if the loop
+            # has fallen more than a period behind the missed deadlines are skipped rather than published in a burst
+            deadline += self.period
+            now = monotonic()
+            if now - deadline > self.period:
+                missed = int((now - deadline) / self.period)
+                loop_stats.missed_deadlines += missed
+                deadline += missed * self.period
+            if deadline > now:
+                time.sleep(deadline - now)
+
+        rospy.loginfo(self.summary())
+
+
+def setpoint_publisher(mavros_interface_node, commander_class_instance, ros_rate=100, keep_alive_rate=None):
+    """
+    Publishes the setpoint of a single vehicle - see Setpoint_publisher
+    """
+    publisher = Setpoint_publisher(ros_rate=ros_rate, keep_alive_rate=keep_alive_rate)
+    publisher.add_vehicle(mavros_interface_node, commander_class_instance)
+    publisher.run()
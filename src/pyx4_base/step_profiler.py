@@ -0,0 +1,137 @@
+#!/usr/bin/env python2
+"""
+Timing instrumentation for the commander loop.
+
+The time taken by step(), precondition_check() and load_flight_instruction() is recorded per mission state type into
+log2 latency histograms, and every commander tick is checked against the loop budget (1 / commander rate) so that
+states that starve the loop can be found. Recording a sample is a few integer operations; when profiling is disabled
+the commander doesn't call into this module at all.
+"""
+
+from __future__ import division
+
+import math
+
+from diagnostic_msgs.msg import DiagnosticStatus, KeyValue
+
+US_PER_S = 1000000
+
+
+class Latency_histogram(object):
+    """
+    Histogram of durations in power of two microsecond buckets - bucket i holds durations in [2^(i-1), 2^i) us
+    """
+
+    __slots__ = ('buckets', 'count', 'total_s', 'worst_s')
+
+    def __init__(self, n_buckets=24):   # the last bucket holds everything over ~8 s
+        self.buckets = [0] * n_buckets
+        self.count = 0
+        self.total_s = 0.0
+        self.worst_s = 0.0
+
+    def add(self, duration_s):
+        us = int(duration_s * US_PER_S)
+        idx = us.bit_length() if us > 0 else 0
+        if idx >= len(self.buckets):
+            idx = len(self.buckets) - 1
+        self.buckets[idx] += 1
+        self.count += 1
+        self.total_s += duration_s
+        if duration_s > self.worst_s:
+            self.worst_s = duration_s
+
+    @property
+    def mean_s(self):
+        return self.total_s / self.count if self.count else 0.0
+
+    def percentile_s(self, percentile):
+        """ upper bound of the bucket holding the given percentile (0-100) """
+        if not self.count:
+            return 0.0
+        target = math.ceil(self.count * percentile / 100)
+        seen = 0
+        for idx, n in enumerate(self.buckets):
+            seen += n
+            if seen >= target:
+                return (1 << idx) / US_PER_S
+        return self.worst_s
+
+    def __repr__(self):
+        return 'n={} mean={:.3f}ms p99<{:.3f}ms worst={:.3f}ms'.format(
+            self.count, self.mean_s * 1e3, self.percentile_s(99) * 1e3, self.worst_s * 1e3)
+
+
+class Step_profiler(object):
+    """
+    Per mission state type latency histograms and loop overrun accounting for a commander
+
+    budget_s: the time available for one commander tick
+    """
+
+    PHASES = ('step', 'precondition_check', 'load_flight_instruction', 'transition_gap')
+
+    def __init__(self, budget_s):
+        self.budget_s = budget_s
+        # {(state type, phase): Latency_histogram}
+        self.histograms = {}
+        self.ticks = Latency_histogram()
+        self.overruns = 0
+        self.worst_tick_state = None
+
+    def record(self, state_type, phase, duration_s):
+        key = (state_type, phase)
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Latency_histogram()
+        histogram.add(duration_s)
+
+    def record_tick(self, state_type, duration_s):
+        if duration_s > self.ticks.worst_s:
+            self.worst_tick_state = state_type
+        self.ticks.add(duration_s)
+        if duration_s > self.budget_s:
+            self.overruns += 1
+
+    def summary(self):
+        lines = ['commander ticks: {} overruns (> {:.1f}ms): {} worst tick in {}'.format(
+            self.ticks, self.budget_s * 1e3, self.overruns, self.worst_tick_state)]
+        for (state_type, phase), histogram in sorted(self.histograms.items(),
+                                                     key=lambda item: -item[1].worst_s):
+            lines.append('  {} {}: {}'.format(state_type, phase, histogram))
+        return '\n'.join(lines)
+
+    def to_diagnostic_statuses(self, name='commander', hardware_id=''):
+        """
+        One DiagnosticStatus for the loop plus one per (state type, phase)
+        """
+        loop = DiagnosticStatus()
+        loop.name = name + '/loop'
+        loop.hardware_id = hardware_id
+        loop.level = DiagnosticStatus.WARN if self.ticks.worst_s > self.budget_s else DiagnosticStatus.OK
+        loop.message = '{} overruns'.format(self.overruns)
+        loop.values = [
+            KeyValue('ticks', str(self.ticks.count)),
+            KeyValue('budget_s', '{:.6f}'.format(self.budget_s)),
+            KeyValue('overruns', str(self.overruns)),
+            KeyValue('mean_s', '{:.6f}'.format(self.ticks.mean_s)),
+            KeyValue('worst_s', '{:.6f}'.format(self.ticks.worst_s)),
+            KeyValue('worst_state', str(self.worst_tick_state)),
+        ]
+        statuses = [loop]
+
+        for (state_type, phase), histogram in sorted(self.histograms.items()):
+            status = DiagnosticStatus()
+            status.name = '{}/{}/{}'.format(name, state_type, phase)
+            status.hardware_id = hardware_id
+            status.level = DiagnosticStatus.WARN if histogram.worst_s > self.budget_s else DiagnosticStatus.OK
+            status.message = 'OK' if status.level == DiagnosticStatus.OK else 'exceeded loop budget'
+            status.values = [
+                KeyValue('count', str(histogram.count)),
+                KeyValue('mean_s', '{:.6f}'.format(histogram.mean_s)),
+                KeyValue('p99_s', '{:.6f}'.format(histogram.percentile_s(99))),
+                KeyValue('worst_s', '{:.6f}'.format(histogram.worst_s)),
+                KeyValue('histogram_log2_us', ' '.join(str(n) for n in histogram.buckets)),
+            ]
+            statuses.append(status)
+        return statuses
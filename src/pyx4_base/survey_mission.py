@@ -13,7 +13,29 @@ from mavros_msgs.msg import PositionTarget
 
 from warnings import warn
 
-def  Survey_mission(
+def Survey_mission(
+                        mission_type='hover',
+                        control_type='pos',
+                        duration=30,
+                        height=3.0,
+                        heading=0.0,
+                        x_length=1.0,
+                        y_length=10.0,
+                        x_offset=1.0,
+                        y_offset=1.0,
+                        width_between_runs=3.0,
+                        z_tgt_rel=0.0,
+                        radius=5.0,
+                        ):
+    '''
+    Builds the whole survey mission as an indexed dictionary - see Survey_mission_stream
+    '''
+    return dict(enumerate(Survey_mission_stream(mission_type, control_type, duration, height, heading, x_length,
+                                                y_length, x_offset, y_offset, width_between_runs, z_tgt_rel,
+                                                radius)))
+
+
+def Survey_mission_stream(
                         mission_type='hover',
                         control_type='pos',
                         duration=30,
@@ -47,9 +69,6 @@ def  Survey_mission(
     warn("this mission type wasn't completed as there wasn't a good way of limiting the velocity of the waypoints while"
          " in offboard and position control modes")
 
-    instructions = {}
-    instruction_cnt = 0
-
     # create test grid based on x & y length specifications
     x_initial = - np.ceil(y_length / 2.0)
     y_initial = 0.0
@@ -69,23 +88,21 @@ def  Survey_mission(
     # append home to our target
 
     ################# Common instructions -> arm & take offf
-    instructions[instruction_cnt] = Arming_state(
+    yield Arming_state(
         timeout=90
     )
-    instruction_cnt += 1
-    instructions[instruction_cnt] = Take_off_state(
+    yield Take_off_state(
         # instruction_type='hold',
         to_altitude_tgt=height,
         yaw_type='pos',
         heading_tgt_rad=heading,
         timeout=30,
     )
-    instruction_cnt += 1
 
     ################################### main loop
     for x_tgt, y_tgt in zip(xs_all, ys_all):
         print ('generating waypoint at {}, {} '.format(x_tgt, y_tgt))
-        instructions[instruction_cnt] = Waypoint_state(
+        yield Waypoint_state(
             timeout=duration,
             state_label='Going out',
             waypoint_type='pos',
@@ -100,10 +117,9 @@ def  Survey_mission(
             yaw_setpoint=heading,
             coordinate_frame=PositionTarget.FRAME_LOCAL_NED,
         )
-        instruction_cnt = instruction_cnt + 1
 
     ################################### return to home
-    instructions[instruction_cnt] = Waypoint_state(
+    yield Waypoint_state(
         state_label='Hovering',
         waypoint_type='pos',
         timeout=duration,
@@ -116,17 +132,14 @@ def  Survey_mission(
         yaw_setpoint=heading,
         coordinate_frame=PositionTarget.FRAME_LOCAL_NED,
     )
-    instruction_cnt = instruction_cnt + 1
 
     ######################################################################################################
     ################################## Landing instruction ###############################################
-    instructions[instruction_cnt] = Landing_state()
-    instruction_cnt += 1
+    yield Landing_state()
 
     print xs_all
     print ys_all
 
-    return instructions
     # translate gid points based on the offset
 
     # rotate grid points based on heading
@@ -168,7 +181,7 @@ if __name__ == '__main__':
     # # todo apply vel cap and warn if effected
     # # todo - default duration shorter if control type is vel
 
-    flight_instructions = Survey_mission(
+    flight_instructions = Survey_mission_stream(
                                                 # mission_type=args.mission_type,
                                                 # control_type=args.control_type,
                                                 # duration=args.duration,
@@ -0,0 +1,140 @@
+#!/usr/bin/env python2
+"""
+Fixed size telemetry history for the mavros interface.
+
+Each topic that has history enabled gets a Ring_buffer of timestamps and values. The buffer is mirrored (every sample
+is written twice, capacity elements apart) so that any window of recent samples is a contiguous NumPy view and can be
+queried without copying.
+"""
+
+from __future__ import division
+
+import numpy as np
+
+
+class Ring_buffer(object):
+    """
+    A preallocated ring buffer of timestamped samples with O(1) append and vectorised window queries.
+
+    Views returned by the query methods are live - they are only guaranteed to hold the requested samples until
+    another 'capacity' samples have been appended, so consumers should finish with them within the current tick.
+    """
+
+    def __init__(self, capacity, field_names):
+        assert capacity > 0, 'ring buffer capacity must be positive'
+        self.capacity = int(capacity)
+        self.field_names = tuple(field_names)
+        self._field_idx = dict((name, i) for i, name in enumerate(self.field_names))
+
+        self._t = np.zeros(2 * self.capacity, dtype=np.float64)
+        self._v = np.zeros((2 * self.capacity, len(self.field_names)), dtype=np.float64)
+
+        # (next write index, number of valid samples) - assigned together so that readers see a consistent pair
+        self._state = (0, 0)
+
+    def __len__(self):
+        return self._state[1]
+
+    @property
+    def nbytes(self):
+        return self._t.nbytes + self._v.nbytes
+
+    def append(self, t, values):
+        idx, count = self._state
+        mirror = idx + self.capacity
+        self._t[idx] = t
+        self._t[mirror] = t
+        self._v[idx] = values
+        self._v[mirror] = values
+        self._state = ((idx + 1) % self.capacity, min(count + 1, self.capacity))
+
+    def clear(self):
+        self._state = (0, 0)
+
+    def _span(self):
+        idx, count = self._state
+        end = idx + self.capacity
+        return end - count, end
+
+    def times(self):
+        """ all stored timestamps, oldest first """
+        start, end = self._span()
+        return self._t[start:end]
+
+    def values(self, field=None):
+        """ all stored values (or a single named field), oldest first """
+        start, end = self._span()
+        if field is None:
+            return self._v[start:end]
+        return self._v[start:end, self._field_idx[field]]
+
+    def latest(self):
+        """ returns the (timestamp, values) of the most recent sample or None if the buffer is empty """
+        idx, count = self._state
+        if count == 0:
+            return None
+        last = idx + self.capacity - 1
+        return self._t[last], self._v[last]
+
+    def window(self, t_start, t_end=None):
+        """
+        Returns views of the timestamps and values of all samples with t_start <= t <= t_end
+        """
+        start, end = self._span()
+        t = self._t[start:end]
+        lo = np.searchsorted(t, t_start, side='left')
+        hi = len(t) if t_end is None else np.searchsorted(t, t_end, side='right')
+        return t[lo:hi], self._v[start + lo:start + hi]
+
+    def bracket(self, t, clamp=False):
+        """
+        Returns (values before t, values after t, fraction of the way between them) for interpolating at time t.
+        If t is outside the stored samples None is returned, or the nearest sample when clamp is True.
+        """
+        start, end = self._span()
+        if start == end:
+            return None
+        times = self._t[start:end]
+        if t <= times[0] or t >= times[-1]:
+            if not clamp and (t < times[0] or t > times[-1]):
+                return None
+            nearest = self._v[start] if t <= times[0] else self._v[end - 1]
+            return nearest, nearest, 0.0
+        hi = int(np.searchsorted(times, t, side='left'))
+        t0 = times[hi - 1]
+        dt = times[hi] - t0
+        fraction = (t - t0) / dt if dt > 0 else 0.0
+        return self._v[start + hi - 1], self._v[start + hi], fraction
+
+    def interpolate(self, t, field=None, clamp=False):
+        """
+        Linearly interpolated values (or a single named field) at time t - see bracket
+        """
+        bracket = self.bracket(t, clamp)
+        if bracket is None:
+            return None
+        v0, v1, fraction = bracket
+        if field is not None:
+            idx = self._field_idx[field]
+            v0, v1 = v0[idx], v1[idx]
+        return v0 + fraction * (v1 - v0)
+
+    def last(self, duration):
+        """
+        Returns views of the samples received in the last 'duration' seconds (relative to the latest sample)
+        """
+        latest = self.latest()
+        if latest is None:
+            return self._t[0:0], self._v[0:0]
+        return self.window(latest[0] - duration)
+
+    def mean_since(self, t_start, field=None):
+        """
+        Mean of the values (or a single named field) received since t_start - returns None if there are no samples
+        """
+        _, values = self.window(t_start)
+        if len(values) == 0:
+            return None
+        if field is None:
+            return values.mean(axis=0)
+        return values[:, self._field_idx[field]].mean()
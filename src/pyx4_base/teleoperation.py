@@ -90,12 +90,17 @@ class Teleop_state(Generic_mission_state):
         
     def teleop_node_cb(self, data):
         checked_data = self._check_speeds(data)
-        # So that the movement is forward
-        self.x_vel = checked_data.linear.y
-        self.y_vel = checked_data.linear.x
-        self.z = np.clip(self.z + 0.5 * np.sign(checked_data.linear.z),
-                         self.z_min, self.z_max)
-        self.yaw_rate = checked_data.angular.z
+
+        # runs on the subscriber thread - the new setpoint is built from the committed one rather than by writing the
+        # setpoint fields that the commander thread commits
+        def teleop_setpoint(snapshot):
+            x, y, z, x_vel, y_vel, z_vel, yaw, yaw_rate, coordinate_frame, type_mask = snapshot
+            # So that the movement is forward
+            return (x, y, float(np.clip(z + 0.5 * np.sign(checked_data.linear.z), self.z_min, self.z_max)),
+                    checked_data.linear.y, checked_data.linear.x, z_vel, yaw, checked_data.angular.z,
+                    coordinate_frame, type_mask)
+
+        self.update_setpoint(teleop_setpoint)
 
 
 def generate_telop_mission(args):
@@ -0,0 +1,166 @@
+#!/usr/bin/env python2
+"""
+Unit tests for async_service - timeouts, retries and late responses, with a stub service proxy and a real
+Deadline_scheduler. No roscore needed.
+
+usage: python test/test_async_service.py
+"""
+from __future__ import division
+
+import os
+import sys
+import time
+import unittest
+from threading import Event, Lock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from async_service import Async_service_caller, Service_future
+from deadline_scheduler import Deadline_scheduler, monotonic
+
+WAIT_S = 2.0    # upper bound on how long a test waits for a call to finish
+
+
+class Stub_proxy(object):
+    """
+    Service proxy that works through a script with one entry per call - each entry is a function that takes the
+    attempt number and returns the response or raises
+    """
+
+    resolved_name = '/stub_service'
+
+    def __init__(self, *script):
+        self.script = list(script)
+        self.calls = 0
+        self.returned = []
+        self._lock = Lock()
+
+    def __call__(self, *args):
+        with self._lock:
+            self.calls += 1
+            attempt = self.calls
+        response = self.script[min(attempt, len(self.script)) - 1](attempt)
+        with self._lock:
+            self.returned.append(attempt)
+        return response
+
+
+def respond(response, delay=0.0):
+    def entry(attempt):
+        time.sleep(delay)
+        return response
+    return entry
+
+
+def block_until(event, response='released'):
+    def entry(attempt):
+        event.wait(WAIT_S)
+        return response
+    return entry
+
+
+def fail(attempt):
+    raise RuntimeError('call {} failed'.format(attempt))
+
+
+def wait_until(condition, timeout=WAIT_S):
+    deadline = monotonic() + timeout
+    while not condition():
+        if monotonic() > deadline:
+            return False
+        time.sleep(0.005)
+    return True
+
+
+class Async_service_caller_test(unittest.TestCase):
+
+    def setUp(self):
+        self.scheduler = Deadline_scheduler(name='test_scheduler')
+        self.caller = Async_service_caller(workers=2, scheduler=self.scheduler, name='test_async_service')
+        self.release = Event()
+
+    def tearDown(self):
+        # let any blocked stub calls return so that the workers are free
+        self.release.set()
+        self.scheduler.shutdown()
+
+    def assert_finishes(self, future):
+        self.assertTrue(wait_until(lambda: future.done), '{} did not finish'.format(future))
+
+    def test_success(self):
+        proxy = Stub_proxy(respond('ok'))
+        future = self.caller.submit(proxy, args=(1, 2), timeout=1.0)
+        self.assert_finishes(future)
+        self.assertEqual((future.status, future.response, future.error), (Service_future.SUCCEEDED, 'ok', None))
+        self.assertEqual(future.attempts, 1)
+        self.assertEqual(future.name, '/stub_service')
+        self.assertIsNotNone(future.since_done())
+
+    def test_timeout_then_retry(self):
+        proxy = Stub_proxy(respond('late', delay=0.3), respond('ok'))
+        future = self.caller.submit(proxy, timeout=0.1, retries=1, retry_delay=0.02)
+        self.assert_finishes(future)
+        self.assertEqual((future.status, future.response), (Service_future.SUCCEEDED, 'ok'))
+        self.assertEqual(future.attempts, 2)
+        # the response of the timed out attempt arrives later and is discarded
+        self.assertTrue(wait_until(lambda: 1 in proxy.returned))
+        self.assertEqual((future.status, future.response), (Service_future.SUCCEEDED, 'ok'))
+
+    def test_late_response_keeps_the_retry_timeout(self):
+        # the first attempt times out at 0.2 s and its response arrives at 0.3 s, while the second attempt is
+        # waiting on a call that doesn't return - the late response must not cancel the second attempt's timeout
+        proxy = Stub_proxy(respond('late', delay=0.3), block_until(self.release))
+        future = self.caller.submit(proxy, timeout=0.2, retries=1, retry_delay=0.05)
+        self.assert_finishes(future)
+        self.assertEqual(proxy.returned, [1])
+        self.assertEqual((future.status, future.error), (Service_future.FAILED, 'timed out after 0.2s'))
+        self.assertEqual(future.attempts, 2)
+
+    def test_rejected_response_is_retried(self):
+        proxy = Stub_proxy(respond('bad'), respond('good'))
+        future = self.caller.submit(proxy, timeout=1.0, retries=2, retry_delay=0.02,
+                                    check=lambda response: response == 'good')
+        self.assert_finishes(future)
+        self.assertEqual((future.status, future.response), (Service_future.SUCCEEDED, 'good'))
+        self.assertEqual(future.attempts, 2)
+        self.assertEqual(proxy.calls, 2)
+
+    def test_retries_exhausted(self):
+        proxy = Stub_proxy(fail)
+        future = self.caller.submit(proxy, timeout=1.0, retries=2, retry_delay=0.02)
+        self.assert_finishes(future)
+        self.assertEqual(future.status, Service_future.FAILED)
+        self.assertIsInstance(future.error, RuntimeError)
+        self.assertEqual(str(future.error), 'call 3 failed')
+        self.assertEqual(future.attempts, 3)
+        # no attempt after the last one
+        time.sleep(0.1)
+        self.assertEqual(proxy.calls, 3)
+
+    def test_rejected_until_retries_are_exhausted(self):
+        proxy = Stub_proxy(respond('bad'))
+        future = self.caller.submit(proxy, timeout=1.0, retries=1, retry_delay=0.02, check=lambda response: False)
+        self.assert_finishes(future)
+        self.assertEqual((future.status, future.response, future.error), (Service_future.FAILED, 'bad', 'rejected'))
+        self.assertEqual(future.attempts, 2)
+
+    def test_timeout_without_retries(self):
+        proxy = Stub_proxy(block_until(self.release))
+        t_start = monotonic()
+        future = self.caller.submit(proxy, timeout=0.1)
+        self.assert_finishes(future)
+        self.assertGreaterEqual(monotonic() - t_start, 0.1)
+        self.assertEqual((future.status, future.error), (Service_future.FAILED, 'timed out after 0.1s'))
+
+    def test_cancelled_call_is_not_retried(self):
+        proxy = Stub_proxy(fail, respond('ok'))
+        future = self.caller.submit(proxy, timeout=1.0, retries=1, retry_delay=0.1)
+        self.assertTrue(wait_until(lambda: proxy.calls == 1))
+        self.assertTrue(future.cancel())
+        time.sleep(0.2)
+        self.assertEqual(proxy.calls, 1)
+        self.assertEqual((future.status, future.error), (Service_future.CANCELLED, 'cancelled'))
+
+
+if __name__ == '__main__':
+    unittest.main()
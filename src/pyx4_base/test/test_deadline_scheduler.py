@@ -0,0 +1,213 @@
+#!/usr/bin/env python2
+"""
+Unit tests for deadline_scheduler - the monotonic clock, deadline ordering, cancel and rearm. No roscore needed.
+
+usage: python test/test_deadline_scheduler.py
+"""
+from __future__ import division
+
+import os
+import sys
+import time
+import unittest
+from threading import Event, Lock, Thread
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import deadline_scheduler
+from deadline_scheduler import Deadline_scheduler, monotonic
+
+WAIT_S = 2.0    # upper bound on how long a test waits for a callback that should run
+
+
+class Recorder(object):
+    """ callback that records (label, monotonic time) and signals once 'expected' calls have been made """
+
+    def __init__(self, expected=1):
+        self.calls = []
+        self.expected = expected
+        self.done = Event()
+        self._lock = Lock()
+
+    def __call__(self, label):
+        with self._lock:
+            self.calls.append((label, monotonic()))
+            if len(self.calls) >= self.expected:
+                self.done.set()
+
+    @property
+    def labels(self):
+        return [label for label, _ in self.calls]
+
+
+class Deadline_scheduler_test(unittest.TestCase):
+
+    def setUp(self):
+        self.scheduler = Deadline_scheduler(name='test_scheduler')
+
+    def tearDown(self):
+        self.scheduler.shutdown()
+
+    def test_callbacks_run_in_deadline_order(self):
+        recorder = Recorder(expected=4)
+        for label, delay in (('c', 0.15), ('a', 0.05), ('d', 0.2), ('b', 0.1)):
+            self.scheduler.call_later(delay, recorder, label)
+        self.assertTrue(recorder.done.wait(WAIT_S))
+        self.assertEqual(recorder.labels, ['a', 'b', 'c', 'd'])
+
+    def test_callback_is_not_run_early(self):
+        recorder = Recorder()
+        t_start = monotonic()
+        handle = self.scheduler.call_later(0.1, recorder, 'a')
+        self.assertTrue(recorder.done.wait(WAIT_S))
+        self.assertGreaterEqual(recorder.calls[0][1] - t_start, 0.1)
+        self.assertTrue(handle.fired)
+        self.assertFalse(handle.active)
+
+    def test_cancel(self):
+        recorder = Recorder()
+        cancelled = self.scheduler.call_later(0.05, recorder, 'cancelled')
+        self.scheduler.call_later(0.1, recorder, 'kept')
+        self.scheduler.cancel(cancelled)
+        self.assertFalse(cancelled.active)
+        self.assertTrue(recorder.done.wait(WAIT_S))
+        self.assertEqual(recorder.labels, ['kept'])
+        self.assertFalse(cancelled.fired)
+
+    def test_cancel_none_is_a_no_op(self):
+        self.scheduler.cancel(None)
+
+    def test_rearm_later(self):
+        # the original heap entry comes due first and has to be re-pushed rather than fired
+        recorder = Recorder(expected=2)
+        t_start = monotonic()
+        handle = self.scheduler.call_later(0.05, recorder, 'rearmed')
+        self.scheduler.call_later(0.1, recorder, 'marker')
+        self.scheduler.rearm(handle, 0.2)
+        self.assertTrue(recorder.done.wait(WAIT_S))
+        self.assertEqual(recorder.labels, ['marker', 'rearmed'])
+        self.assertGreaterEqual(recorder.calls[1][1] - t_start, 0.2)
+
+    def test_rearm_earlier(self):
+        recorder = Recorder(expected=2)
+        handle = self.scheduler.call_later(0.5, recorder, 'rearmed')
+        self.scheduler.call_later(0.15, recorder, 'marker')
+        self.scheduler.rearm(handle, 0.05)
+        self.assertTrue(recorder.done.wait(WAIT_S))
+        self.assertEqual(recorder.labels, ['rearmed', 'marker'])
+
+    def test_repeated_rearm_fires_once(self):
+        recorder = Recorder(expected=2)
+        handle = self.scheduler.call_later(0.05, recorder, 'rearmed')
+        for delay in (0.3, 0.02, 0.25, 0.1):
+            self.scheduler.rearm(handle, delay)
+        self.scheduler.call_later(0.4, recorder, 'marker')
+        self.assertTrue(recorder.done.wait(WAIT_S))
+        self.assertEqual(recorder.labels, ['rearmed', 'marker'])
+
+    def test_rearm_after_cancel(self):
+        recorder = Recorder()
+        handle = self.scheduler.call_later(0.05, recorder, 'a')
+        self.scheduler.cancel(handle)
+        self.scheduler.rearm(handle, 0.1)
+        self.assertTrue(handle.active)
+        self.assertTrue(recorder.done.wait(WAIT_S))
+        self.assertEqual(recorder.labels, ['a'])
+
+    def test_cancel_after_rearm(self):
+        recorder = Recorder()
+        handle = self.scheduler.call_later(0.05, recorder, 'cancelled')
+        self.scheduler.rearm(handle, 0.1)
+        self.scheduler.cancel(handle)
+        self.scheduler.call_later(0.2, recorder, 'marker')
+        self.assertTrue(recorder.done.wait(WAIT_S))
+        self.assertEqual(recorder.labels, ['marker'])
+
+    def test_rearm_after_firing(self):
+        recorder = Recorder()
+        handle = self.scheduler.call_later(0.02, recorder, 'a')
+        self.assertTrue(recorder.done.wait(WAIT_S))
+        recorder.done.clear()
+        recorder.expected = 2
+        self.scheduler.rearm(handle, 0.02)
+        self.assertTrue(recorder.done.wait(WAIT_S))
+        self.assertEqual(recorder.labels, ['a', 'a'])
+
+    def test_failing_callback_doesnt_stop_the_scheduler(self):
+        def fail():
+            raise RuntimeError('callback failure')
+        recorder = Recorder()
+        self.scheduler.call_later(0.02, fail)
+        self.scheduler.call_later(0.05, recorder, 'after')
+        self.assertTrue(recorder.done.wait(WAIT_S))
+        self.assertEqual(recorder.labels, ['after'])
+
+
+
+class Polling_wait_test(Deadline_scheduler_test):
+    """ the same tests with the wait that python 2 and python 3 before 3.11 use """
+
+    def setUp(self):
+        Deadline_scheduler_test.setUp(self)
+        self.scheduler._monotonic_wait = False
+
+    def test_wait_times_out(self):
+        with self.scheduler._cond:
+            t_start = monotonic()
+            self.scheduler._wait(0.05)
+            self.assertGreaterEqual(monotonic() - t_start, 0.05)
+
+    def test_wake_ends_the_wait(self):
+        def wake():
+            time.sleep(0.05)
+            with self.scheduler._cond:
+                self.scheduler._wake()
+
+        thread = Thread(target=wake)
+        with self.scheduler._cond:
+            thread.start()
+            t_start = monotonic()
+            self.scheduler._wait(WAIT_S)
+            self.assertLess(monotonic() - t_start, WAIT_S / 2)
+        thread.join()
+
+
+class Monotonic_test(unittest.TestCase):
+
+    def assert_monotonic(self, clock):
+        self.assertIsNot(clock, time.time)
+        last = clock()
+        for _ in range(10000):
+            now = clock()
+            self.assertGreaterEqual(now, last)
+            last = now
+
+    def test_clock_is_not_wall_time(self):
+        self.assert_monotonic(monotonic)
+
+    def test_clock_gettime_fallback(self):
+        # the clock used on python 2 - tested wherever ctypes can reach clock_gettime
+        clock = deadline_scheduler._clock_gettime_monotonic()
+        self.assert_monotonic(clock)
+        if hasattr(time, 'monotonic'):
+            self.assertAlmostEqual(clock(), time.monotonic(), delta=0.01)
+        t_start = clock()
+        time.sleep(0.05)
+        self.assertAlmostEqual(clock() - t_start, 0.05, delta=0.04)
+
+    def test_clock_ignores_wall_time_steps(self):
+        wall_time = time.time
+        before = (monotonic(), deadline_scheduler._clock_gettime_monotonic()())
+        # as if the system time were set back by a day
+        time.time = lambda: wall_time() - 86400.0
+        try:
+            after = (monotonic(), deadline_scheduler._clock_gettime_monotonic()())
+        finally:
+            time.time = wall_time
+        for t_before, t_after in zip(before, after):
+            self.assertGreaterEqual(t_after, t_before)
+            self.assertLess(t_after - t_before, 1.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,158 @@
+#!/usr/bin/env python2
+"""
+Unit tests for instruction_source.Instruction_source - lookahead, release and mission updates. No ROS needed.
+
+usage: python test/test_instruction_source.py
+"""
+from __future__ import division
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from instruction_source import Instruction_source
+
+
+class Counting_source(object):
+    """ iterable of 'label0', 'label1', ... that counts how many instructions have been taken from it """
+
+    def __init__(self, n, label='i'):
+        self.n = n
+        self.label = label
+        self.taken = 0
+
+    def __iter__(self):
+        for idx in range(self.n):
+            self.taken += 1
+            yield self.label + str(idx)
+
+
+def drain(source, start=0):
+    """ every instruction from start to the end of the source """
+    instructions = []
+    idx = start
+    while True:
+        instructions.append(source[idx])
+        if source.is_last(idx):
+            return instructions
+        idx += 1
+
+
+class Instruction_source_test(unittest.TestCase):
+
+    def test_dictionary_is_read_in_index_order(self):
+        source = Instruction_source({2: 'c', 0: 'a', 1: 'b'})
+        self.assertEqual(drain(source), ['a', 'b', 'c'])
+        self.assertTrue(source.exhausted)
+        self.assertEqual(len(source), 3)
+
+    def test_wrap_keeps_an_existing_source(self):
+        source = Instruction_source(['a'])
+        self.assertIs(Instruction_source.wrap(source), source)
+
+    def test_lookahead_bounds_materialisation(self):
+        iterable = Counting_source(100)
+        source = Instruction_source(iterable, lookahead=2)
+        self.assertEqual(iterable.taken, 0)
+        self.assertEqual(source[0], 'i0')
+        self.assertEqual(iterable.taken, 3)
+        self.assertEqual(source[5], 'i5')
+        self.assertEqual(iterable.taken, 8)
+        self.assertEqual(len(source), 8)
+        self.assertFalse(source.exhausted)
+
+    def test_is_last(self):
+        source = Instruction_source(Counting_source(3), lookahead=0)
+        self.assertFalse(source.is_last(0))
+        self.assertFalse(source.is_last(1))
+        self.assertTrue(source.is_last(2))
+        self.assertTrue(source.is_last(5))
+
+    def test_empty_source(self):
+        source = Instruction_source(iter(()))
+        self.assertRaises(IndexError, lambda: source[0])
+        self.assertTrue(source.is_last(-1))
+
+    def test_release(self):
+        source = Instruction_source(Counting_source(5))
+        self.assertEqual(source[1], 'i1')
+        source.release(0)
+        self.assertRaises(IndexError, lambda: source[0])
+        self.assertEqual(source.buffered(), ['i1', 'i2', 'i3'])
+
+    def test_index_beyond_the_end(self):
+        source = Instruction_source(Counting_source(2))
+        self.assertRaises(IndexError, lambda: source[2])
+
+    def test_append(self):
+        source = Instruction_source(Counting_source(2))
+        self.assertTrue(source.is_last(1))
+        source.append(['x0', 'x1'])
+        self.assertFalse(source.exhausted)
+        self.assertEqual(drain(source), ['i0', 'i1', 'x0', 'x1'])
+
+    def test_append_to_an_unread_source(self):
+        source = Instruction_source(Counting_source(3))
+        source.append(['x0'])
+        self.assertEqual(drain(source), ['i0', 'i1', 'i2', 'x0'])
+
+    def test_insert_into_the_lookahead_window(self):
+        # i2 and i3 are already buffered - they have to come back out of the buffer after the inserted instructions
+        iterable = Counting_source(6)
+        source = Instruction_source(iterable, lookahead=2)
+        self.assertEqual(source[1], 'i1')
+        self.assertEqual(iterable.taken, 4)
+        source.insert(2, ['x0', 'x1'])
+        self.assertEqual(source[1], 'i1')
+        self.assertEqual(drain(source, 2), ['x0', 'x1', 'i2', 'i3', 'i4', 'i5'])
+
+    def test_insert_beyond_the_lookahead_window(self):
+        source = Instruction_source(Counting_source(8), lookahead=1)
+        self.assertEqual(source[0], 'i0')
+        source.insert(5, ['x0'])
+        self.assertEqual(drain(source), ['i0', 'i1', 'i2', 'i3', 'i4', 'x0', 'i5', 'i6', 'i7'])
+
+    def test_insert_past_the_end_appends(self):
+        source = Instruction_source(Counting_source(2))
+        source.insert(10, ['x0'])
+        self.assertEqual(drain(source), ['i0', 'i1', 'x0'])
+
+    def test_replace_from_drops_the_buffered_tail(self):
+        iterable = Counting_source(6)
+        source = Instruction_source(iterable, lookahead=3)
+        self.assertEqual(source[1], 'i1')
+        self.assertEqual(iterable.taken, 5)
+        source.replace_from(2, ['x0', 'x1'])
+        self.assertEqual(drain(source), ['i0', 'i1', 'x0', 'x1'])
+        self.assertEqual(len(source), 4)
+        # the rest of the original source is never read
+        self.assertEqual(iterable.taken, 5)
+
+    def test_replace_from_beyond_the_lookahead_window(self):
+        source = Instruction_source(Counting_source(10), lookahead=0)
+        self.assertEqual(source[0], 'i0')
+        source.replace_from(4, ['x0'])
+        self.assertEqual(drain(source), ['i0', 'i1', 'i2', 'i3', 'x0'])
+
+    def test_replace_from_with_nothing_ends_the_mission(self):
+        source = Instruction_source(Counting_source(5))
+        self.assertEqual(source[1], 'i1')
+        source.replace_from(2, [])
+        self.assertTrue(source.is_last(1))
+        self.assertRaises(IndexError, lambda: source[2])
+
+    def test_splice_after_release(self):
+        # the commander releases completed instructions - updates only ever touch instructions after the active one
+        source = Instruction_source(Counting_source(5), lookahead=1)
+        for idx in range(3):
+            self.assertEqual(source[idx], 'i' + str(idx))
+            if idx:
+                source.release(idx - 1)
+        source.insert(3, ['x0'])
+        self.assertEqual(drain(source, 2), ['i2', 'x0', 'i3', 'i4'])
+
+
+if __name__ == '__main__':
+    unittest.main()
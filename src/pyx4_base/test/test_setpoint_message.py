@@ -0,0 +1,117 @@
+#!/usr/bin/env python2
+"""
+Unit tests for setpoint_message - the cached encoding of Cached_position_target against a fresh PositionTarget
+serialisation. Needs mavros_msgs but no roscore.
+
+usage: python test/test_setpoint_message.py
+"""
+from __future__ import division
+
+from io import BytesIO
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mavros_msgs.msg import PositionTarget
+
+from setpoint_message import Cached_position_target, as_cached_position_target, fill_position_target
+
+SNAPSHOT = (1.5, -2.0, 3.25, 0.5, 0.0, -0.25, 1.2, 0.1, PositionTarget.FRAME_LOCAL_NED, 3064)
+
+
+def serialised(msg):
+    buff = BytesIO()
+    msg.serialize(buff)
+    return buff.getvalue()
+
+
+def fresh_serialised(msg):
+    """ the message encoded as a plain PositionTarget, without any caching """
+    buff = BytesIO()
+    PositionTarget.serialize(msg, buff)
+    return buff.getvalue()
+
+
+class Cached_position_target_test(unittest.TestCase):
+
+    def setUp(self):
+        self.msg = fill_position_target(Cached_position_target(), SNAPSHOT)
+        self.msg.header.frame_id = 'map'
+
+    def test_first_serialisation(self):
+        self.assertEqual(serialised(self.msg), fresh_serialised(self.msg))
+
+    def test_header_patch(self):
+        serialised(self.msg)
+        for seq, secs, nsecs in ((1, 10, 0), (2, 10, 999999999), (2 ** 32 - 1, 2 ** 31, 5)):
+            self.msg.header.seq = seq
+            self.msg.header.stamp.secs = secs
+            self.msg.header.stamp.nsecs = nsecs
+            self.assertEqual(serialised(self.msg), fresh_serialised(self.msg))
+
+    def test_setpoint_change_needs_mark_dirty(self):
+        before = serialised(self.msg)
+        self.msg.position.x = 42.0
+        # the documented contract - without mark_dirty the previous setpoint is still sent
+        self.assertEqual(serialised(self.msg), before)
+        self.msg.mark_dirty()
+        self.assertEqual(serialised(self.msg), fresh_serialised(self.msg))
+        self.assertNotEqual(serialised(self.msg), before)
+
+    def test_every_field_after_mark_dirty(self):
+        serialised(self.msg)
+        changed = (9.0, 8.0, 7.0, 6.0, 5.0, 4.0, -1.0, -0.5, PositionTarget.FRAME_BODY_NED, 1479)
+        for idx in range(len(changed)):
+            snapshot = SNAPSHOT[:idx] + changed[idx:idx + 1] + SNAPSHOT[idx + 1:]
+            fill_position_target(self.msg, snapshot).mark_dirty()
+            self.msg.header.seq = idx
+            self.assertEqual(serialised(self.msg), fresh_serialised(self.msg), 'field {}'.format(idx))
+
+    def test_frame_id_is_part_of_the_cached_tail(self):
+        serialised(self.msg)
+        self.msg.header.frame_id = 'base_link'
+        self.msg.mark_dirty()
+        self.assertEqual(serialised(self.msg), fresh_serialised(self.msg))
+
+    def test_serialises_into_a_shared_buffer(self):
+        # rospy serialises each message after whatever is already in its buffer
+        buff = BytesIO()
+        buff.write(b'prefix')
+        self.msg.serialize(buff)
+        self.msg.serialize(buff)
+        expected = fresh_serialised(self.msg)
+        self.assertEqual(buff.getvalue(), b'prefix' + expected + expected)
+
+
+class As_cached_position_target_test(unittest.TestCase):
+
+    def test_cached_message_is_returned_as_is(self):
+        msg = Cached_position_target()
+        self.assertIs(as_cached_position_target(msg), msg)
+
+    def test_copy_of_a_plain_message(self):
+        msg = fill_position_target(PositionTarget(), SNAPSHOT)
+        msg.header.seq = 7
+        msg.header.frame_id = 'map'
+        cached = as_cached_position_target(msg)
+        self.assertIsInstance(cached, Cached_position_target)
+        self.assertEqual(serialised(cached), fresh_serialised(msg))
+        # a deep copy - the original can be reused without changing the copy
+        msg.position.x = 100.0
+        msg.header.frame_id = 'other'
+        self.assertEqual(cached.position.x, SNAPSHOT[0])
+        self.assertEqual(cached.header.frame_id, 'map')
+
+
+class Fill_position_target_test(unittest.TestCase):
+
+    def test_fields(self):
+        msg = fill_position_target(PositionTarget(), SNAPSHOT)
+        self.assertEqual((msg.position.x, msg.position.y, msg.position.z, msg.velocity.x, msg.velocity.y,
+                          msg.velocity.z, msg.yaw, msg.yaw_rate, msg.coordinate_frame, msg.type_mask), SNAPSHOT)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,125 @@
+#!/usr/bin/env python2
+"""
+Unit tests for setpoint_publisher.Setpoint_publisher - the deadline loop, keep-alives and the clock it runs on. Runs
+the loop for a fraction of a second against stand-in vehicles. No roscore needed.
+
+usage: python test/test_setpoint_publisher.py
+"""
+from __future__ import division
+
+import os
+import sys
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import rospy
+
+import setpoint_publisher
+from deadline_scheduler import monotonic
+from setpoint_publisher import Setpoint_publisher, GAP_WARNING_S
+
+RUN_S = 0.3
+TIMING_TOLERANCE_S = 0.005  # the stand-in publisher stamps a publish a little after the loop does
+
+
+class Publisher(object):
+    """ records the monotonic time of each publish """
+
+    def __init__(self, delays=()):
+        self.times = []
+        self.delays = list(delays)
+
+    def publish(self, msg):
+        self.times.append(monotonic())
+        if self.delays:
+            time.sleep(self.delays.pop(0))
+
+
+class Mavros_interface(object):
+    def __init__(self, mavros_ns='', delays=()):
+        self.mavros_ns = mavros_ns
+        self.recorder = None
+        self.local_pos_pub_raw = Publisher(delays)
+
+
+class Commander(object):
+    def __init__(self):
+        self.sp_raw = object()
+        self.setpoint_snapshot = (0.0, 0.0, 1.0)
+        self.setpoint_streaming = False
+
+
+def gaps(times):
+    return [b - a for a, b in zip(times, times[1:])]
+
+
+class Setpoint_publisher_test(unittest.TestCase):
+
+    def setUp(self):
+        self._is_shutdown = rospy.is_shutdown
+        self._wall_time = time.time
+
+    def tearDown(self):
+        rospy.is_shutdown = self._is_shutdown
+        time.time = self._wall_time
+
+    def run_loop(self, publisher, seconds=RUN_S):
+        end = monotonic() + seconds
+        rospy.is_shutdown = lambda: monotonic() >= end
+        publisher.run()
+
+    def make_publisher(self, **kwargs):
+        publisher = Setpoint_publisher(diagnostics_period=100.0, **kwargs)
+        vehicle = Mavros_interface()
+        publisher.add_vehicle(vehicle, Commander())
+        return publisher, vehicle
+
+    def test_loop_clock_is_not_wall_time(self):
+        self.assertIsNot(setpoint_publisher.monotonic, time.time)
+
+    def test_every_setpoint_at_the_loop_rate(self):
+        publisher, vehicle = self.make_publisher(ros_rate=50)
+        self.run_loop(publisher)
+        published = vehicle.local_pos_pub_raw.times
+        self.assertGreaterEqual(len(published), 0.5 * RUN_S * 50)
+        self.assertLessEqual(len(published), RUN_S * 50 + 2)
+        self.assertLess(max(gaps(published)), GAP_WARNING_S)
+        self.assertEqual(publisher.publish_stats[''].published, len(published))
+        self.assertEqual(publisher.loop_stats.periods.count, len(published) - 1)
+
+    def test_keep_alive(self):
+        publisher, vehicle = self.make_publisher(ros_rate=100, keep_alive_rate=10)
+        self.run_loop(publisher)
+        stats = publisher.publish_stats['']
+        # the first setpoint is a change, the rest are keep-alives one keep-alive period apart
+        self.assertEqual(stats.on_change, 1)
+        self.assertGreater(stats.polls, 3 * stats.published)
+        for gap in gaps(vehicle.local_pos_pub_raw.times):
+            self.assertGreaterEqual(gap, 0.1 - TIMING_TOLERANCE_S)
+            self.assertLess(gap, GAP_WARNING_S)
+
+    def test_missed_deadlines_are_skipped(self):
+        publisher = Setpoint_publisher(ros_rate=100, diagnostics_period=100.0)
+        vehicle = Mavros_interface(delays=(0.0, 0.1))
+        publisher.add_vehicle(vehicle, Commander())
+        self.run_loop(publisher, 0.2)
+        missed = publisher.loop_stats.missed_deadlines
+        self.assertGreaterEqual(missed, 8)
+        # no burst of catch-up publishes after the stall - the loop stays on its period grid minus the skipped deadlines
+        self.assertLessEqual(len(vehicle.local_pos_pub_raw.times), 0.2 * 100 - missed + 2)
+
+    def test_system_time_step_back(self):
+        # the system time is set back by a day while the loop runs
+        publisher, vehicle = self.make_publisher(ros_rate=50)
+        wall_time = self._wall_time
+        time.time = lambda: wall_time() - 86400.0
+        self.run_loop(publisher)
+        published = vehicle.local_pos_pub_raw.times
+        self.assertGreaterEqual(len(published), 0.5 * RUN_S * 50)
+        self.assertLess(max(gaps(published)), GAP_WARNING_S)
+
+
+if __name__ == '__main__':
+    unittest.main()
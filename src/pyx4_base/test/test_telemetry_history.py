@@ -0,0 +1,120 @@
+#!/usr/bin/env python2
+"""
+Unit tests for telemetry_history.Ring_buffer - no ROS needed.
+
+usage: python test/test_telemetry_history.py
+"""
+from __future__ import division
+
+import os
+import sys
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from telemetry_history import Ring_buffer
+
+
+def filled(capacity, n):
+    """ a ring buffer with n samples at t = 0, 1, ... and values (t, 10 t) """
+    buff = Ring_buffer(capacity, ('a', 'b'))
+    for t in range(n):
+        buff.append(float(t), (t, 10 * t))
+    return buff
+
+
+class Ring_buffer_test(unittest.TestCase):
+
+    def test_empty(self):
+        buff = Ring_buffer(4, ('a',))
+        self.assertEqual(len(buff), 0)
+        self.assertIsNone(buff.latest())
+        self.assertEqual(len(buff.times()), 0)
+        self.assertIsNone(buff.interpolate(1.0))
+        self.assertIsNone(buff.mean_since(0.0))
+        t, v = buff.last(1.0)
+        self.assertEqual((len(t), len(v)), (0, 0))
+
+    def test_partially_filled(self):
+        buff = filled(4, 3)
+        self.assertEqual(len(buff), 3)
+        np.testing.assert_array_equal(buff.times(), (0, 1, 2))
+        np.testing.assert_array_equal(buff.values('b'), (0, 10, 20))
+
+    def test_wraparound_keeps_the_newest_samples_oldest_first(self):
+        for n in (4, 5, 7, 8, 9, 23):
+            buff = filled(4, n)
+            self.assertEqual(len(buff), 4)
+            np.testing.assert_array_equal(buff.times(), np.arange(n - 4, n))
+            np.testing.assert_array_equal(buff.values('a'), np.arange(n - 4, n))
+            np.testing.assert_array_equal(buff.values()[:, 1], 10 * np.arange(n - 4, n))
+            t, values = buff.latest()
+            self.assertEqual(t, n - 1)
+            np.testing.assert_array_equal(values, (n - 1, 10 * (n - 1)))
+
+    def test_windows_are_contiguous_views(self):
+        # the mirrored copy means no window ever has to be stitched together from the two ends of the buffer
+        buff = filled(4, 6)
+        for view in (buff.times(), buff.values(), buff.window(3.0, 5.0)[0], buff.last(2.0)[1]):
+            self.assertTrue(view.flags['C_CONTIGUOUS'])
+            self.assertFalse(view.flags['OWNDATA'])
+
+    def test_window_bounds_are_inclusive(self):
+        buff = filled(8, 12)    # holds t = 4 ... 11
+        t, values = buff.window(5.0, 8.0)
+        np.testing.assert_array_equal(t, (5, 6, 7, 8))
+        np.testing.assert_array_equal(values[:, 0], (5, 6, 7, 8))
+        t, _ = buff.window(4.5, 5.5)
+        np.testing.assert_array_equal(t, (5,))
+        t, _ = buff.window(9.0)
+        np.testing.assert_array_equal(t, (9, 10, 11))
+        t, _ = buff.window(0.0, 3.0)
+        self.assertEqual(len(t), 0)
+
+    def test_last_is_relative_to_the_latest_sample(self):
+        buff = filled(8, 12)
+        t, _ = buff.last(2.0)
+        np.testing.assert_array_equal(t, (9, 10, 11))
+
+    def test_mean_since(self):
+        buff = filled(8, 12)
+        self.assertAlmostEqual(buff.mean_since(9.0, 'a'), 10.0)
+        np.testing.assert_allclose(buff.mean_since(9.0), (10.0, 100.0))
+        self.assertIsNone(buff.mean_since(20.0))
+
+    def test_interpolate(self):
+        buff = filled(4, 6)     # holds t = 2 ... 5
+        self.assertAlmostEqual(buff.interpolate(3.25, 'a'), 3.25)
+        self.assertAlmostEqual(buff.interpolate(3.25, 'b'), 32.5)
+        np.testing.assert_allclose(buff.interpolate(4.5), (4.5, 45.0))
+        # exactly on a sample
+        self.assertAlmostEqual(buff.interpolate(4.0, 'b'), 40.0)
+        self.assertAlmostEqual(buff.interpolate(2.0, 'a'), 2.0)
+        self.assertAlmostEqual(buff.interpolate(5.0, 'a'), 5.0)
+
+    def test_interpolate_across_the_wrap_point(self):
+        # the samples either side of t = 4.5 are stored at the end and the start of the underlying buffer
+        buff = filled(5, 7)     # holds t = 2 ... 6, t = 4 is in the last slot and t = 5 in the first
+        self.assertAlmostEqual(buff.interpolate(4.5, 'a'), 4.5)
+        self.assertAlmostEqual(buff.interpolate(4.5, 'b'), 45.0)
+
+    def test_interpolate_outside_the_stored_samples(self):
+        buff = filled(4, 6)
+        self.assertIsNone(buff.interpolate(1.0, 'a'))
+        self.assertIsNone(buff.interpolate(6.5, 'a'))
+        self.assertEqual(buff.interpolate(1.0, 'a', clamp=True), 2.0)
+        self.assertEqual(buff.interpolate(6.5, 'a', clamp=True), 5.0)
+
+    def test_clear(self):
+        buff = filled(4, 6)
+        buff.clear()
+        self.assertEqual(len(buff), 0)
+        self.assertIsNone(buff.latest())
+        buff.append(10.0, (1, 2))
+        np.testing.assert_array_equal(buff.times(), (10.0,))
+
+
+if __name__ == '__main__':
+    unittest.main()
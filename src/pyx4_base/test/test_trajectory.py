@@ -0,0 +1,142 @@
+#!/usr/bin/env python2
+"""
+Unit tests for trajectory.Min_jerk_trajectory - boundary conditions and the velocity / acceleration / jerk limits.
+No ROS needed.
+
+usage: python test/test_trajectory.py
+"""
+from __future__ import division
+
+import math
+import os
+import sys
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from trajectory import Min_jerk_trajectory, min_jerk_duration
+
+LIMITS = (5.0, 3.0, 4.0)    # max_vel, max_acc, max_jerk - the Waypoint_state defaults
+
+
+class Vector(object):
+    def __init__(self):
+        self.x = self.y = self.z = 0.0
+
+
+class Position_target(object):
+    """ the fields of a mavros_msgs/PositionTarget that Min_jerk_trajectory.fill writes """
+    def __init__(self):
+        self.position = Vector()
+        self.velocity = Vector()
+
+
+def profile(trajectory, n=4001):
+    """ time step, positions (n x 3) and velocities (n x 3) sampled over the whole trajectory """
+    times = np.linspace(trajectory.t0, trajectory.end_time, n)
+    samples = [trajectory.sample(t) for t in times]
+    return times[1] - times[0], np.array([p for p, _ in samples]), np.array([v for _, v in samples])
+
+
+def speed(vectors):
+    return np.sqrt((vectors ** 2).sum(axis=1))
+
+
+class Min_jerk_trajectory_test(unittest.TestCase):
+
+    def assert_vector_almost_equal(self, a, b, places=9):
+        for a_i, b_i in zip(a, b):
+            self.assertAlmostEqual(a_i, b_i, places=places)
+
+    def test_no_trajectory_for_no_move(self):
+        self.assertEqual(min_jerk_duration(0.0, *LIMITS), 0.0)
+        self.assertIsNone(Min_jerk_trajectory.between((1, 2, 3), (1, 2, 3), 0.0, *LIMITS))
+
+    def test_boundary_conditions(self):
+        start, end = (1.0, -2.0, 3.0), (4.0, 2.0, 3.5)
+        trajectory = Min_jerk_trajectory.between(start, end, 10.0, *LIMITS)
+        self.assertEqual(trajectory.end_time, 10.0 + trajectory.duration)
+
+        position, velocity = trajectory.sample(10.0)
+        self.assert_vector_almost_equal(position, start)
+        self.assert_vector_almost_equal(velocity, (0, 0, 0))
+        position, velocity = trajectory.sample(trajectory.end_time)
+        self.assert_vector_almost_equal(position, end)
+        self.assert_vector_almost_equal(velocity, (0, 0, 0))
+
+        # just inside the ends the vehicle is still (almost) at rest
+        for t in (10.0 + 1e-4, trajectory.end_time - 1e-4):
+            self.assertLess(max(abs(v) for v in trajectory.sample(t)[1]), 1e-6)
+
+    def test_clamped_outside_the_trajectory(self):
+        start, end = (0.0, 0.0, 2.0), (10.0, 0.0, 2.0)
+        trajectory = Min_jerk_trajectory.between(start, end, 5.0, *LIMITS)
+        self.assertEqual(trajectory.sample(0.0), (start, (0.0, 0.0, 0.0)))
+        self.assertEqual(trajectory.sample(trajectory.end_time + 100), (end, (0.0, 0.0, 0.0)))
+
+    def test_symmetric_about_the_midpoint(self):
+        start, end = (0.0, 0.0, 0.0), (6.0, -8.0, 0.0)
+        trajectory = Min_jerk_trajectory.between(start, end, 0.0, *LIMITS)
+        position, velocity = trajectory.sample(trajectory.duration / 2)
+        self.assert_vector_almost_equal(position, (3.0, -4.0, 0.0))
+        # the peak speed of the profile is reached half way
+        self.assertAlmostEqual(math.sqrt(sum(v * v for v in velocity)), 1.875 * 10.0 / trajectory.duration)
+
+    def test_straight_line(self):
+        start, end = np.array((1.0, 1.0, 1.0)), np.array((4.0, 5.0, 1.0))
+        trajectory = Min_jerk_trajectory.between(start, end, 0.0, *LIMITS)
+        _, positions, velocities = profile(trajectory, 101)
+        direction = (end - start) / np.linalg.norm(end - start)
+        offsets = positions - start
+        np.testing.assert_allclose(np.cross(offsets, direction), 0.0, atol=1e-9)
+        np.testing.assert_allclose(np.cross(velocities, direction), 0.0, atol=1e-9)
+        # never moves backwards or overshoots
+        progress = offsets.dot(direction)
+        self.assertTrue(np.all(np.diff(progress) >= 0))
+        self.assertLessEqual(progress.max(), np.linalg.norm(end - start) + 1e-9)
+
+    def test_velocity_is_the_derivative_of_position(self):
+        trajectory = Min_jerk_trajectory.between((0, 0, 0), (3.0, 1.0, -2.0), 0.0, *LIMITS)
+        dt, positions, velocities = profile(trajectory)
+        numerical = np.gradient(positions, dt, axis=0)
+        np.testing.assert_allclose(numerical[1:-1], velocities[1:-1], atol=1e-3)
+
+    def test_limits_are_respected_and_one_is_reached(self):
+        for distance in (0.1, 1.0, 5.0, 14.0, 100.0):
+            trajectory = Min_jerk_trajectory.between((0, 0, 0), (distance, 0, 0), 0.0, *LIMITS)
+            dt, _, velocities = profile(trajectory)
+            accelerations = np.gradient(velocities, dt, axis=0)
+            jerks = np.gradient(accelerations, dt, axis=0)
+            # tolerances for the finite differences
+            usage = (speed(velocities).max() / LIMITS[0],
+                     speed(accelerations).max() / LIMITS[1] / 1.001,
+                     speed(jerks[2:-2]).max() / LIMITS[2] / 1.01)
+            for used in usage:
+                self.assertLessEqual(used, 1.0 + 1e-9, 'distance {} uses {} of the limits'.format(distance, usage))
+            # the duration is the shortest within the limits - at least one of them is (almost) reached
+            self.assertGreater(max(usage), 0.98, 'distance {} uses {} of the limits'.format(distance, usage))
+
+    def test_limits_in_3d(self):
+        trajectory = Min_jerk_trajectory.between((1, 2, 3), (-4, 9, 0), 0.0, *LIMITS)
+        dt, _, velocities = profile(trajectory)
+        accelerations = np.gradient(velocities, dt, axis=0)
+        self.assertLessEqual(speed(velocities).max(), LIMITS[0] + 1e-9)
+        self.assertLessEqual(speed(accelerations).max(), LIMITS[1] * 1.001)
+
+    def test_duration_grows_with_distance(self):
+        durations = [min_jerk_duration(d, *LIMITS) for d in (0.5, 1.0, 2.0, 10.0, 50.0)]
+        self.assertEqual(durations, sorted(durations))
+
+    def test_fill(self):
+        trajectory = Min_jerk_trajectory.between((0, 0, 0), (2.0, 4.0, 6.0), 0.0, *LIMITS)
+        t = trajectory.duration / 3
+        msg = trajectory.fill(Position_target(), t)
+        position, velocity = trajectory.sample(t)
+        self.assertEqual((msg.position.x, msg.position.y, msg.position.z), position)
+        self.assertEqual((msg.velocity.x, msg.velocity.y, msg.velocity.z), velocity)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,125 @@
+#!/usr/bin/env python2
+"""
+Unit tests for the scalar quaternion conversions in utils against the rotation matrix route taken by
+tf.transformations.euler_from_quaternion, on unit and slightly non-unit quaternions. No ROS needed - the comparison
+with tf itself only runs where tf is installed.
+
+usage: python test/test_utils.py
+"""
+from __future__ import division
+
+import math
+import os
+import sys
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import quaternion_to_yaw, quaternion_to_roll_pitch
+
+try:
+    from tf.transformations import euler_from_quaternion
+except ImportError:
+    euler_from_quaternion = None
+
+# mavros poses are normalised to float precision at best - a relative error in the norm of up to 1e-3 covers the
+# rounded quaternions written into mission files and test fixtures as well
+NORM_ERRORS = (0.0, 1e-7, -1e-5, 4e-5, -1e-3, 1e-3)
+# the fixture of benchmarks/yaw_benchmark.py - 30 degrees of yaw rounded to four decimals, |q|^2 = 0.99996
+ROUNDED_QUATERNION = (0.0331, 0.0450, 0.2569, 0.9648)
+
+
+def reference_euler(qx, qy, qz, qw):
+    """
+    roll, pitch and yaw the way tf.transformations.euler_from_quaternion(q, axes='sxyz') computes them - the rotation
+    matrix of the normalised quaternion, then the angles from its entries
+    """
+    q = np.array((qx, qy, qz, qw), dtype=np.float64)
+    n = np.dot(q, q)
+    q *= math.sqrt(2.0 / n)
+    q = np.outer(q, q)
+    m = np.array(((1.0 - q[1, 1] - q[2, 2], q[0, 1] - q[2, 3], q[0, 2] + q[1, 3]),
+                  (q[0, 1] + q[2, 3], 1.0 - q[0, 0] - q[2, 2], q[1, 2] - q[0, 3]),
+                  (q[0, 2] - q[1, 3], q[1, 2] + q[0, 3], 1.0 - q[0, 0] - q[1, 1])))
+    cy = math.sqrt(m[0, 0] * m[0, 0] + m[1, 0] * m[1, 0])
+    return math.atan2(m[2, 1], m[2, 2]), math.atan2(-m[2, 0], cy), math.atan2(m[1, 0], m[0, 0])
+
+
+def random_quaternions(n, seed=0):
+    """ n uniformly distributed unit quaternions (x, y, z, w) """
+    q = np.random.RandomState(seed).normal(size=(n, 4))
+    return q / np.sqrt((q ** 2).sum(axis=1))[:, np.newaxis]
+
+
+def angle_error(a, b):
+    return abs(math.atan2(math.sin(a - b), math.cos(a - b)))
+
+
+class Quaternion_conversion_test(unittest.TestCase):
+
+    def assert_matches(self, expected, q, places=9):
+        roll, pitch = quaternion_to_roll_pitch(*q)
+        actual = (roll, pitch, quaternion_to_yaw(*q))
+        for name, a, b in zip(('roll', 'pitch', 'yaw'), actual, expected):
+            self.assertAlmostEqual(angle_error(a, b), 0.0, places=places,
+                                   msg='{} {} != {} for {}'.format(name, a, b, tuple(q)))
+
+    def test_axis_rotations(self):
+        for angle in (-3.0, -1.2, -0.3, 0.0, 0.4, 1.5, 3.1):
+            s, c = math.sin(angle / 2), math.cos(angle / 2)
+            self.assertAlmostEqual(quaternion_to_yaw(0.0, 0.0, s, c), angle)
+            self.assertAlmostEqual(quaternion_to_roll_pitch(0.0, 0.0, s, c)[0], 0.0)
+            self.assertAlmostEqual(quaternion_to_roll_pitch(s, 0.0, 0.0, c)[0], angle)
+            if abs(angle) < math.pi / 2:
+                self.assertAlmostEqual(quaternion_to_roll_pitch(0.0, s, 0.0, c)[1], angle)
+
+    def test_identity_and_negated_quaternions(self):
+        self.assertEqual(quaternion_to_yaw(0.0, 0.0, 0.0, 1.0), 0.0)
+        self.assertEqual(quaternion_to_roll_pitch(0.0, 0.0, 0.0, 1.0), (0.0, 0.0))
+        # q and -q are the same rotation
+        for q in random_quaternions(100, seed=1):
+            self.assert_matches(reference_euler(*q), -q)
+
+    def test_unit_quaternions(self):
+        for q in random_quaternions(2000):
+            self.assert_matches(reference_euler(*q), q)
+
+    def test_non_unit_quaternions(self):
+        quaternions = random_quaternions(500, seed=2)
+        for norm_error in NORM_ERRORS:
+            for q in quaternions:
+                # the expected angles are those of the rotation, which doesn't depend on the norm
+                self.assert_matches(reference_euler(*q), q * math.sqrt(1.0 + norm_error))
+
+    def test_any_scale(self):
+        for q in random_quaternions(100, seed=3):
+            expected = reference_euler(*q)
+            for scale in (1e-3, 0.5, 2.0, 1e3):
+                self.assert_matches(expected, q * scale)
+
+    def test_rounded_quaternion(self):
+        # the previous formulas assumed a unit quaternion and were 2e-5 rad out in yaw on this one
+        self.assert_matches(reference_euler(*ROUNDED_QUATERNION), ROUNDED_QUATERNION, places=12)
+
+    def test_pitch_near_the_singularity(self):
+        # no math domain error and no clamping needed near +-90 degrees, even when |q| > 1
+        for sign in (1, -1):
+            angle = sign * (math.pi / 2 - 1e-9)
+            q = np.array((0.0, math.sin(angle / 2), 0.0, math.cos(angle / 2))) * 1.001
+            self.assertAlmostEqual(quaternion_to_roll_pitch(*q)[1], angle)
+            q = np.array((0.0, sign * math.sqrt(0.5), 0.0, math.sqrt(0.5))) * 1.001
+            self.assertAlmostEqual(quaternion_to_roll_pitch(*q)[1], sign * math.pi / 2)
+
+    @unittest.skipIf(euler_from_quaternion is None, 'tf is not installed')
+    def test_matches_tf(self):
+        for norm_error in NORM_ERRORS:
+            for q in random_quaternions(500, seed=4):
+                q = q * math.sqrt(1.0 + norm_error)
+                self.assert_matches(euler_from_quaternion(q), q)
+        self.assert_matches(euler_from_quaternion(ROUNDED_QUATERNION), ROUNDED_QUATERNION, places=12)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python2
+"""
+Unit tests for vehicle_state.Vehicle_state_buffer - coherent snapshots under a concurrent writer and the commit
+listeners. No ROS needed.
+
+usage: python test/test_vehicle_state.py
+"""
+from __future__ import division
+
+import os
+import sys
+import threading
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from vehicle_state import Vehicle_state, Vehicle_state_buffer
+
+N_COMMITS = 20000
+
+
+def write_counter(buffer, counter):
+    """ commits a state in which every data field equals counter """
+    state = buffer.begin_write()
+    for field in Vehicle_state._data_fields:
+        setattr(state, field, counter)
+    buffer.commit()
+
+
+class Vehicle_state_buffer_test(unittest.TestCase):
+
+    def setUp(self):
+        self.buffer = Vehicle_state_buffer()
+
+    def test_begin_write_starts_from_the_latest_state(self):
+        state = self.buffer.begin_write()
+        state.x = 1.0
+        state.mode = 'OFFBOARD'
+        self.buffer.commit()
+        state = self.buffer.begin_write()
+        self.assertEqual((state.x, state.mode), (1.0, 'OFFBOARD'))
+        state.y = 2.0
+        self.buffer.commit()
+        out = self.buffer.read(Vehicle_state())
+        self.assertEqual((out.seq, out.x, out.y, out.mode), (2, 1.0, 2.0, 'OFFBOARD'))
+        self.assertEqual(self.buffer.seq, 2)
+        self.assertEqual(self.buffer.front.seq, 2)
+
+    def test_read_copies_into_the_given_container(self):
+        write_counter(self.buffer, 3)
+        out = Vehicle_state()
+        self.assertIs(self.buffer.read(out), out)
+        self.assertIsNot(out, self.buffer.front)
+        # later commits don't change a snapshot that has already been read
+        write_counter(self.buffer, 4)
+        self.assertEqual((out.seq, out.x), (1, 3))
+
+    def test_reads_are_coherent_under_a_concurrent_writer(self):
+        errors = []
+        done = threading.Event()
+
+        def writer():
+            try:
+                for counter in range(1, N_COMMITS + 1):
+                    write_counter(self.buffer, counter)
+            finally:
+                done.set()
+
+        thread = threading.Thread(target=writer)
+        thread.daemon = True
+        out = Vehicle_state()
+        last_seq = 0
+        n_reads = 0
+        thread.start()
+        while not done.is_set() or n_reads == 0:
+            self.buffer.read(out)
+            n_reads += 1
+            if out.seq == 0:
+                # the initial state, from before the writer's first commit
+                continue
+            values = set(getattr(out, field) for field in Vehicle_state._data_fields)
+            if len(values) != 1:
+                errors.append('torn read at seq {}: {}'.format(out.seq, sorted(values, key=str)))
+                break
+            if out.seq < last_seq:
+                errors.append('seq went back from {} to {}'.format(last_seq, out.seq))
+                break
+            # each commit writes its own seq as the counter
+            if values != {out.seq}:
+                errors.append('seq {} holds the fields of commit {}'.format(out.seq, values.pop()))
+                break
+            last_seq = out.seq
+        thread.join(10.0)
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(errors, [])
+        self.assertEqual(self.buffer.read(out).seq, N_COMMITS)
+        self.assertEqual(out.x, N_COMMITS)
+
+    def test_commit_listeners_get_the_committed_buffer(self):
+        calls = []
+        self.buffer.add_commit_listener(lambda state: calls.append(('first', state, state.seq, state.x)))
+        self.buffer.add_commit_listener(lambda state: calls.append(('second', state, state.seq, state.x)))
+        write_counter(self.buffer, 5)
+        front = self.buffer.front
+        self.assertEqual(calls, [('first', front, 1, 5), ('second', front, 1, 5)])
+
+    def test_write_lock_is_released_when_a_listener_raises(self):
+        def listener(state):
+            raise RuntimeError('listener failed')
+
+        self.buffer.add_commit_listener(listener)
+        self.buffer.begin_write().x = 1.0
+        self.assertRaises(RuntimeError, self.buffer.commit)
+        # the state was committed and the next writer isn't blocked
+        self.assertEqual(self.buffer.front.x, 1.0)
+        self.assertTrue(self.buffer._write_lock.acquire(False))
+        self.buffer._write_lock.release()
+
+
+if __name__ == '__main__':
+    unittest.main()
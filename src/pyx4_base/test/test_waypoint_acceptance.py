@@ -0,0 +1,142 @@
+#!/usr/bin/env python2
+"""
+Unit tests for waypoint_acceptance - heading wrapping and the batched checks against the scalar ones. No ROS needed.
+
+usage: python test/test_waypoint_acceptance.py
+"""
+from __future__ import division
+
+import math
+import os
+import sys
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from waypoint_acceptance import heading_error_rad, distance_sq, within_tolerance, Waypoint_acceptance_batch
+
+TOL_DISTANCE = 0.2
+TOL_HEADING_RAD = np.deg2rad(5)
+
+
+class Heading_error_test(unittest.TestCase):
+
+    def test_small_errors(self):
+        self.assertAlmostEqual(heading_error_rad(0.1, 0.3), 0.2)
+        self.assertAlmostEqual(heading_error_rad(0.3, 0.1), 0.2)
+        self.assertEqual(heading_error_rad(1.0, 1.0), 0.0)
+
+    def test_wraps_across_pi(self):
+        self.assertAlmostEqual(heading_error_rad(math.pi - 0.1, -math.pi + 0.1), 0.2)
+        self.assertAlmostEqual(heading_error_rad(-math.pi + 0.1, math.pi - 0.1), 0.2)
+        self.assertAlmostEqual(heading_error_rad(0.0, math.pi), math.pi)
+
+    def test_wraps_beyond_two_pi(self):
+        # headings that have been accumulated past a full turn (the previous check only handled one wrap)
+        self.assertAlmostEqual(heading_error_rad(0.1, 0.1 + 2 * math.pi), 0.0)
+        self.assertAlmostEqual(heading_error_rad(0.1, 0.3 + 4 * math.pi), 0.2)
+        self.assertAlmostEqual(heading_error_rad(-6 * math.pi + 0.1, 0.3), 0.2)
+        self.assertAlmostEqual(heading_error_rad(0.0, 5 * math.pi), math.pi)
+
+    def test_range_and_symmetry(self):
+        rng = np.random.RandomState(1)
+        for a, b in rng.uniform(-20, 20, (1000, 2)):
+            error = heading_error_rad(a, b)
+            self.assertGreaterEqual(error, 0.0)
+            self.assertLessEqual(error, math.pi + 1e-12)
+            self.assertAlmostEqual(error, heading_error_rad(b, a))
+            # the same as the angle between the two unit vectors
+            self.assertAlmostEqual(error, abs(math.atan2(math.sin(a - b), math.cos(a - b))))
+
+
+class Scalar_acceptance_test(unittest.TestCase):
+
+    def test_distance_sq(self):
+        self.assertEqual(distance_sq(1, 2, 3, 4, 6, 3), 25)
+
+    def test_within_tolerance(self):
+        target = (1.0, 2.0, 3.0, 0.0)
+        self.assertTrue(within_tolerance(1.1, 2.0, 3.0, 0.01, *(target + (TOL_DISTANCE, TOL_HEADING_RAD))))
+        # too far away
+        self.assertFalse(within_tolerance(1.0, 2.0, 3.3, 0.0, *(target + (TOL_DISTANCE, TOL_HEADING_RAD))))
+        # close enough but facing the wrong way
+        self.assertFalse(within_tolerance(1.0, 2.0, 3.0, 0.2, *(target + (TOL_DISTANCE, TOL_HEADING_RAD))))
+        # facing the right way after a full turn
+        self.assertTrue(within_tolerance(1.0, 2.0, 3.0, 2 * math.pi, *(target + (TOL_DISTANCE, TOL_HEADING_RAD))))
+
+    def test_tolerances_are_exclusive(self):
+        self.assertFalse(within_tolerance(0.5, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.5, 1.0))
+        self.assertFalse(within_tolerance(0.0, 0.0, 0.0, 0.5, 0.0, 0.0, 0.0, 0.0, 1.0, 0.5))
+
+
+class Waypoint_acceptance_batch_test(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        n = 500
+        # waypoints around a small area so that a good share of them is within tolerance of the test poses, with
+        # yaws far outside [-pi, pi]
+        self.targets = np.column_stack((rng.uniform(-0.5, 0.5, (n, 3)), rng.uniform(-4 * np.pi, 4 * np.pi, n)))
+        self.tol_distance = rng.uniform(0.1, 0.6, n)
+        self.tol_heading = rng.uniform(0.05, 1.0, n)
+        self.poses = np.column_stack((rng.uniform(-0.5, 0.5, (50, 3)), rng.uniform(-10, 10, 50)))
+
+    def scalar_reached(self, pose, tol_distance, tol_heading):
+        return np.array([within_tolerance(*(tuple(pose) + tuple(target) + (tol_d, tol_h)))
+                         for target, tol_d, tol_h in zip(self.targets, tol_distance, tol_heading)])
+
+    def test_matches_the_scalar_check(self):
+        batch = Waypoint_acceptance_batch(self.targets, self.tol_distance, self.tol_heading)
+        n_reached = 0
+        for pose in self.poses:
+            expected = self.scalar_reached(pose, self.tol_distance, self.tol_heading)
+            np.testing.assert_array_equal(batch.reached(*pose), expected)
+            n_reached += expected.sum()
+        # the comparison means something - both outcomes occur
+        self.assertGreater(n_reached, 0)
+        self.assertLess(n_reached, len(self.poses) * len(self.targets))
+
+    def test_scalar_tolerances(self):
+        batch = Waypoint_acceptance_batch(self.targets, TOL_DISTANCE, TOL_HEADING_RAD)
+        n = len(self.targets)
+        for pose in self.poses[:10]:
+            np.testing.assert_array_equal(batch.reached(*pose),
+                                          self.scalar_reached(pose, [TOL_DISTANCE] * n, [TOL_HEADING_RAD] * n))
+
+    def test_distance_and_heading_match_the_scalar_functions(self):
+        batch = Waypoint_acceptance_batch(self.targets)
+        x, y, z, yaw = self.poses[0]
+        np.testing.assert_allclose(batch.distance_sq(x, y, z),
+                                   [distance_sq(x, y, z, *target[:3]) for target in self.targets])
+        np.testing.assert_allclose(batch.heading_error(yaw),
+                                   [heading_error_rad(yaw, target[3]) for target in self.targets], atol=1e-12)
+
+    def test_first_reached_and_nearest(self):
+        batch = Waypoint_acceptance_batch(((0, 0, 0, 0), (5, 0, 0, 0), (5, 0.1, 0, 0), (10, 0, 0, 0)))
+        self.assertEqual(len(batch), 4)
+        self.assertEqual(batch.first_reached(5.05, 0.05, 0, 0), 1)
+        self.assertEqual(batch.first_reached(5.05, 0.05, 0, np.pi), -1)
+        self.assertEqual(batch.first_reached(7.5, 0, 0, 0), -1)
+        self.assertEqual(batch.nearest(7.4, 0, 0), 1)
+        self.assertEqual(batch.nearest(7.6, 0, 0), 3)
+
+    def test_empty_batch(self):
+        batch = Waypoint_acceptance_batch(())
+        self.assertEqual(len(batch), 0)
+        self.assertEqual(batch.first_reached(0, 0, 0, 0), -1)
+
+    def test_results_are_reused(self):
+        # documented behaviour - results are overwritten by the next call, so callers copy what they keep
+        batch = Waypoint_acceptance_batch(((0, 0, 0, 0), (1, 0, 0, 0)))
+        first = batch.reached(0, 0, 0, 0)
+        kept = first.copy()
+        second = batch.reached(1, 0, 0, 0)
+        self.assertIs(first, second)
+        np.testing.assert_array_equal(kept, (True, False))
+        np.testing.assert_array_equal(second, (False, True))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python2
+"""
+Per topic inter-arrival statistics used by the mavros interface watchdog.
+
+Every subscribed topic keeps a Topic_stats instance that is updated with the arrival time (in integer nanoseconds)
+of each message. From this we track an EWMA of the message rate, the jitter of the inter-arrival period, the largest
+gap between messages and when the topic was last seen.
+"""
+
+from __future__ import division
+
+from diagnostic_msgs.msg import DiagnosticStatus, KeyValue
+
+NS_PER_S = 1000000000
+
+
+class Topic_stats(object):
+    """
+    Running inter-arrival statistics for a single topic
+    """
+
+    def __init__(self, topic_key, topic_name, stale_after=None, ewma_alpha=0.1):
+        self.topic_key = topic_key
+        self.topic_name = topic_name
+        self.ewma_alpha = ewma_alpha
+        # seconds without a message after which the topic is considered stale (None -> never stale)
+        self.stale_after = stale_after
+
+        self.count = 0
+        self.first_seen_ns = 0
+        self.last_seen_ns = 0
+        self.ewma_period_ns = 0.0
+        self.ewma_jitter_ns = 0.0
+        self.max_gap_ns = 0
+        # total time spent in the topic's callback - maintained by the subscriber
+        self.callback_time_s = 0.0
+
+    def update(self, now_ns):
+        if self.count == 0:
+            self.first_seen_ns = now_ns
+        else:
+            period = now_ns - self.last_seen_ns
+            if period > self.max_gap_ns:
+                self.max_gap_ns = period
+            if self.count == 1:
+                self.ewma_period_ns = float(period)
+            else:
+                self.ewma_jitter_ns += self.ewma_alpha * (abs(period - self.ewma_period_ns) - self.ewma_jitter_ns)
+                self.ewma_period_ns += self.ewma_alpha * (period - self.ewma_period_ns)
+        self.last_seen_ns = now_ns
+        self.count += 1
+
+    def reset_max_gap(self):
+        self.max_gap_ns = 0
+
+    @property
+    def rate_hz(self):
+        if self.ewma_period_ns <= 0:
+            return 0.0
+        return NS_PER_S / self.ewma_period_ns
+
+    @property
+    def jitter_s(self):
+        return self.ewma_jitter_ns / NS_PER_S
+
+    @property
+    def max_gap_s(self):
+        return self.max_gap_ns / NS_PER_S
+
+    def age_s(self, now_ns):
+        """ seconds since the last message (None if nothing has been received yet) """
+        if self.count == 0:
+            return None
+        return (now_ns - self.last_seen_ns) / NS_PER_S
+
+    def is_stale(self, now_ns):
+        """ a topic that has never been received is always stale """
+        if self.count == 0:
+            return True
+        if self.stale_after is None:
+            return False
+        return (now_ns - self.last_seen_ns) > self.stale_after * NS_PER_S
+
+    def __repr__(self):
+        return 'Topic_stats({}: count={} rate={:.1f}Hz jitter={:.4f}s max_gap={:.4f}s)'.format(
+            self.topic_key, self.count, self.rate_hz, self.jitter_s, self.max_gap_s)
+
+
+def stats_to_diagnostic_status(stats, now_ns, hardware_id=''):
+    """
+    Converts a Topic_stats instance into a diagnostic_msgs/DiagnosticStatus
+    """
+    status = DiagnosticStatus()
+    status.name = stats.topic_name
+    status.hardware_id = hardware_id
+
+    age = stats.age_s(now_ns)
+    if stats.is_stale(now_ns):
+        status.level = DiagnosticStatus.ERROR if stats.count else DiagnosticStatus.STALE
+        status.message = 'stale' if stats.count else 'not received'
+    else:
+        status.level = DiagnosticStatus.OK
+        status.message = 'OK'
+
+    status.values = [
+        KeyValue('count', str(stats.count)),
+        KeyValue('rate_hz', '{:.3f}'.format(stats.rate_hz)),
+        KeyValue('jitter_s', '{:.6f}'.format(stats.jitter_s)),
+        KeyValue('max_gap_s', '{:.6f}'.format(stats.max_gap_s)),
+        KeyValue('age_s', 'nan' if age is None else '{:.6f}'.format(age)),
+        KeyValue('stale_after_s', str(stats.stale_after)),
+        KeyValue('callback_time_s', '{:.6f}'.format(stats.callback_time_s)),
+    ]
+    return status
@@ -0,0 +1,75 @@
+#!/usr/bin/env python2
+"""
+Time parametrised trajectories that are streamed to the FCU as position + velocity setpoints.
+
+A Min_jerk_trajectory moves along the straight line between two positions with the minimum jerk (quintic) profile,
+starting and ending at rest. Its duration is the shortest that keeps the peak velocity, acceleration and jerk within
+the given limits. The setpoint publisher samples the trajectory every time it publishes (see
+Generic_mission_state.sp_raw), so the setpoint moves smoothly at the publisher rate rather than jumping to the next
+waypoint.
+"""
+
+from __future__ import division
+
+import math
+
+# peak |s'|, |s''| and |s'''| of the normalised min jerk profile s(tau) = 10 tau^3 - 15 tau^4 + 6 tau^5
+MIN_JERK_PEAK_VEL = 1.875
+MIN_JERK_PEAK_ACC = 10 / math.sqrt(3)
+MIN_JERK_PEAK_JERK = 60.0
+
+
+def min_jerk_duration(distance, max_vel, max_acc, max_jerk):
+    """ the shortest duration (s) of a min jerk move over distance that stays within the limits """
+    if distance <= 0:
+        return 0.0
+    return max(MIN_JERK_PEAK_VEL * distance / max_vel,
+               math.sqrt(MIN_JERK_PEAK_ACC * distance / max_acc),
+               (MIN_JERK_PEAK_JERK * distance / max_jerk) ** (1 / 3))
+
+
+class Min_jerk_trajectory(object):
+    """
+    Straight line min jerk move from start to end (x, y, z tuples) that starts at t0 (monotonic time) - immutable, so
+    it can be shared with the setpoint publisher thread
+    """
+
+    __slots__ = ('start', 'delta', 'duration', 't0')
+
+    def __init__(self, start, end, duration, t0):
+        self.start = tuple(float(value) for value in start)
+        self.delta = tuple(float(e) - s for s, e in zip(self.start, end))
+        self.duration = duration
+        self.t0 = t0
+
+    @staticmethod
+    def between(start, end, t0, max_vel=5.0, max_acc=3.0, max_jerk=4.0):
+        """ the trajectory from start to end within the limits, None if they are the same position """
+        distance = math.sqrt(sum((float(e) - float(s)) ** 2 for s, e in zip(start, end)))
+        duration = min_jerk_duration(distance, max_vel, max_acc, max_jerk)
+        if duration <= 0:
+            return None
+        return Min_jerk_trajectory(start, end, duration, t0)
+
+    @property
+    def end_time(self):
+        return self.t0 + self.duration
+
+    def sample(self, t):
+        """ returns ((x, y, z), (x_vel, y_vel, z_vel)) at time t, clamped to the ends of the trajectory """
+        tau = (t - self.t0) / self.duration
+        if tau <= 0:
+            return self.start, (0.0, 0.0, 0.0)
+        if tau >= 1:
+            return tuple(s + d for s, d in zip(self.start, self.delta)), (0.0, 0.0, 0.0)
+        tau2 = tau * tau
+        s = tau2 * tau * (10 + tau * (-15 + 6 * tau))
+        ds = 30 * tau2 * (1 + tau * (-2 + tau)) / self.duration
+        return (tuple(p + d * s for p, d in zip(self.start, self.delta)),
+                tuple(d * ds for d in self.delta))
+
+    def fill(self, msg, t):
+        """ writes the position and velocity at time t into a PositionTarget """
+        (msg.position.x, msg.position.y, msg.position.z), (msg.velocity.x, msg.velocity.y, msg.velocity.z) = \
+            self.sample(t)
+        return msg
@@ -1,13 +1,61 @@
 #!/usr/bin/env python2
+import math
 import numpy as np
 
 from setpoint_bitmasks import *
-from tf.transformations import euler_from_quaternion
+
+
+def quaternion_to_yaw(qx, qy, qz, qw):
+    """
+    Scalar quaternion to yaw (rotation about z) conversion without building any arrays. The quaternion doesn't have
+    to be normalised - both atan2 arguments scale with its squared norm. Matches the yaw returned by
+    tf.transformations.euler_from_quaternion (static 'sxyz' axes) to rounding, except exactly at +-90 degrees pitch
+    where tf reports the whole rotation as roll and a yaw of 0
+    """
+    return math.atan2(2.0 * (qw * qz + qx * qy), qw * qw + qx * qx - qy * qy - qz * qz)
+
+
+def quaternion_to_roll_pitch(qx, qy, qz, qw):
+    """
+    Scalar quaternion to roll and pitch conversion, scale invariant and with the same exception as quaternion_to_yaw.
+    Pitch comes from atan2 rather than asin so that it needs neither a normalised quaternion nor clamping
+    """
+    ww, xx, yy, zz = qw * qw, qx * qx, qy * qy, qz * qz
+    roll = math.atan2(2.0 * (qw * qx + qy * qz), ww - xx - yy + zz)
+    # cos(pitch) scaled by the squared norm, as tf derives it from the first column of the rotation matrix
+    cos_pitch = math.hypot(ww + xx - yy - zz, 2.0 * (qw * qz + qx * qy))
+    pitch = math.atan2(2.0 * (qw * qy - qz * qx), cos_pitch)
+    return roll, pitch
+
+
+def slerp(q0, q1, fraction):
+    """
+    Spherical linear interpolation between two (x, y, z, w) quaternions - returns a normalised (x, y, z, w) tuple
+    """
+    x0, y0, z0, w0 = q0
+    x1, y1, z1, w1 = q1
+    dot = x0 * x1 + y0 * y1 + z0 * z1 + w0 * w1
+    # take the short way round
+    if dot < 0.0:
+        x1, y1, z1, w1, dot = -x1, -y1, -z1, -w1, -dot
+
+    if dot > 0.9995:
+        # nearly parallel - linear interpolation is accurate and avoids dividing by sin(theta) ~ 0
+        s0, s1 = 1.0 - fraction, fraction
+    else:
+        theta = math.acos(dot)
+        sin_theta = math.sin(theta)
+        s0 = math.sin((1.0 - fraction) * theta) / sin_theta
+        s1 = math.sin(fraction * theta) / sin_theta
+
+    x, y, z, w = s0 * x0 + s1 * x1, s0 * y0 + s1 * y1, s0 * z0 + s1 * z1, s0 * w0 + s1 * w1
+    norm = math.sqrt(x * x + y * y + z * z + w * w)
+    return x / norm, y / norm, z / norm, w / norm
+
 
 def pose2yaw(this_pose):
     orientation_q = this_pose.pose.orientation
-    (_, _, yaw) = euler_from_quaternion([orientation_q.x, orientation_q.y, orientation_q.z, orientation_q.w])
-    return yaw
+    return quaternion_to_yaw(orientation_q.x, orientation_q.y, orientation_q.z, orientation_q.w)
 
 
 def get_bitmask(xy_type, z_type, yaw_type):
@@ -0,0 +1,139 @@
+#!/usr/bin/env python2
+"""
+This module provides a consistent snapshot of the vehicle state as reported by mavros.
+
+The mavros callbacks write into a back buffer which is swapped in as a whole once it has been filled, so consumers
+never see a pose that mixes fields from two different messages.
+"""
+
+from threading import Lock
+
+
+class Vehicle_state(object):
+    """
+    A preallocated container for the vehicle state fields that are read by the commander and the mission states
+    """
+
+    __slots__ = (
+        'seq',
+        'pose_ts',
+        'x', 'y', 'z',
+        'qx', 'qy', 'qz', 'qw',
+        'roll', 'pitch', 'yaw', 'heading_x', 'heading_y',
+        'vel_ts',
+        'x_vel', 'y_vel', 'z_vel', 'xy_vel',
+        'x_vel_bod', 'y_vel_bod', 'xy_vel_bod', 'body_yaw_rate',
+        'landed_state', 'vtol_state',
+        'armed', 'connected', 'mode',
+    )
+
+    # the fields that are copied between buffers - seq is owned by Vehicle_state_buffer
+    _data_fields = __slots__[1:]
+
+    def __init__(self):
+        self.seq = 0
+        self.pose_ts = 0.0
+        self.x = 0.0
+        self.y = 0.0
+        self.z = 0.0
+        self.qx = 0.0
+        self.qy = 0.0
+        self.qz = 0.0
+        self.qw = 1.0
+        self.roll = 0.0
+        self.pitch = 0.0
+        self.yaw = 0.0
+        self.heading_x = 1.0
+        self.heading_y = 0.0
+        self.vel_ts = 0.0
+        self.x_vel = 0.0
+        self.y_vel = 0.0
+        self.z_vel = 0.0
+        self.xy_vel = 0.0
+        self.x_vel_bod = 0.0
+        self.y_vel_bod = 0.0
+        self.xy_vel_bod = 0.0
+        self.body_yaw_rate = 0.0
+        self.landed_state = 0
+        self.vtol_state = 0
+        self.armed = False
+        self.connected = False
+        self.mode = ''
+
+    def copy_from(self, other):
+        """
+        Copies all data fields from another Vehicle_state without allocating a new object
+        """
+        for field in self._data_fields:
+            setattr(self, field, getattr(other, field))
+        return self
+
+    def __repr__(self):
+        return 'Vehicle_state(seq={}, x={}, y={}, z={}, yaw={}, armed={}, mode={})'.format(
+            self.seq, self.x, self.y, self.z, self.yaw, self.armed, self.mode)
+
+
+class Vehicle_state_buffer(object):
+    """
+    Double buffered Vehicle_state.
+
+    Writers (the mavros callbacks) call begin_write() to get the back buffer, which already holds a copy of the
+    latest state, update the fields they own and then call commit() to swap it in. Readers either take the front
+    buffer reference for a single field or use read() to copy one coherent snapshot into a preallocated container.
+    """
+
+    def __init__(self):
+        self._front = Vehicle_state()
+        self._back = Vehicle_state()
+        self._write_lock = Lock()
+        self._seq = 0
+        self._commit_listeners = ()
+
+    @property
+    def front(self):
+        return self._front
+
+    @property
+    def seq(self):
+        return self._seq
+
+    def begin_write(self):
+        self._write_lock.acquire()
+        back = self._back
+        # mark the buffer as being written so that a reader still holding it knows to retry
+        back.seq = -1
+        back.copy_from(self._front)
+        return back
+
+    def add_commit_listener(self, listener):
+        """
+        Registers listener(vehicle_state) to be called with each newly committed state. Listeners run on the writing
+        thread while the write lock is held, so they must be quick and must not write to this buffer.
+        """
+        self._commit_listeners = self._commit_listeners + (listener,)
+
+    def commit(self):
+        self._seq += 1
+        back = self._back
+        back.seq = self._seq
+        self._back = self._front
+        self._front = back
+        try:
+            for listener in self._commit_listeners:
+                listener(back)
+        finally:
+            self._write_lock.release()
+
+    def read(self, out):
+        """
+        Copies the latest committed state into out (a Vehicle_state) and returns it
+        """
+        while True:
+            front = self._front
+            seq = front.seq
+            if seq < 0:
+                continue
+            out.copy_from(front)
+            if front.seq == seq:
+                out.seq = seq
+                return out
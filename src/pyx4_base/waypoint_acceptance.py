@@ -0,0 +1,101 @@
+#!/usr/bin/env python2
+"""
+Waypoint acceptance checks - is the vehicle within a distance and heading tolerance of a target?
+
+The scalar functions are what mission states use every step: plain float arithmetic, comparing squared distances so
+that no square root (or rounding) is needed. Waypoint_acceptance_batch tests many candidate waypoints against the
+current pose in one vectorised call, working in arrays that are allocated once when the batch is built.
+"""
+
+from __future__ import division
+
+import math
+import numpy as np
+
+TWO_PI = 2 * math.pi
+
+
+def heading_error_rad(a, b):
+    """ the absolute difference between two headings (rad), wrapped to [0, pi] """
+    error = abs(a - b) % TWO_PI
+    return TWO_PI - error if error > math.pi else error
+
+
+def distance_sq(x0, y0, z0, x1, y1, z1):
+    dx = x0 - x1
+    dy = y0 - y1
+    dz = z0 - z1
+    return dx * dx + dy * dy + dz * dz
+
+
+def within_tolerance(x, y, z, yaw, tgt_x, tgt_y, tgt_z, tgt_yaw, tol_distance, tol_heading_rad):
+    """ True if the pose (x, y, z, yaw) is within tol_distance (m) and tol_heading_rad of the target """
+    return distance_sq(x, y, z, tgt_x, tgt_y, tgt_z) < tol_distance * tol_distance and \
+        heading_error_rad(yaw, tgt_yaw) < tol_heading_rad
+
+
+class Waypoint_acceptance_batch(object):
+    """
+    Acceptance checks of one pose against many waypoints at once
+
+    targets: sequence of (x, y, z, yaw) waypoints
+    tol_distance, tol_heading_rad: tolerances - scalars or one per waypoint
+
+    The arrays returned by the methods are reused by the next call - copy them if they need to be kept.
+    """
+
+    def __init__(self, targets, tol_distance=0.2, tol_heading_rad=np.deg2rad(5)):
+        targets = np.array(targets, dtype=np.float64).reshape(-1, 4)
+        n = len(targets)
+        self.positions = np.ascontiguousarray(targets[:, :3])
+        self.yaws = targets[:, 3].copy()
+        self.tol_distance_sq = np.square(np.broadcast_to(np.asarray(tol_distance, dtype=np.float64), (n,)))
+        self.tol_heading_rad = np.broadcast_to(np.asarray(tol_heading_rad, dtype=np.float64), (n,)).copy()
+
+        # work arrays
+        self._pose = np.empty(3)
+        self._delta = np.empty((n, 3))
+        self._distance_sq = np.empty(n)
+        self._heading_error = np.empty(n)
+        self._heading_tmp = np.empty(n)
+        self._reached = np.empty(n, dtype=bool)
+        self._heading_ok = np.empty(n, dtype=bool)
+
+    def __len__(self):
+        return len(self.yaws)
+
+    def distance_sq(self, x, y, z):
+        """ squared distance from (x, y, z) to each waypoint """
+        pose = self._pose
+        pose[0], pose[1], pose[2] = x, y, z
+        delta = self._delta
+        np.subtract(self.positions, pose, out=delta)
+        np.multiply(delta, delta, out=delta)
+        return np.sum(delta, axis=1, out=self._distance_sq)
+
+    def heading_error(self, yaw):
+        """ heading error (rad, in [0, pi]) from yaw to each waypoint's yaw """
+        error = self._heading_error
+        np.subtract(self.yaws, yaw, out=error)
+        np.abs(error, out=error)
+        np.mod(error, TWO_PI, out=error)
+        np.subtract(TWO_PI, error, out=self._heading_tmp)
+        return np.minimum(error, self._heading_tmp, out=error)
+
+    def reached(self, x, y, z, yaw):
+        """ boolean array, True for each waypoint that the pose is within tolerance of """
+        reached = np.less(self.distance_sq(x, y, z), self.tol_distance_sq, out=self._reached)
+        np.less(self.heading_error(yaw), self.tol_heading_rad, out=self._heading_ok)
+        return np.logical_and(reached, self._heading_ok, out=reached)
+
+    def first_reached(self, x, y, z, yaw):
+        """ index of the first waypoint that the pose is within tolerance of, -1 if there isn't one """
+        reached = self.reached(x, y, z, yaw)
+        if not len(reached):
+            return -1
+        idx = int(reached.argmax())
+        return idx if reached[idx] else -1
+
+    def nearest(self, x, y, z):
+        """ index of the waypoint closest to (x, y, z) """
+        return int(self.distance_sq(x, y, z).argmin())